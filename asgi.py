@@ -0,0 +1,3 @@
+from src.flaskov.asgi import create_asgi_app
+
+app = create_asgi_app()
@@ -0,0 +1,42 @@
+"""initial schema
+
+Revision ID: 1a2f6c0d9e31
+Revises: 
+Create Date: 2020-08-14 10:12:41.204118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a2f6c0d9e31'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=80), nullable=False),
+    sa.Column('email', sa.String(length=200), nullable=False),
+    sa.Column('password', sa.String(length=200), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('markov_model',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('model_name', sa.String(length=200), nullable=False),
+    sa.Column('model_size', sa.String(length=200), nullable=False),
+    sa.Column('model_order', sa.Integer(), nullable=False),
+    sa.Column('model_serialized', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('model_name')
+    )
+
+
+def downgrade():
+    op.drop_table('markov_model')
+    op.drop_table('user')
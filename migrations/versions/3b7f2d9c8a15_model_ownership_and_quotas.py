@@ -0,0 +1,45 @@
+"""add model owners and per-user storage counters
+
+Revision ID: 3b7f2d9c8a15
+Revises: 9d41e07b2c6a
+Create Date: 2020-10-03 11:26:41.904127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7f2d9c8a15'
+down_revision = '9d41e07b2c6a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('model_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('stored_states', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('stored_bytes', sa.Integer(), nullable=False, server_default='0'))
+
+    with op.batch_alter_table('markov_model', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('model_bytes', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('owner_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_markov_model_owner_id'), ['owner_id'], unique=False)
+        batch_op.create_foreign_key('fk_markov_model_owner_id_user', 'user', ['owner_id'], ['id'])
+
+    # existing models have no owner, so only their sizes need filling in
+    op.execute("UPDATE markov_model SET model_bytes = length(model_serialized)")
+
+
+def downgrade():
+    with op.batch_alter_table('markov_model', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_markov_model_owner_id_user', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_markov_model_owner_id'))
+        batch_op.drop_column('owner_id')
+        batch_op.drop_column('model_bytes')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('stored_bytes')
+        batch_op.drop_column('stored_states')
+        batch_op.drop_column('model_count')
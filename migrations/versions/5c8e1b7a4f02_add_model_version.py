@@ -0,0 +1,26 @@
+"""add model_version to markov_model
+
+Revision ID: 5c8e1b7a4f02
+Revises: 1a2f6c0d9e31
+Create Date: 2020-09-02 18:40:07.551932
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c8e1b7a4f02'
+down_revision = '1a2f6c0d9e31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('markov_model', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('model_version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('markov_model', schema=None) as batch_op:
+        batch_op.drop_column('model_version')
@@ -0,0 +1,36 @@
+"""add per-model usage counters
+
+Revision ID: 7e3a9f1c2b84
+Revises: 3b7f2d9c8a15
+Create Date: 2020-10-10 16:02:17.318524
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e3a9f1c2b84'
+down_revision = '3b7f2d9c8a15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('model_usage',
+        sa.Column('model_id', sa.Integer(), nullable=False),
+        sa.Column('request_count', sa.Integer(), nullable=False),
+        sa.Column('sentence_count', sa.Integer(), nullable=False),
+        sa.Column('last_access', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['model_id'], ['markov_model.id'], ),
+        sa.PrimaryKeyConstraint('model_id')
+    )
+    with op.batch_alter_table('model_usage', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_model_usage_last_access'), ['last_access'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('model_usage', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_model_usage_last_access'))
+
+    op.drop_table('model_usage')
@@ -0,0 +1,78 @@
+"""store model_serialized in the binary model format
+
+Revision ID: 9d41e07b2c6a
+Revises: 5c8e1b7a4f02
+Create Date: 2020-09-19 14:03:52.318804
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+from src.flaskov import codec
+
+
+# revision identifiers, used by Alembic.
+revision = '9d41e07b2c6a'
+down_revision = '5c8e1b7a4f02'
+branch_labels = None
+depends_on = None
+
+markov_model = sa.table('markov_model',
+    sa.column('id', sa.Integer()),
+    sa.column('model_serialized', sa.LargeBinary()),
+)
+
+
+def upgrade():
+    with op.batch_alter_table('markov_model', schema=None) as batch_op:
+        batch_op.alter_column('model_serialized',
+               existing_type=sa.String(),
+               type_=sa.LargeBinary(),
+               existing_nullable=False)
+
+    # re-encode existing JSON rows one at a time
+    connection = op.get_bind()
+    for model_id, serialized in _rows(connection, markov_model):
+        if codec.is_binary(serialized):
+            continue
+        if isinstance(serialized, bytes):
+            serialized = serialized.decode('utf-8')
+        model = {tuple(state): follows for state, follows in json.loads(serialized)}
+        connection.execute(markov_model.update()
+            .where(markov_model.c.id == model_id)
+            .values(model_serialized=codec.encode(model)))
+
+
+def downgrade():
+    # rewrite rows as JSON text one at a time, before the batch
+    # copy casts the column to text
+    string_table = sa.table('markov_model',
+        sa.column('id', sa.Integer()),
+        sa.column('model_serialized', sa.String()),
+    )
+    connection = op.get_bind()
+    for model_id, serialized in _rows(connection, markov_model):
+        if not codec.is_binary(serialized):
+            continue
+        model = codec.decode(serialized)
+        connection.execute(string_table.update()
+            .where(string_table.c.id == model_id)
+            .values(model_serialized=json.dumps(list(model.items()))))
+
+    with op.batch_alter_table('markov_model', schema=None) as batch_op:
+        batch_op.alter_column('model_serialized',
+               existing_type=sa.LargeBinary(),
+               type_=sa.String(),
+               existing_nullable=False)
+
+
+def _rows(connection, table):
+    """yields: (id, model_serialized), fetching one blob at a time"""
+    ids = [model_id for (model_id,) in connection.execute(
+        sa.select([table.c.id]).order_by(table.c.id))]
+    for model_id in ids:
+        yield connection.execute(
+            sa.select([table.c.id, table.c.model_serialized])
+            .where(table.c.id == model_id)).first()
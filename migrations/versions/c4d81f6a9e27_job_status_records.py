@@ -0,0 +1,38 @@
+"""store background job status
+
+Revision ID: c4d81f6a9e27
+Revises: 7e3a9f1c2b84
+Create Date: 2020-10-12 11:24:53.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d81f6a9e27'
+down_revision = '7e3a9f1c2b84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_record',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('progress', sa.JSON(), nullable=False),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created', sa.Float(), nullable=False),
+        sa.Column('finished', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('job_record', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_job_record_created'), ['created'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('job_record', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_job_record_created'))
+
+    op.drop_table('job_record')
@@ -0,0 +1,28 @@
+"""store whether a model backs off to lower orders
+
+Revision ID: e5b92a7d3c10
+Revises: c4d81f6a9e27
+Create Date: 2020-10-13 16:02:37.918254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b92a7d3c10'
+down_revision = 'c4d81f6a9e27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # rows that stored their lower-order states are recognised
+    # by them when deserialized (see `MarkovModel.deserialize()`)
+    with op.batch_alter_table('markov_model', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('model_backoff', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('markov_model', schema=None) as batch_op:
+        batch_op.drop_column('model_backoff')
@@ -0,0 +1,293 @@
+"""
+Benchmarks for building, serializing, loading and sampling
+markov models.
+
+Usage:
+    python -m src.benchmarks.bench_models [--sizes 10K,1M] [--orders 1,2]
+        [--output run.json] [--compare baseline.json]
+
+Synthetic corpora are generated from a fixed seed, so two runs
+with the same arguments measure exactly the same work. Results
+are printed as a table and optionally written as JSON; passing
+`--compare` flags metrics that got slower than a previous run.
+"""
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from ..flaskov.models import MarkovModel
+from ..flaskov.rng import make_rng
+from ..flaskov.tokenizer import get_tokenizer
+
+
+###############################################################
+# Synthetic Corpora                                           #
+###############################################################
+
+SIZES = {"10K": 10 * 1024, "100K": 100 * 1024, "1M": 1024 ** 2,
+         "10M": 10 * 1024 ** 2, "100M": 100 * 1024 ** 2}
+VOCABULARY_SIZE = 5000
+SEED = 598
+
+
+def synthetic_corpus(size, seed=SEED):
+    """
+    Generates roughly `size` bytes of text with a Zipf-like word
+    distribution and sentences of 5-25 words, delimited by '. '
+
+    returns:
+        - string
+    """
+    rng = random.Random(seed)
+    vocabulary = ["w{}".format(i) for i in range(VOCABULARY_SIZE)]
+    weights = [1 / (rank + 1) for rank in range(VOCABULARY_SIZE)]
+    sentences = []
+    written = 0
+    while written < size:
+        words = rng.choices(vocabulary, weights, k=rng.randint(5, 25))
+        sentence = ' '.join(words)
+        sentences.append(sentence)
+        written += len(sentence) + 2
+    return '. '.join(sentences)
+
+
+###############################################################
+# Measurements                                                #
+###############################################################
+
+def timed(function, *args):
+    """returns: (result, seconds)"""
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def percentiles(samples):
+    """
+    returns:
+        - dict of p50/p90/p99/max latencies in milliseconds
+    """
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "p50_ms": pick(0.50) * 1e3,
+        "p90_ms": pick(0.90) * 1e3,
+        "p99_ms": pick(0.99) * 1e3,
+        "max_ms": ordered[-1] * 1e3,
+    }
+
+
+def peak_memory(function, *args):
+    """returns: peak bytes allocated by python while running function"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_case(corpus, order, sentences, measure_memory=True, seed=SEED):
+    """
+    Benchmarks one (corpus, order) pair. Generation draws from
+    streams seeded with `seed`, so runs produce the same sentences.
+
+    returns:
+        - dict of metrics
+    """
+    words = sum(map(len, get_tokenizer().sentences(corpus)))
+    result = {"bytes": len(corpus), "words": words, "order": order}
+    result["tokenize"] = bench_tokenize(corpus)
+
+    model, seconds = timed(lambda: MarkovModel(corpus=corpus, order=order))
+    result["build"] = {"seconds": seconds, "words_per_s": words / seconds}
+    result["states"] = len(model.model)
+
+    # per-call latency of add_sentence on an already built model
+    sample = [s.split() for s in corpus.split('. ', 200)[:200]]
+    latencies = [timed(model.add_sentence, s)[1] for s in sample]
+    result["add_sentence"] = percentiles(latencies)
+
+    _, seconds = timed(model.serialize)
+    result["serialize"] = {
+        "seconds": seconds, "serialized_bytes": len(model.model_serialized)}
+    _, seconds = timed(model.deserialize)
+    result["deserialize"] = {"seconds": seconds}
+
+    # "mapped" needs a stored model, it is the "arrays" compile
+    # plus a file write
+    for engine in ("compiled", "arrays"):
+        _, seconds = timed(model.compile, engine)
+        result["compile_" + engine] = {"seconds": seconds}
+
+    result["generate"] = bench_generate(model, sentences, seed)
+    result["generate_arrays"] = bench_generate_batch(model, sentences, seed)
+
+    if measure_memory:
+        result["peak_memory_bytes"] = peak_memory(
+            lambda: MarkovModel(corpus=corpus, order=order).serialize())
+    return result
+
+
+def bench_tokenize(corpus):
+    """
+    Throughput of splitting the corpus into sentences of words
+    with the default tokenizer and with each option, in MB/s
+    """
+    megabytes = len(corpus.encode('utf-8')) / 1024 ** 2
+    tokenizers = {
+        "mb_per_s": get_tokenizer(),
+        "legacy_mb_per_s": get_tokenizer("legacy"),
+        "lowercase_mb_per_s": get_tokenizer(lowercase=True),
+        "punctuation_mb_per_s": get_tokenizer(punctuation=True),
+    }
+    metrics = {}
+    for name, tokenizer in tokenizers.items():
+        _, seconds = timed(lambda: sum(1 for _ in tokenizer.sentences(corpus)))
+        metrics[name] = megabytes / seconds
+    return metrics
+
+
+def bench_generate(model, sentences, seed=SEED):
+    """Latency of generating single sentences from a loaded model"""
+    chain = model.load()
+    rng = make_rng(seed)
+    latencies = []
+    try:
+        for _ in range(sentences):
+            latencies.append(timed(model._walk, chain, rng)[1])
+    except KeyError as error:
+        return {"error": "state {} missing from chain".format(error)}
+    metrics = percentiles(latencies)
+    metrics["sentences_per_s"] = len(latencies) / sum(latencies)
+    return metrics
+
+
+def bench_generate_batch(model, sentences, seed=SEED):
+    """Throughput of the vectorized engine for one batch"""
+    chain = model.load("arrays")
+    _, seconds = timed(chain.generate_batch, sentences, seed)
+    return {"seconds": seconds, "sentences_per_s": sentences / seconds}
+
+
+###############################################################
+# Reporting                                                   #
+###############################################################
+
+HEADLINE = [
+    ("tokenize", "mb_per_s", True),
+    ("build", "words_per_s", True),
+    ("serialize", "seconds", False),
+    ("deserialize", "seconds", False),
+    ("compile_compiled", "seconds", False),
+    ("generate", "p50_ms", False),
+    ("generate", "sentences_per_s", True),
+    ("generate_arrays", "sentences_per_s", True),
+    ("peak_memory_bytes", None, False),
+]
+
+
+def metric(case, name, field):
+    value = case.get(name)
+    if field is not None:
+        value = value.get(field) if isinstance(value, dict) else None
+    return value
+
+
+def print_table(results):
+    header = ["case"] + [
+        name if field is None else "{}.{}".format(name, field)
+        for name, field, _ in HEADLINE]
+    print("\t".join(header))
+    for key, case in results["cases"].items():
+        row = [key]
+        for name, field, _ in HEADLINE:
+            value = metric(case, name, field)
+            row.append("-" if value is None else "{:.4g}".format(value))
+        print("\t".join(row))
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares headline metrics against a previous run
+
+    returns:
+        - list of regression descriptions (empty if none)
+    """
+    regressions = []
+    for key, case in results["cases"].items():
+        before = baseline["cases"].get(key)
+        if not before:
+            continue
+        for name, field, higher_is_better in HEADLINE:
+            new, old = metric(case, name, field), metric(before, name, field)
+            if not new or not old:
+                continue
+            change = (old - new) / old if higher_is_better else (new - old) / old
+            if change > threshold:
+                regressions.append("{} {}{}: {:.4g} -> {:.4g} ({:+.0%})".format(
+                    key, name, "." + field if field else "", old, new,
+                    -change if higher_is_better else change))
+    return regressions
+
+
+###############################################################
+# Main                                                        #
+###############################################################
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10K,100K,1M,10M,100M",
+        help="comma separated corpus sizes from {}".format(", ".join(SIZES)))
+    parser.add_argument("--orders", default="1,2,3")
+    parser.add_argument("--sentences", type=int, default=1000,
+        help="sentences generated per case")
+    parser.add_argument("--seed", type=int, default=SEED,
+        help="seed of the corpora and of generation")
+    parser.add_argument("--no-memory", action="store_true",
+        help="skip the (slower) tracemalloc peak memory pass")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument("--threshold", type=float, default=0.10,
+        help="relative slowdown reported as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "cases": {},
+    }
+    for size in args.sizes.split(','):
+        corpus = synthetic_corpus(SIZES[size], args.seed)
+        for order in map(int, args.orders.split(',')):
+            key = "{}/order{}".format(size, order)
+            print("running", key, file=sys.stderr)
+            results["cases"][key] = bench_case(
+                corpus, order, args.sentences, not args.no_memory, args.seed)
+
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as previous:
+            regressions = compare(results, json.load(previous), args.threshold)
+        for regression in regressions:
+            print("REGRESSION", regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,12 +6,25 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
 
+from .cache import ModelCache
+from .instrumentation import Metrics
+from .jobs import JobQueue
+from .responses import ResponseCache
+from .usage import UsageTracker
+from .warmup import Preloader
+
 csrf = CSRFProtect()
 
 db = SQLAlchemy()
 login_manager = LoginManager()
 migrate = Migrate()
 csrf = CSRFProtect()
+model_cache = ModelCache()
+job_queue = JobQueue()
+response_cache = ResponseCache()
+metrics = Metrics()
+preloader = Preloader()
+usage_tracker = UsageTracker()
 
 def create_app(test_config=None):
     # create, configure, and db
@@ -20,19 +33,33 @@ def create_app(test_config=None):
         app.config.from_object(test_config)
     else:
         app.config.from_object(DefaultConfig())
+    app.config.setdefault('MAX_SENTENCES_PER_REQUEST', 100)
+    app.config.setdefault('MAX_STREAMED_SENTENCES', 10000)
+    app.config.setdefault('SENTENCE_ENGINE', "compiled")
+    app.config.setdefault('MODELS_PER_PAGE', 20)
+    app.config.setdefault('MAX_MODELS_PER_PAGE', 100)
+    for quota in ('USER_QUOTA_MODELS', 'USER_QUOTA_STATES', 'USER_QUOTA_BYTES'):
+        app.config.setdefault(quota, None)
 
     # initialize plugins
     db.app = app
     db.init_app(app)
     login_manager.init_app(app)
-    migrate.init_app(app, db)
+    migrate.init_app(app, db, render_as_batch=True)
     csrf.init_app(app)
+    model_cache.init_app(app)
+    job_queue.init_app(app)
+    metrics.init_app(app)
+    usage_tracker.init_app(app)
 
     # ensure the instance folder exists
     try:
         os.makedirs(app.instance_path)
     except OSError:
         pass
+    response_cache.init_app(app)
+    app.config.setdefault(
+        'MODEL_FILES_DIR', os.path.join(app.instance_path, 'models'))
 
     # register blueprints for routes
     from src.flaskov.routes import main, auth, markov
@@ -40,10 +67,20 @@ def create_app(test_config=None):
     app.register_blueprint(auth)
     app.register_blueprint(markov)
 
+    # register CLI commands
+    from src.flaskov.commands import (
+        build_model_command, compact_model_command, export_model_command)
+    app.cli.add_command(build_model_command)
+    app.cli.add_command(compact_model_command)
+    app.cli.add_command(export_model_command)
+
     # from src.flaskov.models import User, MarkovModel
     # db.create_all()
     app.config['TRAP_BAD_REQUEST_ERRORS'] = True
 
+    # load hot models last, once everything they need is set up
+    preloader.init_app(app)
+
     return app
 
 
@@ -51,6 +88,32 @@ class DefaultConfig:
     SECRET_KEY = 'dev'
     SQLALCHEMY_DATABASE_URI = "sqlite:///db.sqlite"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    MODEL_CACHE_MAX_ENTRIES = 32
+    MODEL_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    MAX_SENTENCES_PER_REQUEST = 100
+    MAX_STREAMED_SENTENCES = 10000
+    SENTENCE_ENGINE = "compiled"
+    CORPUS_SEGMENTATION = "sentences"
+    CORPUS_LOWERCASE = False
+    CORPUS_PUNCTUATION = False
+    MODEL_MIN_COUNT = 1
+    MODEL_TOP_K = None
+    MODEL_STORE = "dict"
+    MODELS_PER_PAGE = 20
+    MAX_MODELS_PER_PAGE = 100
+    USER_QUOTA_MODELS = 50
+    USER_QUOTA_STATES = 5000000
+    USER_QUOTA_BYTES = 64 * 1024 * 1024
+    JOB_WORKERS = 2
+    JOB_STORE = "database"
+    ASYNC_IO_WORKERS = 4
+    RESPONSE_CACHE_BACKEND = "memory"
+    RESPONSE_CACHE_TTL = 300
+    METRICS_SAMPLE_RATE = 0.1
+    PRELOAD_MODELS = []
+    PRELOAD_TOP_MODELS = 0
+    PRELOAD_BACKGROUND = False
+    USAGE_FLUSH_INTERVAL = 30
 
 
 class TestConfig:
@@ -61,4 +124,9 @@ class TestConfig:
     EMAIL = "JohnDoe@gmail.com"
     TESTING = True
     WTF_CSRF_ENABLED = False
+    JOB_WORKERS = 0
+    JOB_STORE = "database"
+    JOB_PROGRESS_INTERVAL = 0
+    METRICS_SAMPLE_RATE = 1.0
+    USAGE_FLUSH_INTERVAL = 0
     SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
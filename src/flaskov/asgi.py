@@ -0,0 +1,296 @@
+import asyncio
+import io
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from . import create_app, db, model_cache, response_cache, usage_tracker
+from .models import MarkovModel
+from .rng import make_rng
+
+
+###############################################################
+# Single Flight                                               #
+###############################################################
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one. The
+    first caller starts the call, everyone arriving while it is
+    in flight awaits the same result (or exception).
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def run(self, key, function):
+        """
+        `key`:
+            hashable identifying the call
+
+        `function`:
+            callable returning an awaitable, only called when no
+            call for `key` is in flight
+
+        returns:
+            - result of the shared call
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(function())
+            self._calls[key] = call
+            call.add_done_callback(lambda _: self._calls.pop(key, None))
+        # one caller giving up mustn't cancel the others' load
+        return await asyncio.shield(call)
+
+
+###############################################################
+# ASGI Sentence Server                                        #
+###############################################################
+
+class SentenceServer:
+    """
+    ASGI application serving `/generate_sentence` without
+    tying up a worker per request, and every other route through
+    the wrapped Flask app
+
+    Model lookups and blob loads run on a small thread pool (the
+    SQLite driver has no non-blocking API), so the event loop
+    never waits on the database. Concurrent requests for a model
+    that isn't cached yet share a single load (see
+    `SingleFlight`), and once the compiled model is in the
+    worker's `model_cache` sentences are generated inline on the
+    event loop.
+
+    Run with an ASGI server, e.g. `uvicorn asgi:app`.
+
+    Config:
+        - ASYNC_IO_WORKERS: threads used for database I/O
+    """
+    DEFAULT_IO_WORKERS = 4
+    ERROR_MESSAGE = "Oops! Looks like something went wrong."
+
+    def __init__(self, app):
+        app.config.setdefault('ASYNC_IO_WORKERS', self.DEFAULT_IO_WORKERS)
+        self.app = app
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config['ASYNC_IO_WORKERS'],
+            thread_name_prefix="flaskov-io")
+        self.loads = SingleFlight()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            raise ValueError("Unsupported ASGI scope {}".format(scope["type"]))
+
+        body = await read_body(receive)
+        if scope["method"] == "GET" and scope["path"] == "/generate_sentence":
+            values = request_values(scope, body)
+            # seeded requests go through Flask's response cache
+            if values.get("seed") is None or not response_cache.enabled:
+                response = await self.generate_sentence(
+                    values.get("model_name"), values.get("seed"))
+                return await send_json(send, response)
+        return await self.call_flask(scope, body, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def generate_sentence(self, model_name, seed=None):
+        """
+        Async version of the `markov.generate_sentence` route
+
+        returns:
+            - dict with `sentence`, or `error_message`
+        """
+        loop = asyncio.get_event_loop()
+        try:
+            row = await loop.run_in_executor(self.executor, self._find, model_name)
+            if row is None:
+                return {"error_message": self.ERROR_MESSAGE}
+
+            model_id, version, order = row
+            engine = self.app.config["SENTENCE_ENGINE"]
+            key = (model_id, model_name, engine)
+            chain = model_cache.peek(key, version)
+            if chain is None:
+                chain = await self.loads.run((key, version), lambda:
+                    loop.run_in_executor(
+                        self.executor, self._load, model_id, engine))
+        except Exception:
+            return {"error_message": self.ERROR_MESSAGE}
+
+        if not chain:
+            return {"sentence": MarkovModel.EMPTY_MODEL_ERROR}
+        sentence = MarkovModel.sentence(chain, order, make_rng(seed))
+        usage_tracker.record(model_name)
+        return {"sentence": sentence}
+
+    def _find(self, model_name):
+        """returns: (id, model_version, model_order) or None"""
+        with self.app.app_context():
+            return db.session.query(
+                MarkovModel.id, MarkovModel.model_version, MarkovModel.model_order,
+            ).filter_by(model_name=model_name).first()
+
+    def _load(self, model_id, engine):
+        """returns: the compiled model, loaded into `model_cache`"""
+        with self.app.app_context():
+            return MarkovModel.query.get(model_id).load(engine)
+
+    async def call_flask(self, scope, body, send):
+        """
+        Runs the Flask app for one request on the loop's default
+        pool. The response body is sent chunk by chunk as the app
+        produces it, so streamed responses stay streamed.
+        """
+        loop = asyncio.get_event_loop()
+        status, headers, chunks = await loop.run_in_executor(
+            None, start_wsgi, self.app, wsgi_environ(scope, body))
+        try:
+            await send({"type": "http.response.start", "status": status,
+                        "headers": headers})
+            while True:
+                chunk = await loop.run_in_executor(None, next, chunks, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk,
+                                "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            chunks.close()
+
+
+def create_asgi_app(test_config=None):
+    """returns: SentenceServer wrapping a new Flask app"""
+    return SentenceServer(create_app(test_config))
+
+
+###############################################################
+# Helper Functions                                            #
+###############################################################
+
+async def read_body(receive):
+    """returns: the full request body as bytes"""
+    body = bytearray()
+    more = True
+    while more:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+    return bytes(body)
+
+
+def request_values(scope, body):
+    """
+    Query string and url-encoded form values, like Flask's
+    `request.values` (query string first)
+
+    returns:
+        - dict
+    """
+    values = {}
+    pairs = parse_qsl(scope["query_string"].decode("latin-1"))
+    headers = dict(scope.get("headers", []))
+    if headers.get(b"content-type", b"").startswith(
+            b"application/x-www-form-urlencoded"):
+        pairs += parse_qsl(body.decode("utf-8"))
+    for name, value in pairs:
+        values.setdefault(name, value)
+    return values
+
+
+async def send_json(send, response, status=200):
+    body = json.dumps(response).encode("utf-8")
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"),
+        (b"cache-control", b"no-store"),
+        (b"content-length", str(len(body)).encode("latin-1")),
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def wsgi_environ(scope, body):
+    """returns: WSGI environ for an ASGI http `scope`"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        environ[name] = environ[name] + "," + value if name in environ else value
+    return environ
+
+
+def start_wsgi(app, environ):
+    """
+    Calls a WSGI app up to its first chunk of body (apps may
+    wait until then to call `start_response`)
+
+    returns:
+        - (status code, list of header pairs as bytes, generator
+        of the body chunks)
+    """
+    response = {}
+    written = []
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in headers]
+        return written.append
+
+    result = app(environ, start_response)
+    chunks = iter(result)
+    try:
+        first = next(chunks, b"")
+    except BaseException:
+        if hasattr(result, "close"):
+            result.close()
+        raise
+    return response["status"], response["headers"], _body(
+        written, first, chunks, result)
+
+
+def _body(written, first, chunks, result):
+    try:
+        yield from written
+        yield first
+        yield from chunks
+    finally:
+        if hasattr(result, "close"):
+            result.close()
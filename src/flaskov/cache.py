@@ -0,0 +1,138 @@
+import threading
+from collections import OrderedDict
+
+
+###############################################################
+# Model Cache                                                 #
+###############################################################
+
+class ModelCache:
+    """
+    Per-worker LRU cache of loaded (compiled) markov models
+
+    Entries are keyed by `(model_id, model_name)` and stamped
+    with the row's `model_version`. A lookup with a newer version
+    than the cached one counts as a miss and replaces the stale
+    entry, so rows rewritten by another worker are picked up on
+    the next request.
+
+    The cache is bounded both by number of entries and by an
+    approximate size in bytes (the caller supplies the size,
+    usually the `nbytes` of the compiled chain). Least recently
+    used entries are evicted first.
+
+    Config:
+        - MODEL_CACHE_MAX_ENTRIES
+        - MODEL_CACHE_MAX_BYTES
+    """
+    DEFAULT_MAX_ENTRIES = 32
+    DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, app=None):
+        self.max_entries = self.DEFAULT_MAX_ENTRIES
+        self.max_bytes = self.DEFAULT_MAX_BYTES
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MODEL_CACHE_MAX_ENTRIES', self.DEFAULT_MAX_ENTRIES)
+        app.config.setdefault('MODEL_CACHE_MAX_BYTES', self.DEFAULT_MAX_BYTES)
+        self.max_entries = app.config['MODEL_CACHE_MAX_ENTRIES']
+        self.max_bytes = app.config['MODEL_CACHE_MAX_BYTES']
+        app.extensions['model_cache'] = self
+        self.clear()
+
+    def get(self, key, version, loader, size=0):
+        """
+        Returns the cached value for `key` at `version`, calling
+        `loader()` and caching the result on a miss.
+
+        `key`:
+            hashable identifying the model, e.g. (id, name)
+
+        `version`:
+            version stamp of the model row. stale entries are
+            treated as misses.
+
+        `loader`:
+            callable returning the loaded model
+
+        `size`:
+            approximate size of the value in bytes, or a
+            callable taking the loaded value and returning it
+            (only called on a miss)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = loader()
+        self.put(key, version, value, size(value) if callable(size) else size)
+        return value
+
+    def peek(self, key, version):
+        """
+        Returns the cached value for `key` at `version`, or None.
+        Never loads, and isn't counted as a hit or miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+            return None
+
+    def put(self, key, version, value, size=0):
+        """Stores `value` under `key`, evicting LRU entries as needed"""
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes or self.max_entries <= 0:
+                return
+            self._entries[key] = (version, value, size)
+            self._bytes += size
+            while (len(self._entries) > self.max_entries
+                    or self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Drops the entry for `key`, if there is one"""
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        returns:
+            - dict of hit/miss/eviction counters and current usage
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
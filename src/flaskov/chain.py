@@ -0,0 +1,268 @@
+import bisect
+import random
+import sys
+from array import array
+from itertools import accumulate, chain
+
+
+###############################################################
+# Compiled Chains                                             #
+###############################################################
+
+def resolve(key, totals, order, min_count=1):
+    """
+    Finds the state to continue from after `key`
+
+    The candidate is the last `order` words of `key`. When that
+    state is missing, or has been seen fewer than `min_count`
+    times, shorter suffixes (lower-order backoff states) are tried
+    in turn. Models without backoff states only ever match the
+    full-order candidate.
+
+    `key`:
+        tuple of words: the current state plus the chosen word
+
+    `totals`:
+        dict mapping each state to the sum of its counts
+
+    returns:
+        - state tuple, or None when no suffix is a state
+    """
+    key = key[-order:]
+    fallback = None
+    for i in range(len(key)):
+        total = totals.get(key[i:])
+        if total is None:
+            continue
+        if total >= min_count:
+            return key[i:]
+        if fallback is None:
+            fallback = key[i:]
+    return fallback
+
+
+def lower_orders(model, order):
+    """
+    Derives the lower-order (backoff) states of a model
+
+    Sentences are padded with `order` START words, so every
+    transition of a full-order state was also seen from each of
+    its suffixes: the counts of a suffix are exactly the sums of
+    the counts of the full-order states ending with it. Only the
+    full-order states need to be counted and stored.
+
+    `model`:
+        dict of dicts. maps full-order state tuples to
+        {word: count}
+
+    returns:
+        - dict of dicts. maps each suffix of 1 to `order` - 1
+        words to its summed {word: count}
+    """
+    lower = {}
+    for state, follows in model.items():
+        for i in range(1, order):
+            counts = lower.get(state[i:])
+            if counts is None:
+                lower[state[i:]] = dict(follows)
+                continue
+            for word, count in follows.items():
+                counts[word] = counts.get(word, 0) + count
+    return lower
+
+
+def vocabulary_size(words):
+    """returns: approximate size in bytes of a list of words"""
+    return sys.getsizeof(words) + sum(map(sys.getsizeof, words))
+
+
+class CompiledChain:
+    """
+    Read-only form of a markov model, built for sampling
+
+    Words are interned once in `vocabulary` (with `sys.intern`,
+    so models resident in the same worker share their strings
+    too) and states are numbered rows. Everything else lives in
+    flat `array`s of machine integers rather than per-state dicts
+    or objects: the transitions of row `r` are the slice
+    `indptr[r]:indptr[r+1]` of
+
+        `successors`: word id of each transition
+        `cumulative`: running sum of the row's counts, so
+            choosing the next word is a single bisect
+        `next`: row reached by taking the transition, with the
+            rolling order-N window (including drops to
+            lower-order backoff states, see `resolve()`) baked
+            in. -1 where the sentence ends (or leads nowhere)
+
+    A walk through the chain never builds or hashes state tuples.
+    State tuples are only looked up to find the row a walk starts
+    from: the `start` row is found when compiling, any other
+    lookup builds an index of all states the first time.
+
+    `vocabulary`: list
+        word of each word id
+
+    `end`: int
+        word id of the sentinel ending a sentence, -1 if absent
+    """
+    __slots__ = ('vocabulary', 'indptr', 'successors', 'cumulative',
+                 'next', 'end', '_key_words', '_key_ends', '_rows',
+                 '_indexed')
+
+    def __init__(self, model, order=1, end="END", min_count=1, start="START",
+                 backoff=False):
+        """
+        `model`:
+            dict of dicts. maps state tuples to {word: count}
+
+        `order`:
+            number of words in full-order states
+
+        `end`:
+            sentinel word ending a sentence
+
+        `min_count`:
+            states seen fewer times than this back off to lower
+            order states, where the model has them
+
+        `start`:
+            sentinel word starting a sentence. the all-`start`
+            state is the usual start of a walk.
+
+        `backoff`:
+            if True, the lower-order states of `model` are derived
+            (see `lower_orders()`) and compiled after its own
+        """
+        states = model.items()
+        if backoff:
+            states = chain(states, lower_orders(model, order).items())
+
+        ids = {}
+        self.vocabulary = []
+        def intern(word):
+            word_id = ids.get(word)
+            if word_id is None:
+                word_id = ids[word] = len(self.vocabulary)
+                self.vocabulary.append(sys.intern(word))
+            return word_id
+
+        rows = {}
+        totals = {}
+        self.indptr = array('L', [0])
+        self.successors = array('L')
+        self.cumulative = array('Q')
+        self._key_words = array('L')
+        self._key_ends = array('L', [0])
+        for row, (state, follows) in enumerate(states):
+            rows[state] = row
+            self._key_words.extend(map(intern, state))
+            self._key_ends.append(len(self._key_words))
+            self.successors.extend(map(intern, follows))
+            self.cumulative.extend(accumulate(follows.values()))
+            self.indptr.append(len(self.successors))
+            totals[state] = self.cumulative[-1]
+
+        self.end = ids.get(end, -1)
+        self.next = array('l', (
+            -1 if word_id == self.end else
+            rows.get(resolve(
+                state + (self.vocabulary[word_id],), totals, order, min_count), -1)
+            for state, row in rows.items()
+            for word_id in self.successors[self.indptr[row]:self.indptr[row + 1]]))
+
+        start = (start,) * order
+        self._rows = {start: rows[start]} if start in rows else {}
+        self._indexed = False
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @property
+    def nbytes(self):
+        """
+        Approximate size of the chain in bytes: the arrays, the
+        vocabulary and, once built, the index of states
+        """
+        arrays = (self.indptr, self.successors, self.cumulative, self.next,
+                  self._key_words, self._key_ends)
+        size = sum(len(values) * values.itemsize for values in arrays)
+        size += vocabulary_size(self.vocabulary)
+        if self._indexed:
+            size += sys.getsizeof(self._rows) + sum(
+                map(sys.getsizeof, self._rows))
+        return size
+
+    def __contains__(self, state):
+        try:
+            self._row(state)
+        except KeyError:
+            return False
+        return True
+
+    def _row(self, state):
+        """returns: the row of `state`, raises KeyError if missing"""
+        row = self._rows.get(state)
+        if row is None:
+            if not self._indexed:
+                self._build_index()
+            row = self._rows[state]
+        return row
+
+    def _build_index(self):
+        words, ends, vocabulary = self._key_words, self._key_ends, self.vocabulary
+        self._rows = {
+            tuple(vocabulary[i] for i in words[ends[row]:ends[row + 1]]): row
+            for row in range(len(self))}
+        self._indexed = True
+
+    def _pick(self, row, rng):
+        """returns: index of a transition of `row`, weighted by count"""
+        last = self.indptr[row + 1] - 1
+        return bisect.bisect_right(
+            self.cumulative, rng.random() * self.cumulative[last],
+            self.indptr[row], last)
+
+    def choose(self, state, rng=random):
+        """
+        Picks the word following `state`, weighted by count
+
+        `state`:
+            tuple of words. must be a state of the chain.
+
+        `rng`:
+            object with a `random()` method, defaults to the
+            `random` module
+
+        returns:
+            - string
+        """
+        index = self._pick(self._row(state), rng)
+        return self.vocabulary[self.successors[index]]
+
+    def walk(self, start, rng=random):
+        """
+        Follows the chain from `start` until a sentence ends
+
+        `start`:
+            tuple of words. the state to start from.
+
+        returns:
+            - list of words (without start/end sentinels)
+        """
+        indptr, successors, cumulative, next_rows = (
+            self.indptr, self.successors, self.cumulative, self.next)
+        vocabulary, end, draw = self.vocabulary, self.end, rng.random
+        bisect_right = bisect.bisect_right
+        words = []
+        row = self._row(start)
+        while row >= 0:
+            last = indptr[row + 1] - 1
+            index = bisect_right(
+                cumulative, draw() * cumulative[last], indptr[row], last)
+            word = successors[index]
+            if word == end:
+                break
+            words.append(vocabulary[word])
+            row = next_rows[index]
+        return words
@@ -0,0 +1,182 @@
+import lzma
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate, islice, repeat
+from operator import sub
+
+
+###############################################################
+# Binary Model Format                                         #
+###############################################################
+#
+# Layout (all integers little-endian):
+#
+#   header      MAGIC, format version, compression, payload size
+#   payload     (optionally compressed)
+#       counts          n_words, n_states, n_transitions
+#       string table    uint32 length (in characters) per word,
+#                       then the words back to back, utf-8
+#       state lengths   uint8  per state (words in each state)
+#       state keys      uint32 word ids, all states back to back
+#       indptr          uint32 per state + 1, offsets into the
+#                       transition arrays
+#       successors      uint32 word id per transition
+#       counts          uint32 count per transition
+#
+# Version 1 joined the string table with '\n', which lost words
+# containing one. It is still read, never written.
+
+MAGIC = b'FKVM'
+VERSION = 2
+VERSIONS = (1, 2)
+HEADER = struct.Struct('<4sBBI')
+COUNTS = struct.Struct('<III')
+
+COMPRESSORS = {
+    None: (0, lambda data: data, lambda data: data),
+    "zlib": (1, zlib.compress, zlib.decompress),
+    "lzma": (2, lzma.compress, lzma.decompress),
+}
+DECOMPRESSORS = {
+    flag: decompress for flag, _, decompress in COMPRESSORS.values()
+}
+
+
+class FormatError(ValueError):
+    """Raised when a blob isn't a model in a known format"""
+
+
+def is_binary(data):
+    """True if `data` starts with the binary model header"""
+    return isinstance(data, (bytes, bytearray, memoryview)) and \
+        bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def encode(model, compression="zlib"):
+    """
+    Packs a model dict into the binary format
+
+    `model`:
+        dict of dicts. maps state tuples to {word: count}
+
+    `compression`:
+        None, "zlib" or "lzma"
+
+    returns:
+        - bytes
+    """
+    vocab = {}
+    state_lengths = array('B')
+    state_keys = array('I')
+    indptr = array('I', [0])
+    successors = array('I')
+    counts = array('I')
+    for state, follows in model.items():
+        state_lengths.append(len(state))
+        state_keys.extend(vocab.setdefault(w, len(vocab)) for w in state)
+        successors.extend(vocab.setdefault(w, len(vocab)) for w in follows)
+        counts.extend(follows.values())
+        indptr.append(len(successors))
+
+    word_lengths = array('I', map(len, vocab))
+    strings = ''.join(vocab).encode('utf-8')
+    payload = [
+        COUNTS.pack(len(vocab), len(model), len(successors)),
+        struct.pack('<I', len(strings)),
+        _little_endian(word_lengths),
+        strings,
+        state_lengths.tobytes(),
+    ]
+    payload.extend(map(_little_endian,
+                       (state_keys, indptr, successors, counts)))
+    payload = b''.join(payload)
+
+    flag, compress, _ = COMPRESSORS[compression]
+    return HEADER.pack(MAGIC, VERSION, flag, len(payload)) + compress(payload)
+
+
+def decode(data, into=None):
+    """
+    Unpacks a binary model into a model dict
+
+    `into`:
+        optional empty mapping to fill instead of a new dict
+        (e.g. an `ngrams.NgramStore`)
+
+    returns:
+        - dict of dicts. maps state tuples to {word: count}
+    """
+    version, payload = _payload(data)
+    n_words, n_states, n_transitions = COUNTS.unpack_from(payload, 0)
+    offset = COUNTS.size
+    (strings_size,) = struct.unpack_from('<I', payload, offset)
+    offset += 4
+    if version == 1:
+        words = payload[offset:offset + strings_size].decode('utf-8').split('\n')
+    else:
+        word_lengths = array('I', payload[offset:offset + 4 * n_words])
+        if sys.byteorder == 'big':
+            word_lengths.byteswap()
+        offset += 4 * n_words
+        # one decode for the whole table, then C-level slicing
+        strings = payload[offset:offset + strings_size].decode('utf-8')
+        stops = list(accumulate(word_lengths))
+        words = map(strings.__getitem__,
+                    map(slice, [0] + stops[:-1], stops))
+    words = list(map(sys.intern, words))
+    offset += strings_size
+
+    state_lengths = array('B', payload[offset:offset + n_states])
+    offset += n_states
+    columns = []
+    for size in (sum(state_lengths), n_states + 1, n_transitions, n_transitions):
+        column = array('I', payload[offset:offset + 4 * size])
+        if sys.byteorder == 'big':
+            column.byteswap()
+        columns.append(column)
+        offset += 4 * size
+    state_keys, indptr, successors, counts = columns
+
+    # Everything below runs in C-level iterators: dicts of each
+    # state are sliced in turn off one shared (word, count) stream
+    key_words = [words[i] for i in state_keys]
+    if n_states and min(state_lengths) == max(state_lengths):
+        length = state_lengths[0]
+        keys = zip(*[key_words[i::length] for i in range(length)])
+    else:
+        key_iter = iter(key_words)
+        keys = (tuple(islice(key_iter, n)) for n in state_lengths)
+    transitions = zip([words[i] for i in successors], counts.tolist())
+    sizes = map(sub, indptr[1:], indptr[:-1])
+    states = zip(keys, map(dict, map(islice, repeat(transitions), sizes)))
+    if into is None:
+        return dict(states)
+    into.update(states)
+    return into
+
+
+def payload_size(data):
+    """Size in bytes of the uncompressed payload of `data`"""
+    return HEADER.unpack_from(data, 0)[3]
+
+
+def _little_endian(column):
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column.tobytes()
+
+
+def _payload(data):
+    if not is_binary(data):
+        raise FormatError("Not a binary markov model")
+    _, version, flag, size = HEADER.unpack_from(data, 0)
+    if version not in VERSIONS or flag not in DECOMPRESSORS:
+        raise FormatError(
+            "Unsupported model format (version {}, compression {})".format(
+                version, flag))
+    payload = DECOMPRESSORS[flag](bytes(data[HEADER.size:]))
+    if len(payload) != size:
+        raise FormatError("Truncated model payload")
+    return version, payload
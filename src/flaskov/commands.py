@@ -0,0 +1,150 @@
+import os
+import pathlib
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.orm.exc import StaleDataError
+
+from . import db, tokenizer as tokenizers
+from .models import MarkovModel, User
+from .training import SHARD_SIZE, train
+
+
+###############################################################
+# CLI Commands                                                #
+###############################################################
+
+@click.command("build-model")
+@click.argument("corpus_path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--name", required=True, help="Name of the new model")
+@click.option("--order", default=1, type=click.IntRange(1, 3), show_default=True)
+@click.option("--workers", default=None, type=click.IntRange(1),
+    help="Worker processes [default: number of CPUs]")
+@click.option("--backoff", is_flag=True,
+    help="Back off to lower orders where states are sparse")
+@click.option("--shard-size", default=SHARD_SIZE, type=click.IntRange(1),
+    show_default=True, help="Sentences counted per task")
+@click.option("--owner", default=None, help="Username owning the model")
+@click.option("--segmentation", default=None,
+    type=click.Choice(tokenizers.SEGMENTATIONS),
+    help="How sentences are split [default: CORPUS_SEGMENTATION]")
+@click.option("--min-count", default=None, type=click.IntRange(1),
+    help="Drop transitions seen fewer times [default: MODEL_MIN_COUNT]")
+@click.option("--top-k", default=None, type=click.IntRange(1),
+    help="Keep at most this many successors per state [default: MODEL_TOP_K]")
+@click.option("--store", default=None, type=click.Choice(MarkovModel.STORES),
+    help="Store the counts are merged into [default: MODEL_STORE]")
+@with_appcontext
+def build_model_command(corpus_path, name, order, workers, backoff, shard_size,
+                        owner, segmentation, min_count, top_k, store):
+    """Build a model from a corpus file using a pool of processes"""
+    if MarkovModel.name_taken(name):
+        raise click.ClickException("That Model name is taken. Try another!")
+    if owner is not None:
+        owner = User.query.filter_by(username=owner).first()
+        if owner is None:
+            raise click.ClickException("There's no user with that name!")
+
+    tokenizer = tokenizers.from_config(current_app.config)
+    if segmentation is not None:
+        tokenizer = tokenizers.get_tokenizer(
+            segmentation, tokenizer.lowercase, tokenizer.punctuation)
+
+    counts, stats = train(
+        pathlib.Path(corpus_path), order=order, workers=workers,
+        shard_size=shard_size, tokenizer=tokenizer, store=store)
+
+    model = MarkovModel(model=counts, order=order, name=name, backoff=backoff,
+                        store=store)
+    model._compute_size()
+    compaction = MarkovModel.build_compaction() or {}
+    if min_count is not None:
+        compaction["min_count"] = min_count
+    if top_k is not None:
+        compaction["top_k"] = top_k
+    if compaction:
+        echo_compaction(model.compact(**compaction))
+    error_message = owner and owner.quota_error(
+        models=1, states=model.stored_states, nbytes=model.model_bytes)
+    if error_message:
+        raise click.ClickException(error_message)
+    model.owner = owner
+    db.session.add(model)
+    db.session.commit()
+    model.export_if_mapped()
+
+    seconds = max(stats["seconds"], 1e-9)
+    click.echo(
+        "Built '{}': {} states from {} sentences / {} words "
+        "in {:.2f}s ({:,.0f} words/s)".format(
+            name, model.model_size, stats["sentences"], stats["words"],
+            seconds, stats["words"] / seconds))
+
+
+@click.command("export-model")
+@click.argument("name")
+@click.option("--directory", default=None, type=click.Path(file_okay=False),
+    help="Where to write the file [default: MODEL_FILES_DIR]")
+@with_appcontext
+def export_model_command(name, directory):
+    """Write a model to a file that workers can share with mmap"""
+    model = MarkovModel.query.filter_by(model_name=name).first()
+    if model is None:
+        raise click.ClickException("No model named '{}'".format(name))
+
+    path = model.export(directory)
+    click.echo("Exported '{}' (version {}) to {} ({:,} bytes)".format(
+        name, model.model_version, path, os.path.getsize(path)))
+
+
+@click.command("compact-model")
+@click.argument("names", nargs=-1)
+@click.option("--all", "compact_all", is_flag=True, help="Compact every model")
+@click.option("--min-count", default=2, type=click.IntRange(1), show_default=True,
+    help="Drop transitions seen fewer times")
+@click.option("--top-k", default=None, type=click.IntRange(1),
+    help="Keep at most this many successors per state")
+@click.option("--dry-run", is_flag=True, help="Report without saving")
+@with_appcontext
+def compact_model_command(names, compact_all, min_count, top_k, dry_run):
+    """Prune rare transitions and unreachable states of stored models"""
+    if compact_all:
+        models = MarkovModel.query.order_by(MarkovModel.id)
+    elif names:
+        models = MarkovModel.query.filter(MarkovModel.model_name.in_(names))
+    else:
+        raise click.UsageError("Give model names or --all")
+
+    saved = 0
+    # ids first, so each model's blob is only held while it's compacted
+    for (model_id,) in models.with_entities(MarkovModel.id).all():
+        model = MarkovModel.query.get(model_id)
+        model.deserialize()
+        report = model.compact(min_count, top_k)
+        click.echo("'{}': ".format(model.model_name), nl=False)
+        echo_compaction(report)
+        if dry_run:
+            db.session.rollback()
+        else:
+            try:
+                db.session.commit()
+            except StaleDataError:
+                db.session.rollback()
+                click.echo("'{}' changed meanwhile, skipped".format(
+                    model.model_name))
+                report["bytes_saved"] = 0
+            else:
+                model.export_if_mapped()
+        saved += report["bytes_saved"]
+        db.session.expunge_all()
+    click.echo("{} {:,} bytes in total".format(
+        "Would save" if dry_run else "Saved", saved))
+
+
+def echo_compaction(report):
+    click.echo(
+        "compacted {states_before:,} -> {states_after:,} states, "
+        "{transitions_before:,} -> {transitions_after:,} transitions, "
+        "{bytes_before:,} -> {bytes_after:,} bytes "
+        "({bytes_saved:,} saved)".format(**report))
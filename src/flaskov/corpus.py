@@ -0,0 +1,43 @@
+import codecs
+import os
+
+
+###############################################################
+# Corpus Streaming                                            #
+###############################################################
+
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_chunks(source, chunk_size=CHUNK_SIZE):
+    """
+    Yields a corpus as a stream of text chunks
+
+    `source`:
+        any of
+            - string: the corpus text itself
+            - os.PathLike: path of a utf-8 text file
+            - file-like: text or binary stream with a `read()`
+            (e.g. an uploaded werkzeug FileStorage stream)
+            - iterable of strings (e.g. lines of a file)
+
+    `chunk_size`:
+        number of characters/bytes read from streams at a time
+    """
+    if isinstance(source, str):
+        yield source
+    elif isinstance(source, os.PathLike):
+        with open(source, 'rb') as stream:
+            yield from iter_chunks(stream, chunk_size)
+    elif hasattr(source, 'read'):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        yield decoder.decode(b'', final=True)
+    else:
+        for chunk in source:
+            yield chunk.decode('utf-8', 'replace') if isinstance(chunk, bytes) else chunk
+
@@ -1,4 +1,5 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField
 from wtforms import (
     StringField, 
     PasswordField, 
@@ -83,16 +84,60 @@ class RegisterForm(FlaskForm):
 # Markov Forms                                                #
 ###############################################################
 
-class ModelFromCorpusForm(FlaskForm):
+class CorpusForm(FlaskForm):
+    """
+    Base form for anything that takes a corpus, either typed 
+    in or uploaded as a file
+
+    Data required fields:
+        - corpus OR corpus_file
+    """
+    corpus = StringField("Corpus", validators=[Optional()], widget=TextArea())
+    corpus_file = FileField("Corpus File", validators=[Optional()])
+
+    def validate(self):
+        if not super().validate():
+            return False
+        if not self.corpus.data and not self.corpus_file.data:
+            self.corpus.errors.append("Enter a corpus or upload a corpus file")
+            return False
+        return True
+
+    def corpus_source(self):
+        """
+        returns:
+            - the uploaded file's stream if there is one, 
+            otherwise the corpus text
+        """
+        if self.corpus_file.data:
+            return self.corpus_file.data.stream
+        return self.corpus.data
+
+
+class ModelFromCorpusForm(CorpusForm):
     """
     New markov model from corpus text
 
     Data required fields:
-        - corpus
+        - corpus OR corpus_file
         - name
         - order
+    Optional Fields:
+        - backoff
     """
-    corpus = StringField("Corpus", validators=[DataRequired()], widget=TextArea())
     name = StringField("Model Name", validators=[DataRequired()])
     order = RadioField('Order', choices=[('1','1'),('2','2'),('3','3')], validators=[DataRequired()])
-    submit = SubmitField("Generate Model")
\ No newline at end of file
+    backoff = BooleanField("Back off to lower orders", validators=[Optional()])
+    submit = SubmitField("Generate Model")
+
+
+class AppendCorpusForm(CorpusForm):
+    """
+    More corpus text for an existing markov model
+
+    Data required fields:
+        - corpus OR corpus_file
+        - name
+    """
+    name = StringField("Model Name", validators=[DataRequired()])
+    submit = SubmitField("Add To Model")
\ No newline at end of file
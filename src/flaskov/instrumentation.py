@@ -0,0 +1,220 @@
+import bisect
+import contextlib
+import threading
+import time
+
+from flask import g, has_request_context, request
+
+from .rng import thread_rng
+
+
+###############################################################
+# Histograms                                                  #
+###############################################################
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    Prometheus-style histogram of durations in seconds, one
+    series per combination of label values
+
+    `name`: string
+        metric name
+
+    `labels`: tuple
+        label names, in the order values are passed to `observe`
+    """
+
+    def __init__(self, name, help, labels, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, values, seconds):
+        """Records one duration for the label `values` tuple"""
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                # per-bucket counts (+Inf last), sum
+                series = self._series[values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+
+    def render(self):
+        """yields: lines of the Prometheus text format"""
+        yield "# HELP {} {}".format(self.name, self.help)
+        yield "# TYPE {} histogram".format(self.name)
+        with self._lock:
+            series = sorted((values, list(counts), total)
+                            for values, (counts, total) in self._series.items())
+        for values, counts, total in series:
+            labels = _labels(zip(self.labels, values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield '{}_bucket{{{}le="{}"}} {}'.format(
+                    self.name, labels + "," if labels else "",
+                    "+Inf" if bound == float("inf") else repr(bound), cumulative)
+            yield "{}_sum{{{}}} {}".format(self.name, labels, repr(total))
+            yield "{}_count{{{}}} {}".format(self.name, labels, cumulative)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    """Prometheus-style counter, one series per label values"""
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, values, amount=1):
+        with self._lock:
+            self._series[values] = self._series.get(values, 0) + amount
+
+    def render(self):
+        yield "# HELP {} {}".format(self.name, self.help)
+        yield "# TYPE {} counter".format(self.name)
+        with self._lock:
+            series = sorted(self._series.items())
+        for values, count in series:
+            yield "{}{{{}}} {}".format(
+                self.name, _labels(zip(self.labels, values)), count)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _labels(pairs):
+    return ",".join('{}="{}"'.format(
+        name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in pairs)
+
+
+###############################################################
+# Metrics                                                     #
+###############################################################
+
+class _Timer:
+    __slots__ = ('histogram', 'values', 'started')
+
+    def __init__(self, histogram, values):
+        self.histogram = histogram
+        self.values = values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(self.values, time.perf_counter() - self.started)
+
+
+_NOT_TIMED = contextlib.nullcontext()
+
+
+class Metrics:
+    """
+    Timing histograms of the hot paths, exposed in the
+    Prometheus text format (see the `/metrics` route)
+
+    Only a sample of requests is timed: each request is picked
+    with probability METRICS_SAMPLE_RATE when it starts, and the
+    timers of unpicked requests are a shared no-op, so the cost
+    on most requests is one attribute lookup per timer. Work
+    outside requests (background jobs, CLI) is sampled per timer.
+    `flaskov_requests_total` counts every request, so sampled
+    counts can be scaled back up.
+
+    Metrics are kept per worker process.
+
+    Config:
+        - METRICS_SAMPLE_RATE: 0 disables timing, 1 times all
+    """
+    DEFAULT_SAMPLE_RATE = 0.1
+
+    def __init__(self, app=None):
+        self.sample_rate = self.DEFAULT_SAMPLE_RATE
+        self.stages = Histogram(
+            "flaskov_stage_seconds",
+            "Time spent in each stage of a request, by route and model order",
+            ("route", "stage", "order"))
+        self.requests = Histogram(
+            "flaskov_request_seconds",
+            "Time spent handling sampled requests, by route and status",
+            ("route", "status"))
+        self.requests_total = Counter(
+            "flaskov_requests_total",
+            "Requests handled, sampled or not, by route",
+            ("route",))
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_SAMPLE_RATE', self.DEFAULT_SAMPLE_RATE)
+        self.sample_rate = app.config['METRICS_SAMPLE_RATE']
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.extensions['metrics'] = self
+
+    def timer(self, stage, order=""):
+        """
+        Context manager timing one stage of the current request
+        into `flaskov_stage_seconds`
+
+        `stage`:
+            e.g. "query", "deserialize", "generate"
+
+        `order`:
+            order of the model involved, if any
+        """
+        if has_request_context():
+            if not g.get("metrics_sampled"):
+                return _NOT_TIMED
+            route = request.endpoint or "unknown"
+        elif self._sample():
+            route = "background"
+        else:
+            return _NOT_TIMED
+        return _Timer(self.stages, (route, stage, str(order)))
+
+    def render(self):
+        """returns: all metrics in the Prometheus text format"""
+        lines = []
+        for metric in (self.requests_total, self.requests, self.stages):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in (self.requests_total, self.requests, self.stages):
+            metric.clear()
+
+    def _sample(self):
+        return self.sample_rate > 0 and thread_rng().random() < self.sample_rate
+
+    def _start_request(self):
+        g.metrics_sampled = self._sample()
+        if g.metrics_sampled:
+            g.metrics_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        route = request.endpoint or "unknown"
+        self.requests_total.inc((route,))
+        if g.get("metrics_sampled"):
+            self.requests.observe(
+                (route, str(response.status_code)),
+                time.perf_counter() - g.metrics_started)
+        return response
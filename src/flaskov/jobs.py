@@ -0,0 +1,325 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from flask import has_app_context
+
+
+###############################################################
+# Job Queue                                                   #
+###############################################################
+
+class Progress(dict):
+    """dict calling `on_change()`, if set, after every write"""
+    __slots__ = ('on_change',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_change = None
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if self.on_change is not None:
+            self.on_change()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        if self.on_change is not None:
+            self.on_change()
+
+
+class Job:
+    """
+    A unit of background work and its progress
+
+    `status`: string
+        one of "queued", "running", "finished", "failed"
+
+    `progress`: dict
+        free-form progress reported by the task while it runs
+
+    `result`: dict
+        return value of the task once finished
+    """
+    __slots__ = ('id', 'status', 'progress', 'result', 'error',
+                 'created', 'finished', 'saved')
+    DONE = ("finished", "failed")
+
+    def __init__(self, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.status = "queued"
+        self.progress = Progress()
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.saved = 0
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error_message": self.error,
+        }
+
+
+class MemoryStore:
+    """
+    Jobs kept in memory of the worker process that accepted them,
+    so only that process can report on them
+    """
+
+    def __init__(self, history):
+        self.history = history
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+
+    def save(self, job):
+        """Jobs are the stored objects, there's nothing to write"""
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def recover(self, before):
+        """Jobs of exited workers are gone with them"""
+        return 0
+
+
+class DatabaseStore(MemoryStore):
+    """
+    Jobs written to the `job_record` table of the app's database
+    (see `models.JobRecord`), so a job accepted by one worker
+    process can be polled from any other. Jobs still running here
+    are answered from memory, with their latest progress.
+
+    A job whose worker exited before finishing it stays "queued" or
+    "running" until `recover()` marks it failed.
+    """
+
+    def add(self, job):
+        from .models import JobRecord
+        with self._lock:
+            self._jobs[job.id] = job
+        JobRecord.save(job, history=self.history)
+
+    def save(self, job):
+        from .models import JobRecord
+        JobRecord.save(job)
+        if job.status in Job.DONE:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+
+    def get(self, job_id):
+        from .models import JobRecord
+        job = super().get(job_id)
+        if job is not None:
+            return job
+        record = JobRecord.query.get(job_id)
+        return record.to_job() if record else None
+
+    def recover(self, before):
+        """
+        Marks jobs created before `before` that never finished as
+        failed, since no worker is left to finish them
+
+        returns:
+            - number of jobs marked failed
+        """
+        from . import db
+        from .models import JobRecord
+        # nothing to recover before the database is migrated
+        if not JobRecord.__table__.exists(bind=db.engine):
+            return 0
+        return JobRecord.fail_unfinished(before, "worker exited")
+
+
+STORES = {
+    "memory": MemoryStore,
+    "database": DatabaseStore,
+}
+
+
+class JobQueue:
+    """
+    Runs tasks on a local thread pool, outside the request that
+    submitted them. No external broker is needed: job status is
+    kept in memory of the worker process that accepted them, or
+    in the app's database so any worker can report on it.
+
+    Tasks are called as `task(job, *args)` inside an app context
+    and may update `job.progress` as they go. With the database
+    store, progress is written at most once per
+    JOB_PROGRESS_INTERVAL, by committing the task's session: tasks
+    shouldn't update progress with changes of their own pending.
+
+    Jobs and spooled uploads (see `spool()`) older than
+    JOB_STALE_AFTER that a worker left behind when it exited are
+    cleaned up when the queue is initialised (see `recover()`).
+
+    Config:
+        - JOB_WORKERS: size of the pool. 0 runs every job inline
+        when it is submitted (useful for tests).
+        - JOB_HISTORY: number of jobs remembered for status checks
+        - JOB_STORE: "memory" or "database" (see `STORES`)
+        - JOB_PROGRESS_INTERVAL: seconds between progress writes
+        - JOB_STALE_AFTER: seconds after which an unfinished job
+        or spooled upload is considered abandoned
+        - JOB_SPOOL_DIR: directory uploads are spooled to,
+        defaults to "job_spool" in the instance folder
+    """
+    DEFAULT_WORKERS = 2
+    DEFAULT_HISTORY = 1000
+    DEFAULT_STORE = "memory"
+    DEFAULT_PROGRESS_INTERVAL = 1.0
+    DEFAULT_STALE_AFTER = 6 * 60 * 60
+
+    def __init__(self, app=None):
+        self.app = None
+        self.workers = self.DEFAULT_WORKERS
+        self.history = self.DEFAULT_HISTORY
+        self.progress_interval = self.DEFAULT_PROGRESS_INTERVAL
+        self.stale_after = self.DEFAULT_STALE_AFTER
+        self.spool_dir = None
+        self.store = MemoryStore(self.history)
+        self._lock = threading.Lock()
+        self._executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOB_WORKERS', self.DEFAULT_WORKERS)
+        app.config.setdefault('JOB_HISTORY', self.DEFAULT_HISTORY)
+        app.config.setdefault('JOB_STORE', self.DEFAULT_STORE)
+        app.config.setdefault(
+            'JOB_PROGRESS_INTERVAL', self.DEFAULT_PROGRESS_INTERVAL)
+        app.config.setdefault('JOB_STALE_AFTER', self.DEFAULT_STALE_AFTER)
+        app.config.setdefault(
+            'JOB_SPOOL_DIR', os.path.join(app.instance_path, 'job_spool'))
+        self.app = app
+        self.workers = app.config['JOB_WORKERS']
+        self.history = app.config['JOB_HISTORY']
+        self.progress_interval = app.config['JOB_PROGRESS_INTERVAL']
+        self.stale_after = app.config['JOB_STALE_AFTER']
+        self.spool_dir = app.config['JOB_SPOOL_DIR']
+        store = app.config['JOB_STORE']
+        if store not in STORES:
+            raise ValueError("Unknown JOB_STORE {!r}".format(store))
+        self.store = STORES[store](self.history)
+        app.extensions['job_queue'] = self
+        try:
+            self.recover()
+        except Exception:
+            app.logger.exception("Recovering abandoned jobs failed")
+
+    def submit(self, task, *args):
+        """
+        Queues `task(job, *args)` to run in the background
+
+        returns:
+            - Job
+        """
+        job = Job()
+        self.store.add(job)
+        job.progress.on_change = lambda: self._progress(job)
+
+        if self.workers <= 0:
+            self._run(job, task, args)
+        else:
+            self._pool().submit(self._run, job, task, args)
+        return job
+
+    def get(self, job_id):
+        """
+        returns:
+            - Job, or None if the job is unknown
+        """
+        return self.store.get(job_id)
+
+    def spool(self, stream, suffix=".txt"):
+        """
+        Copies `stream` to a new file in JOB_SPOOL_DIR, for jobs
+        reading data that doesn't outlive the request (uploads).
+        The job deletes the file once done, `recover()` deletes
+        files left by workers that exited first.
+
+        returns:
+            - string (path of the file)
+        """
+        os.makedirs(self.spool_dir, exist_ok=True)
+        descriptor, path = tempfile.mkstemp(suffix=suffix, dir=self.spool_dir)
+        with os.fdopen(descriptor, 'wb') as spool:
+            shutil.copyfileobj(stream, spool)
+        return path
+
+    def recover(self):
+        """
+        Cleans up after workers that exited with jobs unfinished:
+        jobs and spooled files older than JOB_STALE_AFTER are
+        marked failed and deleted
+
+        returns:
+            - (number of jobs failed, number of files deleted)
+        """
+        before = time.time() - self.stale_after
+        with self.app.app_context():
+            failed = self.store.recover(before)
+        removed = 0
+        if os.path.isdir(self.spool_dir):
+            for entry in os.scandir(self.spool_dir):
+                if entry.is_file() and entry.stat().st_mtime < before:
+                    os.unlink(entry.path)
+                    removed += 1
+        return failed, removed
+
+    def _pool(self):
+        # created lazily so the pool's threads belong to the
+        # process that uses them (not a pre-fork master)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="flaskov-job")
+            return self._executor
+
+    def _run(self, job, task, args):
+        with ExitStack() as stack:
+            # inline jobs reuse the submitting request's context
+            if not has_app_context():
+                stack.enter_context(self.app.app_context())
+            job.status = "running"
+            self._save(job)
+            try:
+                job.result = task(job, *args)
+                job.status = "finished"
+            except Exception as error:
+                job.error = str(error)
+                job.status = "failed"
+            finally:
+                job.finished = time.time()
+                self._save(job)
+
+    def _progress(self, job):
+        if time.monotonic() - job.saved >= self.progress_interval:
+            self._save(job)
+
+    def _save(self, job):
+        # status writes never fail the job itself
+        job.saved = time.monotonic()
+        try:
+            self.store.save(job)
+        except Exception:
+            self.app.logger.exception("Saving job %s failed", job.id)
@@ -0,0 +1,220 @@
+import contextlib
+import fcntl
+import glob
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from .vectorized import ArrayChain
+
+
+###############################################################
+# Mapped Model Files                                          #
+###############################################################
+#
+# Layout (all integers little-endian, sections 8-byte aligned):
+#
+#   header          MAGIC, format version, order, n_words,
+#                   n_states, n_transitions, start row,
+#                   end word id, string table size
+#   cumulative      int64 per transition
+#   indptr          int32 per state + 1
+#   successors      int32 word id per transition
+#   next_state      int32 row per transition, -1 ends
+#   word offsets    int64 per word + 1, into the string table
+#   string table    words back to back, utf-8
+#
+# The arrays are exactly those of an `ArrayChain`, so a mapped
+# file samples with the same code, straight from the page cache.
+
+MAGIC = b'FKMC'
+VERSION = 1
+HEADER = struct.Struct('<4sBBxxIIIiIQ')
+SUFFIX = '.fkmc'
+
+
+class FormatError(ValueError):
+    """Raised when a file isn't a mapped model in a known format"""
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _sections(n_words, n_states, n_transitions):
+    """yields: (name, dtype, length) of each array, in file order"""
+    yield 'cumulative', '<i8', n_transitions
+    yield 'indptr', '<i4', n_states + 1
+    yield 'successors', '<i4', n_transitions
+    yield 'next_state', '<i4', n_transitions
+    yield 'offsets', '<i8', n_words + 1
+
+
+def model_path(directory, model_id, version):
+    """
+    Path of the file for one version of a stored model. A new
+    version gets a new file, so workers still mapping the old one
+    are never affected by a rewrite.
+    """
+    return os.path.join(
+        directory, "{}-{}{}".format(model_id, version, SUFFIX))
+
+
+@contextlib.contextmanager
+def locked(directory, model_id):
+    """
+    Holds an exclusive lock on the files of `model_id`, across
+    threads and processes, so that writers racing to export the
+    same model version write it once and the others reuse it
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(lock_path(directory, model_id), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def lock_path(directory, model_id):
+    return os.path.join(directory, "{}.lock".format(model_id))
+
+
+def remove_files(directory, model_id, keep=None):
+    """
+    Removes the files of `model_id` except the `keep` path. Workers
+    that still map a removed file keep reading it until they
+    unmap it (the OS frees it afterwards). Without `keep` (the
+    model is gone) its lock file is removed too.
+    """
+    pattern = os.path.join(directory, "{}-*{}".format(model_id, SUFFIX))
+    paths = glob.glob(pattern)
+    if keep is None:
+        paths.append(lock_path(directory, model_id))
+    for path in paths:
+        if path != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def write(chain, path):
+    """
+    Writes an `ArrayChain` to `path` in the mapped format
+
+    The file is written beside `path` and renamed into place, so
+    readers only ever see complete files.
+    """
+    encoded = [word.encode('utf-8') for word in chain.words]
+    offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+    np.cumsum([len(word) for word in encoded], out=offsets[1:])
+    arrays = {
+        'cumulative': chain.cumulative,
+        'indptr': chain.indptr,
+        'successors': chain.successors,
+        'next_state': chain.next_state,
+        'offsets': offsets,
+    }
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            output.write(HEADER.pack(
+                MAGIC, VERSION, chain.order, len(encoded), len(chain),
+                len(chain.successors), chain.start, chain.end,
+                int(offsets[-1])))
+            position = HEADER.size
+            for name, dtype, _ in _sections(
+                    len(encoded), len(chain), len(chain.successors)):
+                output.write(b'\0' * (_align(position) - position))
+                data = np.ascontiguousarray(arrays[name], dtype=dtype).tobytes()
+                output.write(data)
+                position = _align(position) + len(data)
+            output.write(b''.join(encoded))
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+class WordTable:
+    """
+    Read-only sequence of the words in a mapped file. Words are
+    decoded on access, so opening a file doesn't build a list of
+    the whole vocabulary.
+    """
+    __slots__ = ('offsets', 'data', 'base')
+
+    def __init__(self, offsets, data, base):
+        self.offsets = offsets
+        self.data = data
+        self.base = base
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, word_id):
+        start = self.base + int(self.offsets[word_id])
+        stop = self.base + int(self.offsets[word_id + 1])
+        return self.data[start:stop].decode('utf-8')
+
+    def __iter__(self):
+        return (self[word_id] for word_id in range(len(self)))
+
+
+class MappedChain(ArrayChain):
+    """
+    `ArrayChain` read from a file with `mmap`
+
+    Opening a file only reads the header: the arrays are views
+    of the mapping, so loading takes constant time whatever the
+    size of the model, and every worker process mapping the same
+    file shares its pages through the OS page cache instead of
+    holding a private copy.
+
+    `path`: string
+        the mapped file
+    """
+
+    def __init__(self, path):
+        """
+        `path`:
+            file written by `write()`
+        """
+        with open(path, 'rb') as source:
+            data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(data) < HEADER.size:
+            raise FormatError("Truncated mapped model")
+        (magic, version, order, n_words, n_states, n_transitions,
+            start, end, strings) = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise FormatError("Not a mapped markov model")
+        if version != VERSION:
+            raise FormatError(
+                "Unsupported mapped model version {}".format(version))
+
+        arrays = {}
+        position = HEADER.size
+        for name, dtype, length in _sections(n_words, n_states, n_transitions):
+            position = _align(position)
+            arrays[name] = np.frombuffer(
+                data, dtype=dtype, count=length, offset=position)
+            position += arrays[name].nbytes
+        if position + strings > len(data):
+            raise FormatError("Truncated mapped model")
+
+        self.path = path
+        self.order = order
+        self.start = start
+        self.end = end
+        self.cumulative = arrays['cumulative']
+        self.indptr = arrays['indptr']
+        self.successors = arrays['successors']
+        self.next_state = arrays['next_state']
+        self.words = WordTable(arrays['offsets'], data, position)
@@ -1,9 +1,21 @@
+import datetime
 import json
-import random
+import os
+import sys
+import time
 
+from flask import current_app, has_app_context
 from flask_login import UserMixin
+from sqlalchemy import event, inspect
 
-from . import db, login_manager
+from . import (
+    codec, db, login_manager, mapped, metrics, model_cache, response_cache,
+    tokenizer as tokenizers)
+from .chain import CompiledChain, lower_orders, resolve
+from .jobs import Job
+from .ngrams import NgramStore
+from .rng import make_rng
+from .vectorized import ArrayChain
 
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -12,18 +24,36 @@ from werkzeug.security import generate_password_hash, check_password_hash
 # Models                                                      #
 ###############################################################
 
+class QuotaError(ValueError):
+    """Raised when a build would take a user over their quota"""
+
+
 class User(db.Model, UserMixin):
     """
     User model for authentication
 
-    TODO:
-        Implement storage of markov models for each user.
+    Users own the models they build (see `MarkovModel.owner`).
+    The totals of their models are kept in counter columns,
+    updated on every flush by the accounting events below, so
+    usage is read without scanning any models.
+
+    `model_count`: int
+        number of models owned
+
+    `stored_states`: int
+        sum of the `model_size` of owned models
+
+    `stored_bytes`: int
+        sum of the `model_bytes` of owned models
     """
     __tablename__ = 'user'
     id = db.Column(db.Integer, primary_key = True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(200), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
+    model_count = db.Column(db.Integer, nullable=False, default=0)
+    stored_states = db.Column(db.Integer, nullable=False, default=0)
+    stored_bytes = db.Column(db.Integer, nullable=False, default=0)
     
     def __repr__(self):
         return '<User {}>'.format(self.username)
@@ -37,6 +67,40 @@ class User(db.Model, UserMixin):
     def set_password(self, password):
         self.password = generate_password_hash(password)
 
+    def usage(self):
+        """
+        returns:
+            - dict of the user's stored totals and the
+            USER_QUOTA_* limits (None when unlimited)
+        """
+        config = current_app.config
+        return {
+            "model_count": self.model_count or 0,
+            "stored_states": self.stored_states or 0,
+            "stored_bytes": self.stored_bytes or 0,
+            "quota_models": config.get('USER_QUOTA_MODELS'),
+            "quota_states": config.get('USER_QUOTA_STATES'),
+            "quota_bytes": config.get('USER_QUOTA_BYTES'),
+        }
+
+    def quota_error(self, models=0, states=0, nbytes=0):
+        """
+        Checks whether adding `models`, `states` & `nbytes` to
+        the user's totals stays within the USER_QUOTA_* config
+
+        returns:
+            - string error message, or None if within quota
+        """
+        usage = self.usage()
+        for name, added in (("models", models), ("states", states),
+                            ("bytes", nbytes)):
+            quota = usage["quota_" + name]
+            used = usage["model_count" if name == "models" else "stored_" + name]
+            if quota is not None and added > 0 and used + added > quota:
+                return "That would go over your quota of {:,} {}!".format(
+                    quota, name)
+        return None
+
 
 
 class MarkovModel(db.Model):
@@ -58,6 +122,38 @@ class MarkovModel(db.Model):
         error message when generate() is called with
         no markov model.
 
+    `ENGINES`: tuple
+        names of the compiled forms a model can be 
+        sampled from (see `compile()`). "mapped" shares
+        one file per model version between all worker
+        processes (see `export()`)
+
+    `COMPRESSION`: string
+        compression used for `model_serialized`. one of
+        None, "zlib" or "lzma" (see `codec.py`)
+
+    `BACKOFF_MIN_COUNT`: int
+        in backoff models, states seen fewer times than this
+        drop to the lower-order states derived from them when
+        compiling (see `chain.lower_orders()`)
+
+    `STORES`: tuple
+        backing stores for the `model` member: "dict", or
+        "packed" for an `ngrams.NgramStore`, which keeps keys
+        as packed integers of word ids and uses far less
+        memory for large order 2 & 3 models. keys are 8 bytes
+        while the vocabulary fits (about 1M distinct words at
+        order 3, 2^31 at order 2). larger vocabularies widen
+        them to Python ints once, at about 5x the memory
+
+    `STORE`: string
+        store used when none is given and the app sets no
+        MODEL_STORE (see `_store()`)
+
+    `STREAM_BATCH`: int
+        sentences generated together when streaming from an
+        array engine (see `stream()`)
+
     TODO:
         implement methods to generate sentences
     """
@@ -66,7 +162,25 @@ class MarkovModel(db.Model):
     model_name = db.Column(db.String(200), unique=True, nullable=False)
     model_size = db.Column(db.String(200), nullable=False)
     model_order = db.Column(db.Integer, nullable=False)
-    model_serialized = db.Column(db.String(), nullable=False)
+    # deferred: plain queries load metadata only, the blob is
+    # fetched on first access (see `load()`)
+    model_serialized = db.deferred(db.Column(db.LargeBinary(), nullable=False))
+    model_version = db.Column(db.Integer, nullable=False, default=1)
+    model_bytes = db.Column(db.Integer, nullable=False, default=0)
+    model_backoff = db.Column(
+        db.Boolean, nullable=False, default=False, server_default=db.false())
+    backoff = db.synonym('model_backoff')
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    owner = db.relationship(
+        'User', backref=db.backref('models', lazy='dynamic'))
+    # optimistic lock: rows are only updated where `model_version`
+    # is still the one read, so of two concurrent rewrites the
+    # second raises StaleDataError instead of dropping the first.
+    # `serialize()` bumps the version itself
+    __mapper_args__ = {
+        "version_id_col": model_version,
+        "version_id_generator": False,
+    }
     
     START = "START"
     END = "END"
@@ -74,14 +188,53 @@ class MarkovModel(db.Model):
     EMPTY_MODEL_ERROR = (
         "WHOA! You are trying to generate a sentence from an empty model!"
     )
+    ENGINES = ("compiled", "arrays", "mapped")
+    COMPRESSION = "zlib"
+    PROGRESS_INTERVAL = 1000
+    BACKOFF_MIN_COUNT = 2
+    STORES = ("dict", "packed")
+    STORE = "dict"
+    STREAM_BATCH = 256
 
     def __repr__(self):
         return '<MarkovModel {}>'.format(self.model_name)
 
+    @classmethod
+    def name_taken(cls, name):
+        """True if a model is stored as `name`, without loading it"""
+        query = db.session.query(cls.id).filter_by(model_name=name)
+        return db.session.query(query.exists()).scalar()
+
+    @classmethod
+    def version_of(cls, name):
+        """returns: `model_version` of the model named `name`, or None"""
+        return db.session.query(cls.model_version).filter_by(
+            model_name=name).scalar()
+
+    def summary(self):
+        """
+        returns:
+            - dict of the model's metadata (never touches the
+            serialized model)
+        """
+        return {
+            "model_name": self.model_name,
+            "model_size": self.model_size,
+            "model_order": self.model_order,
+            "model_version": self.model_version,
+            "owner": self.owner.username if self.owner else None,
+        }
+
+    @property
+    def stored_states(self):
+        """`model_size` as counted towards the owner's quota"""
+        return max(int(self.model_size or 0), 0)
+
     def get_id(self):
         return self.id
 
-    def __init__(self, corpus=None, model=None, order=1, name=None):
+    def __init__(self, corpus=None, model=None, order=1, name=None, backoff=False,
+                 store=None, tokenizer=None):
         """
         `corpus`: 
             a chunk of text. Should be multiple sentences 
@@ -105,25 +258,150 @@ class MarkovModel(db.Model):
             Name of the model:
                 - if provided, self.model_name = name
                 - if not provided, and corpus is provided, 
+
+        `backoff`:
+            if True, generation can drop to lower orders (1 to
+            order - 1) when a full-order state is sparse. only
+            full-order states are counted: the lower orders are
+            derived from them when compiling
+
+        `store`:
+            one of `STORES`, defaults to the app's (see
+            `_store()`)
+
+        `tokenizer`:
+            `tokenizer.Tokenizer` splitting corpora into sentences,
+            defaults to the app's (see `_tokenizer()`)
             
         """
+        self.store = store
+        self.tokenizer = tokenizer
+        self.model_order = order
         self.model = (
             model if model else 
-            {})
+            self._empty_store())
+        self.backoff = backoff
         self.model_name = (
             name if name else 
             corpus[0:20] + "..." if corpus else 
             self.DEFAULT_NAME)
-        self.model_order = order
         if corpus:
-            for sentence in corpus.split('. '):
-                self.add_sentence(sentence.split())
+            self.add_corpus(corpus)
 
         self.serialize()
 
+    @classmethod
+    def from_source(cls, source, order=1, name=None, backoff=False, store=None,
+                    tokenizer=None):
+        """
+        Builds a model from a streamed corpus
+
+        `source`:
+            file-like, path, or iterable of lines. read in chunks
+            so peak memory doesn't grow with corpus size (see
+            `corpus.iter_chunks()`)
+
+        `store`, `tokenizer`:
+            see `__init__`
+
+        returns:
+            - MarkovModel (serialized, not yet committed)
+        """
+        model = cls(order=order, name=name, backoff=backoff, store=store,
+                    tokenizer=tokenizer)
+        model.add_corpus(source)
+        model.serialize()
+        return model
+
     def _compute_size(self):
         """Subtract 2 from model size to get rid of START & END nodes"""
-        self.model_size = len(self.model.keys()) - self.model_order - 2
+        self.model_size = (
+            len(self.model.keys()) - self.model_order - 2)
+
+    def _store(self):
+        """
+        returns: the model's store, else the MODEL_STORE configured
+        for the app, else `STORE`. rows loaded from the database
+        have no store of their own, so they follow the config
+        """
+        store = getattr(self, 'store', None)
+        if store is None and has_app_context():
+            store = current_app.config.get('MODEL_STORE')
+        store = store or self.STORE
+        if store not in self.STORES:
+            raise ValueError("Unknown model store {!r}".format(store))
+        return store
+
+    def _empty_store(self):
+        """returns: an empty model of the configured store"""
+        if self._store() == "packed":
+            return NgramStore(max_order=self.model_order)
+        return {}
+
+    def _tokenizer(self):
+        """
+        returns: the model's tokenizer, else the one configured for
+        the app (see `tokenizer.from_config()`), else the default
+        """
+        tokenizer = getattr(self, 'tokenizer', None)
+        if tokenizer is not None:
+            return tokenizer
+        if has_app_context():
+            return tokenizers.from_config(current_app.config)
+        return tokenizers.get_tokenizer()
+
+    def _drop_lower_states(self):
+        """
+        Removes lower-order (backoff) states from `model`. Rows
+        written before they were derived when compiling stored
+        them beside the full-order states.
+
+        returns:
+            - True if the model had any
+        """
+        lower = [state for state in self.model if len(state) != self.model_order]
+        for state in lower:
+            del self.model[state]
+        return bool(lower)
+
+    def add_corpus(self, source, progress=None):
+        """
+        Adds every sentence of a corpus to the markov model
+
+        `source`:
+            corpus text, or any streamed source accepted by
+            `corpus.iter_chunks()`. split into sentences by the
+            model's tokenizer
+
+        `progress`:
+            optional callable, called with the number of sentences
+            added so far every `PROGRESS_INTERVAL` sentences
+        """
+        added = 0
+        with metrics.timer("add_sentences", self.model_order):
+            sentences = self._tokenizer().sentences(source)
+            for added, sentence in enumerate(sentences, 1):
+                self._count_sentence(sentence)
+                if progress and added % self.PROGRESS_INTERVAL == 0:
+                    progress(added)
+        if progress:
+            progress(added)
+        self._compute_size()
+
+    def append_corpus(self, source):
+        """
+        Grows an already stored model with more text. Only the new
+        text is tokenized; its counts are merged into the existing 
+        chain and the model is serialized once at the end.
+        Committing raises StaleDataError if the model was rewritten
+        since it was read (see `__mapper_args__`).
+
+        `source`:
+            see `add_corpus()`
+        """
+        self.deserialize()
+        self.add_corpus(source)
+        self.serialize()
 
     def add_sentence(self, sentence):
         """
@@ -133,8 +411,15 @@ class MarkovModel(db.Model):
             list of words that are ordered as a syntactically correct
             sentence. used to generate model. 
         """
+        self._count_sentence(sentence)
+        self._compute_size()
+
+    def _count_sentence(self, sentence):
+        """Counts the transitions of `sentence`, without resizing"""
         order = self.model_order
-        words = [self.START]*order + sentence + [self.END]
+        # interned, so every state and count dict of the model
+        # shares one string per distinct word
+        words = [self.START]*order + list(map(sys.intern, sentence)) + [self.END]
 
         # IMPORTANT COMMENT:
         #
@@ -156,56 +441,598 @@ class MarkovModel(db.Model):
 
             self.model[current][follows] += 1
 
+    def compact(self, min_count=1, top_k=None):
+        """
+        Shrinks the model by dropping rare transitions, then
+        serializes it. Works on the in-memory `model`: call
+        `deserialize()` first on stored models.
+
+        `min_count`:
+            transitions seen fewer times than this are dropped.
+            every state keeps at least its most frequent
+            transition, so no walk gets stuck.
+
+        `top_k`:
+            optional cap on the successors kept per state, most
+            frequent first
+
+        States that no walk from START can reach any more are
+        dropped too, and `model_size` is recomputed.
+
+        returns:
+            - dict of states, transitions and serialized bytes
+            before (as of the last `serialize()`) and after, and
+            `bytes_saved`
+        """
+        report = {
+            "states_before": len(self.model),
+            "transitions_before": _transitions(self.model),
+            "bytes_before": len(self.model_serialized or b''),
+        }
+        with metrics.timer("compact", self.model_order):
+            pruned = {state: _prune(follows, min_count, top_k)
+                      for state, follows in self.model.items()}
+            reachable = self._reachable(pruned)
+            # a backoff state is kept by its full-order states
+            self.model = self._empty_store()
+            self.model.update(
+                (state, follows) for state, follows in pruned.items()
+                if any(state[i:] in reachable for i in range(len(state))))
         self._compute_size()
+        self.serialize()
+
+        report.update({
+            "states_after": len(self.model),
+            "transitions_after": _transitions(self.model),
+            "bytes_after": len(self.model_serialized),
+        })
+        report["bytes_saved"] = report["bytes_before"] - report["bytes_after"]
+        return report
+
+    def _reachable(self, model):
+        """
+        returns: set of the states of `model` a walk from START
+        can reach, following transitions the way compiled chains
+        do (see `chain.resolve()`), including derived lower-order
+        states of backoff models
+        """
+        order = self.model_order
+        if self.backoff:
+            model = {**model, **lower_orders(model, order)}
+        totals = {state: sum(follows.values()) for state, follows in model.items()}
+        start = (self.START,) * order
+        reachable = {start} if start in model else set()
+        pending = list(reachable)
+        while pending:
+            state = pending.pop()
+            for word in model[state]:
+                if word == self.END:
+                    continue
+                following = resolve(
+                    state + (word,), totals, order, self.BACKOFF_MIN_COUNT)
+                if following is not None and following not in reachable:
+                    reachable.add(following)
+                    pending.append(following)
+        return reachable
+
+    @staticmethod
+    def build_compaction():
+        """
+        returns: `compact()` arguments for newly built models,
+        from MODEL_MIN_COUNT & MODEL_TOP_K, or None when new
+        models are kept whole
+        """
+        if not has_app_context():
+            return None
+        min_count = current_app.config.get("MODEL_MIN_COUNT") or 1
+        top_k = current_app.config.get("MODEL_TOP_K")
+        if min_count <= 1 and top_k is None:
+            return None
+        return {"min_count": min_count, "top_k": top_k}
 
-    def generate(self):
+    def generate(self, seed=None, rng=None, engine="compiled"):
         """
         Generates a sentence from the markov model
 
+        `seed`:
+            optional seed. the same seed always produces the
+            same sentence from the same model.
+
+        `rng`:
+            optional `random.Random` to draw from instead. 
+            defaults to a stream seeded with `seed`, or to the
+            calling thread's own stream (see `rng.py`)
+
+        `engine`:
+            one of `ENGINES`, see `compile()`
+
         returns: 
             - string
         """
-        self.deserialize()
-        if self.model == {}:
+        chain = self.load(engine)
+        if not chain:
             return self.EMPTY_MODEL_ERROR
+        with metrics.timer("generate", self.model_order):
+            return self.sentence(chain, self.model_order, rng or make_rng(seed))
 
-        current_state = tuple(self.model_order * [self.START])
-        word_list = []
-        next_word = ""
+    @classmethod
+    def sentence(cls, chain, order, rng):
+        """
+        returns: one sentence from a chain loaded by any engine
+        (see `load()`)
+        """
+        if isinstance(chain, ArrayChain):
+            return chain.generate_batch(1, seed=rng.getrandbits(64))[0]
+        return ' '.join(chain.walk((cls.START,) * order, rng))
+
+    def generate_many(self, n, seed=None, engine="compiled", rng=None):
+        """
+        Generates `n` sentences, loading the model only once
+
+        `n`:
+            number of sentences to generate
 
-        while next_word != self.END:
-            next_word = random.choices(
-                [i for i in self.model[current_state].keys()],
-                weights=[i for i in self.model[current_state].values()]
-            )[0] # we need string, not list of string
+        `seed`, `rng`:
+            see `generate()`
 
-            if next_word != self.END: 
-                word_list.append(next_word)
-            current_state = tuple([next_word])
+        `engine`:
+            one of `ENGINES`. "arrays" advances all `n` 
+            sentences together as a vectorized batch.
 
-        return ' '.join(word_list)
+        returns:
+            - list of strings
+        """
+        chain = self.load(engine)
+        if not chain:
+            return [self.EMPTY_MODEL_ERROR] * n
+        rng = rng or make_rng(seed)
+        with metrics.timer("generate", self.model_order):
+            if isinstance(chain, ArrayChain):
+                return chain.generate_batch(n, seed=rng.getrandbits(64))
+            return [self._walk(chain, rng) for _ in range(n)]
+
+    def stream(self, n=None, seed=None, engine="compiled", rng=None):
+        """
+        Generates sentences lazily, one at a time, so output of
+        any length is produced in constant memory. The model is
+        loaded right away, the sentences as they are consumed.
+
+        `n`:
+            number of sentences, None for no limit
+
+        `seed`, `engine`, `rng`:
+            see `generate_many()`. the "arrays" & "mapped"
+            engines generate `STREAM_BATCH` sentences at a time
+
+        returns:
+            - iterator of strings
+        """
+        chain = self.load(engine)
+        if not chain:
+            return iter([self.EMPTY_MODEL_ERROR])
+        rng = rng or make_rng(seed)
+        return self._stream(chain, n, rng)
+
+    def _stream(self, chain, n, rng):
+        produced = 0
+        while n is None or produced < n:
+            if isinstance(chain, ArrayChain):
+                batch = self.STREAM_BATCH if n is None else min(
+                    self.STREAM_BATCH, n - produced)
+                yield from chain.generate_batch(batch, seed=rng.getrandbits(64))
+                produced += batch
+            else:
+                yield self._walk(chain, rng)
+                produced += 1
+
+    def _walk(self, chain, rng):
+        """Walks `chain` from START to END, returns the sentence"""
+        current_state = tuple(self.model_order * [self.START])
+        return ' '.join(chain.walk(current_state, rng))
 
     def serialize(self):
         """
-        Serialize model as JSON string
-        Stores serialization as `model_serialized` member
+        Serialize model in the binary format from `codec.py`
+        Stores serialization as `model_serialized` member (and
+        its length as `model_bytes`), and bumps `model_version`
+        so cached copies are invalidated
         """
-        self.model_serialized = json.dumps(list(self.model.items()))
+        with metrics.timer("serialize", self.model_order):
+            self.model_serialized = codec.encode(self.model, self.COMPRESSION)
+        self.model_bytes = len(self.model_serialized)
+        self.model_version = (self.model_version or 0) + 1
 
     def deserialize(self):
         """
-        Deserialize JSON string to model
+        Deserialize `model_serialized` to model
         Stores deserialized model as `model` member
+
+        Rows written before the binary format hold a JSON list
+        of [state, follows] pairs, which is still understood.
+
+        returns:
+            - dict (the deserialized model)
+        """
+        with metrics.timer("deserialize", self.model_order):
+            if codec.is_binary(self.model_serialized):
+                self.model = codec.decode(
+                    self.model_serialized, self._empty_store())
+            else:
+                raw_model = json.loads(self.model_serialized)
+                # Next line removes outermost list, and changes keys from
+                # lists to tuples (to match original model structure)
+                self.model = self._empty_store()
+                self.model.update(
+                    (tuple(pair[0]), pair[1]) for pair in raw_model)
+
+        if self._drop_lower_states():
+            self.backoff = True
+        return self.model
+
+    def compile(self, engine="compiled"):
+        """
+        Compiles the deserialized model for sampling
+
+        `engine`:
+            "compiled" for cumulative-weight tables,
+            "arrays" for NumPy arrays with integer word ids, or
+            "mapped" for the same arrays mapped from the file
+            written by `export()`
+
+        returns:
+            - CompiledChain, ArrayChain or MappedChain
+        """
+        if engine == "mapped":
+            return mapped.MappedChain(self.export())
+        model = self.deserialize()
+        with metrics.timer("compile", self.model_order):
+            if engine == "arrays":
+                return ArrayChain(
+                    model, self.model_order, self.START, self.END,
+                    self.BACKOFF_MIN_COUNT, self.backoff)
+            return CompiledChain(
+                model, self.model_order, self.END, self.BACKOFF_MIN_COUNT,
+                self.START, self.backoff)
+
+    def load(self, engine="compiled"):
+        """
+        Loads the compiled model through the worker's model 
+        cache. Models that haven't been committed yet (no `id`) 
+        are compiled directly.
+
+        `engine`:
+            one of `ENGINES`, see `compile()`
+
+        returns:
+            - CompiledChain or ArrayChain (shared between 
+            requests, read-only)
+        """
+        if self.id is None:
+            return self.compile("arrays" if engine == "mapped" else engine)
+        return model_cache.get(
+            (self.id, self.model_name, engine),
+            self.model_version,
+            lambda: self.compile(engine),
+            # mapped pages are shared, not held by this worker
+            size=0 if engine == "mapped" else lambda chain: chain.nbytes)
+
+    def export(self, directory=None):
+        """
+        Writes the model to a file in the format of `mapped.py`,
+        unless the file for this `model_version` already exists.
+        Files of older versions are removed. Writers of the same
+        model take turns on a lock file, so a version is only
+        written once however many workers miss it at once.
+
+        `directory`:
+            where model files live, defaults to the
+            MODEL_FILES_DIR config
+
+        returns:
+            - string (path of the file)
+        """
+        if self.id is None:
+            raise ValueError("Only stored models can be exported")
+        directory = directory or current_app.config['MODEL_FILES_DIR']
+        path = mapped.model_path(directory, self.id, self.model_version)
+        if not os.path.exists(path):
+            with mapped.locked(directory, self.id):
+                if not os.path.exists(path):
+                    mapped.write(self.compile("arrays"), path)
+                    mapped.remove_files(directory, self.id, keep=path)
+        return path
+
+    def export_if_mapped(self):
+        """
+        Exports a committed model right away when the app serves
+        the "mapped" engine, so workers map the new version on
+        their next request instead of building it themselves.
+        Failures are logged: the first request exports it then.
+        """
+        if current_app.config['SENTENCE_ENGINE'] != "mapped":
+            return
+        try:
+            self.export()
+        except OSError:
+            current_app.logger.exception(
+                "Exporting %r failed", self.model_name)
+
+class ModelUsage(db.Model):
+    """
+    Access counters of a model, kept out of `markov_model` so
+    bumping them never rewrites a row holding a serialized model
+
+    Written in batches by `usage.UsageTracker`, never per request.
+
+    `request_count`: int
+        requests served from the model (including cached
+        responses)
+
+    `sentence_count`: int
+        sentences generated
+
+    `last_access`: datetime
+        UTC time of the latest request
+    """
+    __tablename__ = 'model_usage'
+    model_id = db.Column(
+        db.Integer, db.ForeignKey('markov_model.id'), primary_key=True)
+    request_count = db.Column(db.Integer, nullable=False, default=0)
+    sentence_count = db.Column(db.Integer, nullable=False, default=0)
+    last_access = db.Column(db.DateTime, index=True)
+    model = db.relationship(
+        'MarkovModel', backref=db.backref('usage', uselist=False))
+
+    BY = {
+        "requests": request_count,
+        "sentences": sentence_count,
+        "last_access": last_access,
+    }
+
+    @classmethod
+    def add(cls, counts):
+        """
+        Adds buffered counts to the stored ones and commits
+
+        `counts`:
+            dict mapping model names to (requests, sentences,
+            last access timestamp). names of models that don't
+            exist (any more) are skipped.
+
+        returns:
+            - number of models updated
+        """
+        ids = dict(db.session.query(MarkovModel.model_name, MarkovModel.id)
+                   .filter(MarkovModel.model_name.in_(list(counts))))
+        table = cls.__table__
+        update = table.update().where(
+            table.c.model_id == db.bindparam('b_model_id')).values(
+            request_count=table.c.request_count + db.bindparam('b_requests'),
+            sentence_count=table.c.sentence_count + db.bindparam('b_sentences'),
+            last_access=db.bindparam('b_last_access'))
+        missing = []
+        for name, model_id in ids.items():
+            requests, sentences, last_access = counts[name]
+            row = {
+                "b_model_id": model_id,
+                "b_requests": requests,
+                "b_sentences": sentences,
+                "b_last_access": datetime.datetime.utcfromtimestamp(last_access),
+            }
+            if db.session.execute(update, row).rowcount == 0:
+                missing.append(row)
+        if missing:
+            db.session.execute(table.insert(), [{
+                "model_id": row["b_model_id"],
+                "request_count": row["b_requests"],
+                "sentence_count": row["b_sentences"],
+                "last_access": row["b_last_access"],
+            } for row in missing])
+        db.session.commit()
+        return len(ids)
+
+    @classmethod
+    def top(cls, limit, by="requests"):
+        """
+        The most used models. Models never used rank last, most
+        recently stored first.
+
+        `by`:
+            one of `BY`
+
+        returns:
+            - list of (MarkovModel, ModelUsage or None)
+        """
+        column = cls.BY[by]
+        return (db.session.query(MarkovModel, cls)
+                .outerjoin(cls, cls.model_id == MarkovModel.id)
+                .options(db.joinedload(MarkovModel.owner))
+                .order_by(column.is_(None), column.desc(), MarkovModel.id.desc())
+                .limit(limit).all())
+
+    def to_dict(self):
+        return {
+            "requests": self.request_count,
+            "sentences": self.sentence_count,
+            "last_access": self.last_access.isoformat() + "Z"
+                if self.last_access else None,
+        }
+
+class JobRecord(db.Model):
+    """
+    Status of a job run by `jobs.JobQueue`, so any worker process
+    can report on a job another one accepted (see
+    `jobs.DatabaseStore`)
+
+    `progress`, `result`: dict
+        as reported by the job, stored as JSON
+
+    `created`, `finished`: float
+        UNIX timestamps
+    """
+    __tablename__ = 'job_record'
+    id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(16), nullable=False)
+    progress = db.Column(db.JSON, nullable=False, default=dict)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    created = db.Column(db.Float, nullable=False, index=True)
+    finished = db.Column(db.Float)
+
+    @classmethod
+    def save(cls, job, history=None):
         """
-        raw_model = json.loads(self.model_serialized)
-        # Next line removes outermost list, and changes keys from
-        # lists to tuples (to match original model structure)
-        self.model = {tuple(pair[0]):pair[1] for pair in raw_model}
+        Writes the status of `job` and commits
+
+        `history`:
+            if given, only the `history` most recent jobs are kept
+        """
+        try:
+            record = cls.query.get(job.id) or cls(id=job.id)
+            record.status = job.status
+            record.progress = dict(job.progress)
+            record.result = job.result
+            record.error = job.error
+            record.created = job.created
+            record.finished = job.finished
+            db.session.add(record)
+            if history is not None:
+                db.session.flush()
+                stale = (db.session.query(cls.id)
+                         .order_by(cls.created.desc(), cls.id)
+                         .offset(history).subquery())
+                cls.query.filter(cls.id.in_(stale)).delete(
+                    synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    @classmethod
+    def fail_unfinished(cls, before, error):
+        """
+        Marks jobs created before `before` (a UNIX timestamp) that
+        are still "queued" or "running" as failed, and commits
+
+        returns:
+            - number of jobs marked failed
+        """
+        try:
+            failed = cls.query.filter(
+                cls.status.in_(("queued", "running")),
+                cls.created < before,
+            ).update({
+                cls.status: "failed",
+                cls.error: error,
+                cls.finished: time.time(),
+            }, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return failed
+
+    def to_job(self):
+        """returns: a `jobs.Job` with the stored status"""
+        job = Job(self.id)
+        job.status = self.status
+        job.progress.update(self.progress or {})
+        job.result = self.result
+        job.error = self.error
+        job.created = self.created
+        job.finished = self.finished
+        return job
+
 
 ###############################################################
 # Helper Functions                                            #
 ###############################################################
 
+def _transitions(model):
+    """returns: number of (state, word) transitions in `model`"""
+    return sum(len(follows) for follows in model.values())
+
+
+def _prune(follows, min_count, top_k=None):
+    """
+    returns: `follows` without words seen fewer than `min_count`
+    times or outside the `top_k` most frequent, keeping at least
+    the most frequent word (and the original order)
+    """
+    ranked = sorted(follows, key=follows.get, reverse=True)
+    kept = [word for word in ranked if follows[word] >= min_count] or ranked[:1]
+    if top_k is not None:
+        kept = kept[:max(top_k, 1)]
+    if len(kept) == len(follows):
+        return follows
+    kept = set(kept)
+    return {word: count for word, count in follows.items() if word in kept}
+
+@event.listens_for(MarkovModel, 'after_update')
+@event.listens_for(MarkovModel, 'after_delete')
+def invalidate_cached_model(mapper, connection, target):
+    """Drop cached copies of a model when its row is rewritten"""
+    for engine in MarkovModel.ENGINES:
+        model_cache.invalidate((target.id, target.model_name, engine))
+    response_cache.invalidate_model(target.model_name)
+
+
+def _account(connection, owner_id, models, states, nbytes):
+    """Adds to the counters of `owner_id` within the flush"""
+    if owner_id is None:
+        return
+    users = User.__table__
+    connection.execute(users.update().where(users.c.id == owner_id).values(
+        model_count=users.c.model_count + models,
+        stored_states=users.c.stored_states + states,
+        stored_bytes=users.c.stored_bytes + nbytes))
+
+
+def _previous(target, name):
+    """Value of attribute `name` before the flush"""
+    history = inspect(target).attrs[name].history
+    return (history.deleted or history.unchanged or [None])[0]
+
+
+@event.listens_for(MarkovModel, 'after_insert')
+def account_inserted_model(mapper, connection, target):
+    _account(connection, target.owner_id,
+             1, target.stored_states, target.model_bytes or 0)
+
+
+@event.listens_for(MarkovModel, 'after_update')
+def account_updated_model(mapper, connection, target):
+    owner_id = _previous(target, 'owner_id')
+    states = max(int(_previous(target, 'model_size') or 0), 0)
+    nbytes = _previous(target, 'model_bytes') or 0
+    if (owner_id, states, nbytes) == (
+            target.owner_id, target.stored_states, target.model_bytes):
+        return
+    _account(connection, owner_id, -1, -states, -nbytes)
+    _account(connection, target.owner_id,
+             1, target.stored_states, target.model_bytes or 0)
+
+
+@event.listens_for(MarkovModel, 'after_delete')
+def account_deleted_model(mapper, connection, target):
+    _account(connection, target.owner_id,
+             -1, -target.stored_states, -(target.model_bytes or 0))
+
+
+@event.listens_for(MarkovModel, 'after_delete')
+def remove_model_files(mapper, connection, target):
+    """Remove the exported files of a deleted model"""
+    if has_app_context():
+        mapped.remove_files(current_app.config['MODEL_FILES_DIR'], target.id)
+
+
+@event.listens_for(MarkovModel, 'after_delete')
+def remove_model_usage(mapper, connection, target):
+    """Drop the access counters of a deleted model"""
+    usage = ModelUsage.__table__
+    connection.execute(usage.delete().where(usage.c.model_id == target.id))
+
+
 @login_manager.user_loader
 def user_loader(user_id):
     try:
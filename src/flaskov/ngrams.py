@@ -0,0 +1,187 @@
+import heapq
+from array import array
+from bisect import bisect_left
+from collections.abc import ItemsView, MutableMapping
+from operator import itemgetter
+
+
+###############################################################
+# Packed N-gram Store                                         #
+###############################################################
+
+_MISSING = object()
+
+
+class NgramStore(MutableMapping):
+    """
+    Dict-like store mapping state tuples to values, with the keys
+    packed into 64-bit integers of word ids
+
+    Words are interned once in `vocabulary`, and every state of up
+    to `max_order` words becomes a single integer, so a key costs
+    8 bytes whatever its order (a tuple key costs a tuple plus a
+    hash table slot). Packed keys are kept in a sorted array and
+    found with a binary search. New keys collect in a small dict
+    that is merged into the array once it grows past half its
+    size, keeping inserts amortized O(log n).
+
+    Each word gets (64 - bits of `max_order`) // `max_order` bits
+    of the key: 63 bits at order 1, 31 at order 2 and 20 at order
+    3, so about 1M distinct words fit at order 3. A vocabulary
+    past that widens the keys (see `_widen()`): they are repacked
+    once into a sorted list of Python ints, about 40 bytes a key
+    instead of 8, still well under a tuple key.
+
+    Used as a drop-in replacement for the `model` dict of a
+    `MarkovModel` (see `MarkovModel.STORES`, store "packed").
+
+    `vocabulary`: dict
+        maps each word to its id
+
+    `words`: list
+        maps each id back to its word
+    """
+    MERGE_MIN = 1024
+    KEY_BITS = 64
+
+    def __init__(self, items=(), max_order=3):
+        """
+        `items`:
+            mapping or iterable of (state, value) pairs
+
+        `max_order`:
+            longest state that will be stored
+        """
+        self.vocabulary = {}
+        self.words = []
+        self._max_order = max_order
+        self._length_bits = max_order.bit_length()
+        self._word_bits = (self.KEY_BITS - self._length_bits) // max_order
+        self._keys = self._new_keys()
+        self._values = []
+        self._pending = {}
+        self.update(items)
+
+    def _pack(self, state, create=False):
+        vocabulary = self.vocabulary
+        if create:
+            # interned before packing: a new word may widen the keys
+            for word in state:
+                if word not in vocabulary:
+                    self._intern(word)
+        packed = 0
+        for word in state:
+            word_id = vocabulary.get(word)
+            if word_id is None:
+                raise KeyError(state)
+            packed = (packed << self._word_bits) | word_id
+        return (packed << self._length_bits) | len(state)
+
+    def _unpack(self, packed):
+        length = packed & ((1 << self._length_bits) - 1)
+        packed >>= self._length_bits
+        mask = (1 << self._word_bits) - 1
+        ids = []
+        for _ in range(length):
+            ids.append(packed & mask)
+            packed >>= self._word_bits
+        words = self.words
+        return tuple([words[i] for i in reversed(ids)])
+
+    def _intern(self, word):
+        word_id = len(self.words)
+        if word_id >> self._word_bits:
+            self._widen(max(2 * self._word_bits, word_id.bit_length()))
+        self.vocabulary[word] = word_id
+        self.words.append(word)
+        return word_id
+
+    def _new_keys(self):
+        """returns: empty key storage for the current key width"""
+        if self._length_bits + self._max_order * self._word_bits <= self.KEY_BITS:
+            return array('Q')
+        return []
+
+    def _widen(self, word_bits):
+        """
+        Repacks every key with `word_bits` bits per word. Keys
+        wider than 64 bits are kept in a list of Python ints.
+        """
+        states = [(self._unpack(packed), value)
+                  for packed, value in self._iter_packed()]
+        self._word_bits = word_bits
+        repacked = sorted(((self._pack(state), value) for state, value in states),
+                          key=itemgetter(0))
+        self._keys = self._new_keys()
+        self._keys.extend(packed for packed, _ in repacked)
+        self._values = [value for _, value in repacked]
+        self._pending = {}
+
+    def _find(self, packed):
+        index = bisect_left(self._keys, packed)
+        if index < len(self._keys) and self._keys[index] == packed:
+            return index
+        return -1
+
+    def __getitem__(self, state):
+        packed = self._pack(state)
+        value = self._pending.get(packed, _MISSING)
+        if value is not _MISSING:
+            return value
+        index = self._find(packed)
+        if index < 0:
+            raise KeyError(state)
+        return self._values[index]
+
+    def __setitem__(self, state, value):
+        packed = self._pack(state, create=True)
+        index = self._find(packed) if packed not in self._pending else -1
+        if index >= 0:
+            self._values[index] = value
+            return
+        self._pending[packed] = value
+        if len(self._pending) > max(self.MERGE_MIN, len(self._keys) // 2):
+            self._merge()
+
+    def __delitem__(self, state):
+        packed = self._pack(state)
+        if self._pending.pop(packed, _MISSING) is not _MISSING:
+            return
+        index = self._find(packed)
+        if index < 0:
+            raise KeyError(state)
+        del self._keys[index]
+        del self._values[index]
+
+    def __len__(self):
+        return len(self._keys) + len(self._pending)
+
+    def __iter__(self):
+        for packed, _ in self._iter_packed():
+            yield self._unpack(packed)
+
+    def items(self):
+        return _StoreItems(self)
+
+    def _iter_packed(self):
+        """yields: (packed key, value) in key order"""
+        return heapq.merge(
+            zip(self._keys, self._values),
+            sorted(self._pending.items(), key=itemgetter(0)),
+            key=itemgetter(0))
+
+    def _merge(self):
+        keys = self._new_keys()
+        values = []
+        for packed, value in self._iter_packed():
+            keys.append(packed)
+            values.append(value)
+        self._keys, self._values, self._pending = keys, values, {}
+
+
+class _StoreItems(ItemsView):
+    """Items view that unpacks each key once, without lookups"""
+    def __iter__(self):
+        store = self._mapping
+        for packed, value in store._iter_packed():
+            yield store._unpack(packed), value
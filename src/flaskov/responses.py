@@ -0,0 +1,321 @@
+import functools
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, current_app, make_response, request
+
+
+###############################################################
+# Response Cache Backends                                     #
+###############################################################
+
+class MemoryBackend:
+    """
+    Per-worker LRU store of cached responses, bounded by number
+    of entries and total body bytes
+
+    Keys are tuples whose second item is the model name.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """returns: the entry dict stored under `key`, or None"""
+        with self._lock:
+            stored = self._entries.get(key)
+            if stored is None:
+                return None
+            if stored[2]["expires"] < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return stored[2]
+
+    def set(self, key, entry):
+        size = len(entry["body"])
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes or self.max_entries <= 0:
+                return
+            self._entries[key] = (key[1], size, entry)
+            self._bytes += size
+            while (len(self._entries) > self.max_entries
+                    or self._bytes > self.max_bytes):
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def invalidate_model(self, model_name):
+        """Drops every entry of `model_name`"""
+        with self._lock:
+            for key in [key for key, stored in self._entries.items()
+                        if stored[0] == model_name]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        stored = self._entries.pop(key, None)
+        if stored is not None:
+            self._bytes -= stored[1]
+
+
+class FileBackend:
+    """
+    Stores cached responses as JSON files in `directory`, so they
+    survive restarts and are shared by every worker on the host
+
+    Keys are tuples whose second item is the model name. Files
+    are named `<model hash>-<key hash>.json`, so all the entries
+    of a model can be found without reading them. When the
+    bounds are exceeded the least recently written files are
+    removed first.
+    """
+    SUFFIX = '.json'
+
+    def __init__(self, directory, max_entries, max_bytes):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        """returns: the entry dict stored under `key`, or None"""
+        path = self._path(key)
+        try:
+            with open(path) as stored:
+                entry = json.load(stored)
+        except (OSError, ValueError):
+            return None
+        if entry["expires"] < time.time():
+            self._unlink(path)
+            return None
+        return entry
+
+    def set(self, key, entry):
+        descriptor, temp_path = tempfile.mkstemp(
+            dir=self.directory, suffix='.tmp')
+        with os.fdopen(descriptor, 'w') as output:
+            json.dump(entry, output)
+        os.replace(temp_path, self._path(key))
+        self._evict()
+
+    def invalidate_model(self, model_name):
+        """Removes every entry of `model_name`"""
+        for path in glob.glob(os.path.join(
+                self.directory, _digest(model_name) + '-*' + self.SUFFIX)):
+            self._unlink(path)
+
+    def clear(self):
+        for path in self._files():
+            self._unlink(path)
+
+    def __len__(self):
+        return len(self._files())
+
+    def _path(self, key):
+        return os.path.join(self.directory, "{}-{}{}".format(
+            _digest(key[1]), _digest(key), self.SUFFIX))
+
+    def _files(self):
+        return glob.glob(os.path.join(self.directory, '*' + self.SUFFIX))
+
+    def _evict(self):
+        files = []
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        while files and (len(files) > self.max_entries or total > self.max_bytes):
+            _, size, path = files.pop(0)
+            total -= size
+            self._unlink(path)
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _digest(value):
+    return hashlib.sha1(repr(value).encode('utf-8')).hexdigest()[:20]
+
+
+###############################################################
+# Response Cache                                              #
+###############################################################
+
+class ResponseCache:
+    """
+    HTTP-level cache of seeded generation responses
+
+    A seeded request always produces the same sentences from the
+    same model version, so its response is stored under
+    `(route, model_name, seed, count, engine, version)` and
+    repeated requests are answered from the cache without loading
+    the model: only its current version is looked up (an indexed
+    query by name, never the serialized model). Responses carry an
+    `ETag` derived from the key and a `Cache-Control` max-age of
+    the TTL; a matching `If-None-Match` gets an empty 304.
+
+    A model rewritten by any process has a new version, so its old
+    entries are never served again and simply age out. Entries of
+    a model are also dropped when this process updates or deletes
+    it (see `models.invalidate_cached_model`).
+
+    Unseeded requests are random, so they are never cached and
+    are sent with `Cache-Control: no-store`.
+
+    Config:
+        - RESPONSE_CACHE_BACKEND: "memory", "file" or None to
+        disable the cache
+        - RESPONSE_CACHE_TTL: seconds an entry stays fresh
+        - RESPONSE_CACHE_MAX_ENTRIES
+        - RESPONSE_CACHE_MAX_BYTES
+        - RESPONSE_CACHE_DIR: directory of the "file" backend
+    """
+    DEFAULT_BACKEND = "memory"
+    DEFAULT_TTL = 300
+    DEFAULT_MAX_ENTRIES = 1024
+    DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.backend_name = None
+        self.ttl = self.DEFAULT_TTL
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_CACHE_BACKEND', self.DEFAULT_BACKEND)
+        app.config.setdefault('RESPONSE_CACHE_TTL', self.DEFAULT_TTL)
+        app.config.setdefault('RESPONSE_CACHE_MAX_ENTRIES', self.DEFAULT_MAX_ENTRIES)
+        app.config.setdefault('RESPONSE_CACHE_MAX_BYTES', self.DEFAULT_MAX_BYTES)
+        app.config.setdefault('RESPONSE_CACHE_DIR',
+            os.path.join(app.instance_path, 'response_cache'))
+        self.ttl = app.config['RESPONSE_CACHE_TTL']
+        max_entries = app.config['RESPONSE_CACHE_MAX_ENTRIES']
+        max_bytes = app.config['RESPONSE_CACHE_MAX_BYTES']
+        backend = self.backend_name = app.config['RESPONSE_CACHE_BACKEND']
+        if backend == "memory":
+            self.backend = MemoryBackend(max_entries, max_bytes)
+        elif backend == "file":
+            self.backend = FileBackend(
+                app.config['RESPONSE_CACHE_DIR'], max_entries, max_bytes)
+        elif backend is None:
+            self.backend = None
+        else:
+            raise ValueError("Unknown RESPONSE_CACHE_BACKEND {!r}".format(backend))
+        app.extensions['response_cache'] = self
+        self.hits = self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def cached(self, version, on_hit=None):
+        """
+        Decorates a view returning a JSON dict, caching its
+        responses to seeded requests
+
+        `version`:
+            callable taking the model name and returning the
+            model's current version, or None if there's no such
+            model. called on every seeded request, so it should
+            be cheap.
+
+        `on_hit`:
+            optional callable taking the model name, called when
+            a response is served from the cache (the view isn't)
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                seed = request.values.get("seed")
+                if not self.enabled or seed is None:
+                    response = make_response(view(*args, **kwargs))
+                    response.headers["Cache-Control"] = "no-store"
+                    return response
+
+                model_name = request.values.get("model_name")
+                model_version = version(model_name)
+                if model_version is None:
+                    return view(*args, **kwargs)
+                key = (request.path, model_name, seed,
+                       request.values.get("count", "1"),
+                       current_app.config["SENTENCE_ENGINE"], model_version)
+                entry = self.backend.get(key)
+                if entry is not None:
+                    self.hits += 1
+                    if on_hit is not None:
+                        on_hit(model_name)
+                    return self._respond(entry, "HIT")
+
+                self.misses += 1
+                result = view(*args, **kwargs)
+                if "error_message" in result:
+                    return result
+                entry = {
+                    "body": json.dumps(result),
+                    "etag": _digest(key),
+                    "expires": time.time() + self.ttl,
+                }
+                self.backend.set(key, entry)
+                return self._respond(entry, "MISS")
+            return wrapper
+        return decorator
+
+    def _respond(self, entry, status):
+        max_age = max(0, int(entry["expires"] - time.time()))
+        if entry["etag"] in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(entry["body"], mimetype="application/json")
+        response.set_etag(entry["etag"])
+        response.headers["Cache-Control"] = "public, max-age={}".format(max_age)
+        response.headers["X-Cache"] = status
+        return response
+
+    def invalidate_model(self, model_name):
+        if self.enabled:
+            self.backend.invalidate_model(model_name)
+
+    def clear(self):
+        if self.enabled:
+            self.backend.clear()
+
+    def stats(self):
+        """
+        returns:
+            - dict of hit/miss counters and stored entries
+        """
+        return {
+            "backend": self.backend_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.backend) if self.enabled else 0,
+        }
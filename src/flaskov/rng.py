@@ -0,0 +1,59 @@
+import os
+import random
+import threading
+
+
+###############################################################
+# Random Number Streams                                       #
+###############################################################
+
+_local = threading.local()
+
+
+def thread_rng():
+    """
+    The calling thread's own `random.Random`, seeded from the OS
+    the first time it is used in each thread (and again after a
+    fork), so threads and worker processes never share or contend
+    on one generator state
+
+    returns:
+        - random.Random
+    """
+    pid = os.getpid()
+    if getattr(_local, "pid", None) != pid:
+        _local.rng = random.Random(os.urandom(16))
+        _local.pid = pid
+    return _local.rng
+
+
+def normalize_seed(seed):
+    """
+    Seeds arrive as ints or as strings from request values. Whole
+    number strings are turned into ints, so "42" and 42 seed the
+    same stream.
+
+    returns:
+        - int, string or None
+    """
+    if isinstance(seed, str):
+        stripped = seed.strip()
+        if stripped.lstrip("-").isdigit():
+            return int(stripped)
+    return seed
+
+
+def make_rng(seed=None):
+    """
+    `seed`:
+        int or string. the same seed always gives the same
+        stream, in every thread and process. None for the
+        thread's unseeded stream (see `thread_rng()`)
+
+    returns:
+        - random.Random
+    """
+    seed = normalize_seed(seed)
+    if seed is None:
+        return thread_rng()
+    return random.Random(seed)
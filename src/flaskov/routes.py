@@ -1,3 +1,6 @@
+import json
+import pathlib
+
 from flask import (
     Blueprint, 
     render_template, 
@@ -8,6 +11,8 @@ from flask import (
     abort,
     session,
     jsonify,
+    current_app,
+    Response,
 )
 from flask_login import (
     login_user, 
@@ -18,10 +23,13 @@ from flask_login import (
 from werkzeug.security import generate_password_hash, check_password_hash
 from jinja2 import TemplateNotFound
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 
-from .models import User, MarkovModel
-from .forms import LoginForm, RegisterForm, ModelFromCorpusForm
-from . import db
+from .models import User, MarkovModel, ModelUsage
+from .forms import LoginForm, RegisterForm, ModelFromCorpusForm, AppendCorpusForm
+from . import (
+    db, metrics, model_cache, job_queue, preloader, response_cache, tasks,
+    usage_tracker)
 
 
 ###############################################################
@@ -42,6 +50,26 @@ def about():
     return render_template("about.html")
 
 
+@main.route("/metrics")
+def prometheus_metrics():
+    """
+    Timing histograms and request counters of this worker in the
+    Prometheus text format (see `instrumentation.Metrics`)
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@main.route("/ready")
+def ready():
+    """
+    Readiness probe: 200 once the models configured for preloading
+    are loaded (see `warmup.Preloader`), 503 until then. JSON
+    response with `ready`, the preloaded `models` and `seconds`
+    """
+    status = preloader.status()
+    return status, 200 if status["ready"] else 503
+
+
 ###############################################################
 # Auth Blueprint                                              #
 ###############################################################
@@ -128,37 +156,343 @@ def generate_model():
     if name not taken:
         - generate model, commit to DB, and return 
         JSON response with `model_name` & `model_size`
+    if the request has a truthy `async` value:
+        - queue the build and return JSON response with 
+        `job_id` right away (see `model_job`)
+
+    models built by a logged in user are owned by them, and
+    the build fails with `error_message` if it would take them
+    over their quota (see `User.quota_error`)
     """
-    form = ModelFromCorpusForm(request.form)
+    form = ModelFromCorpusForm()
     if form.validate_on_submit():
-        if MarkovModel.query.filter_by(model_name=form.name.data).first():
+        with metrics.timer("query"):
+            name_taken = MarkovModel.name_taken(form.name.data)
+        if name_taken:
             return {"error_message": "That Model name is taken. Try another!"}
 
-        model = MarkovModel(
-            corpus=form.corpus.data, 
+        owner = current_user if current_user.is_authenticated else None
+        error_message = owner and owner.quota_error(models=1)
+        if error_message:
+            return {"error_message": error_message}
+
+        if request.values.get("async"):
+            return queue_model_build(form, owner), 202
+
+        model = MarkovModel.from_source(
+            form.corpus_source(),
             name=form.name.data,
-            order=int(form.order.data))
+            order=int(form.order.data),
+            backoff=form.backoff.data)
+        compaction = MarkovModel.build_compaction()
+        if compaction:
+            model.compact(**compaction)
+        error_message = owner and owner.quota_error(
+            models=1, states=model.stored_states, nbytes=model.model_bytes)
+        if error_message:
+            return {"error_message": error_message}
+        model.owner = owner
         db.session.add(model)
-        db.session.commit()
+        with metrics.timer("commit", model.model_order):
+            db.session.commit()
+        model.export_if_mapped()
         session["model_id"] = model.id
         return {
             "model_name": model.model_name,
             "model_size": model.model_size,
         }
     return {"error_message": "Oops! Looks like something went wrong."}
+
+
+def queue_model_build(form, owner=None):
+    """
+    Queues a model build for `form` on the job queue. Uploaded
+    files are spooled to JOB_SPOOL_DIR first, since the upload
+    stream closes when the request ends.
+
+    returns:
+        - dict with `job_id` & `status`
+    """
+    source, cleanup_path = form.corpus.data, None
+    if form.corpus_file.data:
+        cleanup_path = job_queue.spool(form.corpus_file.data.stream)
+        source = pathlib.Path(cleanup_path)
+
+    job = job_queue.submit(
+        tasks.build_model, source, form.name.data, int(form.order.data),
+        form.backoff.data, cleanup_path, owner.id if owner else None)
+    return {"job_id": job.id, "status": job.status}
+
+
+@markov.route("/model_jobs/<job_id>", methods=['GET'])
+def model_job(job_id):
+    """
+    returns JSON response with the `status` and `progress` of a
+    queued model build, plus its `result` (`model_name` &
+    `model_size`) once finished
+    """
+    job = job_queue.get(job_id)
+    if not job:
+        return {"error_message": "There's no job with that id!"}, 404
+    return job.to_dict()
+
+
+@markov.route("/append_corpus", methods=['POST'])
+def append_corpus():
+    """
+    Adds more text to an existing model
+
+    if no model has that name, it belongs to someone else, the
+    new text would take its owner over their quota, or another
+    request rewrote the model meanwhile:
+        - return `error_message` JSON response
+    otherwise:
+        - merge the new text into the model, commit once, and
+        return JSON response with `model_name` & `model_size`
+    """
+    form = AppendCorpusForm()
+    if form.validate_on_submit():
+        with metrics.timer("query"):
+            model = MarkovModel.query.filter_by(model_name=form.name.data).first()
+        if not model:
+            return {"error_message": "There's no model with that name!"}
+        owner = model.owner
+        if owner and owner.id != current_user.get_id():
+            return {"error_message": "That model belongs to someone else!"}
+
+        states, nbytes = model.stored_states, model.model_bytes
+        model.append_corpus(form.corpus_source())
+        error_message = owner and owner.quota_error(
+            states=model.stored_states - states,
+            nbytes=model.model_bytes - nbytes)
+        if error_message:
+            db.session.rollback()
+            return {"error_message": error_message}
+        try:
+            with metrics.timer("commit", model.model_order):
+                db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            return {"error_message":
+                "That model was changed while appending, please try again!"}
+        model.export_if_mapped()
+        return {
+            "model_name": model.model_name,
+            "model_size": model.model_size,
+        }
+    return {"error_message": "Oops! Looks like something went wrong."}
     
 
+def requested_count(limit):
+    """
+    returns: the `count` request value capped to 1..`limit` config,
+    raises ValueError if it isn't a whole number
+    """
+    count = int(request.values.get("count", 1))
+    return max(1, min(count, current_app.config[limit]))
+
+
+def record_cached_sentences(model_name):
+    """
+    Counts a `generate_sentences` response served by the response
+    cache as model usage, with the sentence count of a miss
+    """
+    try:
+        sentences = requested_count("MAX_SENTENCES_PER_REQUEST")
+    except ValueError:
+        sentences = 1
+    usage_tracker.record(model_name, sentences)
+
+
 @markov.route("/generate_sentence", methods=['GET'])
+@response_cache.cached(version=MarkovModel.version_of, on_hit=usage_tracker.record)
 def generate_sentence():
     #import pdb; pdb.set_trace()
     try: # if "model_name" is not in request.values, this block throws a TypeError
         model_name = request.values.get("model_name")
-        model = MarkovModel.query.filter_by(model_name=model_name).first()
-        sentence = model.generate() if model else None
+        with metrics.timer("query"):
+            model = MarkovModel.query.filter_by(model_name=model_name).first()
+        seed = request.values.get("seed")
+        sentence = model.generate(
+            seed=seed, engine=current_app.config["SENTENCE_ENGINE"]
+        ) if model else None
     except:
         error_message = "Oops! Looks like something went wrong."
 
     if sentence: 
+        usage_tracker.record(model.model_name)
         return {"sentence": sentence}
     return {"error_message": error_message}
 
+
+
+@markov.route("/generate_sentences", methods=['GET'])
+@response_cache.cached(version=MarkovModel.version_of, on_hit=record_cached_sentences)
+def generate_sentences():
+    """
+    Generates `count` sentences from one model in a single response
+
+    `count` is capped at MAX_SENTENCES_PER_REQUEST. An optional
+    `seed` makes the output reproducible. SENTENCE_ENGINE picks
+    the compiled form of the model used to generate them.
+
+    returns JSON response with `sentences` & `count`, or
+    `error_message` if the model doesn't exist
+    """
+    model_name = request.values.get("model_name")
+    seed = request.values.get("seed")
+    try:
+        count = requested_count("MAX_SENTENCES_PER_REQUEST")
+    except ValueError:
+        return {"error_message": "Count must be a whole number."}
+
+    with metrics.timer("query"):
+        model = MarkovModel.query.filter_by(model_name=model_name).first()
+    if not model:
+        return {"error_message": "Oops! Looks like something went wrong."}
+
+    sentences = model.generate_many(
+        count, seed=seed, engine=current_app.config["SENTENCE_ENGINE"])
+    usage_tracker.record(model.model_name, len(sentences))
+    return {"sentences": sentences, "count": len(sentences)}
+
+
+@markov.route("/stream_sentences", methods=['GET'])
+def stream_sentences():
+    """
+    Streams `count` sentences from one model as they are 
+    generated, so the first one arrives right away and memory
+    doesn't grow with the output
+
+    `count` is capped at MAX_STREAMED_SENTENCES. `seed` works
+    as in `generate_sentences`. Sentences are sent as NDJSON 
+    (one `{"sentence": ...}` object per line), or as server-sent
+    events with `format=sse` (or `Accept: text/event-stream`),
+    followed by an `end` event.
+
+    returns `error_message` JSON response if the model doesn't
+    exist
+    """
+    model_name = request.values.get("model_name")
+    seed = request.values.get("seed")
+    try:
+        count = requested_count("MAX_STREAMED_SENTENCES")
+    except ValueError:
+        return {"error_message": "Count must be a whole number."}
+
+    with metrics.timer("query"):
+        model = MarkovModel.query.filter_by(model_name=model_name).first()
+    if not model:
+        return {"error_message": "Oops! Looks like something went wrong."}
+
+    usage_tracker.record(model.model_name, count)
+    sentences = model.stream(
+        count, seed=seed, engine=current_app.config["SENTENCE_ENGINE"])
+    if (request.values.get("format") == "sse" or
+            request.accept_mimetypes.best == "text/event-stream"):
+        return Response(
+            sse_events(sentences), mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    return Response(
+        (json.dumps({"sentence": sentence}) + "\n" for sentence in sentences),
+        mimetype="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+
+def sse_events(sentences):
+    """yields: a server-sent event per sentence, then an `end` event"""
+    count = 0
+    for sentence in sentences:
+        count += 1
+        yield "data: {}\n\n".format(json.dumps({"sentence": sentence}))
+    yield "event: end\ndata: {}\n\n".format(json.dumps({"count": count}))
+
+
+@markov.route("/models", methods=['GET'])
+def list_models():
+    """
+    Lists stored models by name, one page at a time
+
+    `page` starts at 1. `per_page` defaults to MODELS_PER_PAGE
+    and is capped at MAX_MODELS_PER_PAGE. An `owner` username
+    lists only that user's models. Only metadata columns are 
+    queried, never the serialized models.
+
+    returns JSON response with `models` (name, size, order, 
+    version and owner of each), `page`, `pages` & `total`
+    """
+    try:
+        page = int(request.values.get("page", 1))
+        per_page = int(request.values.get(
+            "per_page", current_app.config["MODELS_PER_PAGE"]))
+    except ValueError:
+        return {"error_message": "Page and per_page must be whole numbers."}
+
+    query = MarkovModel.query.options(db.joinedload(MarkovModel.owner))
+    owner = request.values.get("owner")
+    if owner:
+        query = query.join(MarkovModel.owner).filter(User.username == owner)
+    pagination = query.order_by(MarkovModel.model_name).paginate(
+        page=max(page, 1), per_page=max(per_page, 1), error_out=False,
+        max_per_page=current_app.config["MAX_MODELS_PER_PAGE"])
+    return {
+        "models": [model.summary() for model in pagination.items],
+        "page": pagination.page,
+        "per_page": pagination.per_page,
+        "pages": pagination.pages,
+        "total": pagination.total,
+    }
+
+
+@markov.route("/models/top", methods=['GET'])
+def top_models():
+    """
+    Lists the most used models, to see which are worth caching,
+    preloading or compacting
+
+    `by` is one of "requests" (default), "sentences" or
+    "last_access". `limit` defaults to MODELS_PER_PAGE and is
+    capped at MAX_MODELS_PER_PAGE. This worker's buffered counts
+    are flushed first; other workers' show up after their next
+    flush (see `usage.UsageTracker`).
+
+    returns JSON response with `models` (the `/models` metadata
+    plus `usage`: requests, sentences & last_access) & `by`
+    """
+    by = request.values.get("by", "requests")
+    if by not in ModelUsage.BY:
+        return {"error_message": "By must be one of {}.".format(
+            ", ".join(ModelUsage.BY))}
+    try:
+        limit = int(request.values.get(
+            "limit", current_app.config["MODELS_PER_PAGE"]))
+    except ValueError:
+        return {"error_message": "Limit must be a whole number."}
+    limit = max(1, min(limit, current_app.config["MAX_MODELS_PER_PAGE"]))
+
+    usage_tracker.flush()
+    return {
+        "models": [
+            dict(model.summary(), usage=counters.to_dict() if counters else None)
+            for model, counters in ModelUsage.top(limit, by)],
+        "by": by,
+    }
+
+
+@markov.route("/usage", methods=['GET'])
+@login_required
+def usage():
+    """
+    returns JSON response with the logged in user's stored
+    model count, states & bytes, and their quotas
+    """
+    return current_user.usage()
+
+
+@markov.route("/cache_stats", methods=['GET'])
+def cache_stats():
+    """
+    returns JSON response with the hit/miss/eviction counters
+    and current usage of this worker's model cache, and the
+    counters of the response cache under `responses`
+    """
+    return dict(model_cache.stats(), responses=response_cache.stats())
@@ -0,0 +1,69 @@
+import os
+
+from . import db
+from .models import MarkovModel, QuotaError, User
+
+
+###############################################################
+# Background Tasks                                            #
+###############################################################
+
+def build_model(job, source, name, order, backoff=False, cleanup_path=None,
+                owner_id=None):
+    """
+    Builds and commits a model on the job queue, reporting the 
+    build stage and sentences processed in `job.progress`
+
+    `source`:
+        corpus text, or a path to a corpus file
+
+    `cleanup_path`:
+        optional temporary file deleted once the build is done
+        (uploads are spooled to disk before the request ends)
+
+    `owner_id`:
+        optional id of the User owning the model. the build
+        fails with a QuotaError if it would exceed their quota
+
+    returns:
+        - dict with `model_name` & `model_size`
+    """
+    try:
+        job.progress["stage"] = "counting"
+        report = lambda added: job.progress.update(sentences=added)
+        model = MarkovModel(order=order, name=name, backoff=backoff)
+        model.add_corpus(source, progress=report)
+
+        job.progress["stage"] = "serializing"
+        model.serialize()
+
+        compaction = MarkovModel.build_compaction()
+        if compaction:
+            job.progress["stage"] = "compacting"
+            job.progress["compaction"] = model.compact(**compaction)
+
+        owner = User.query.get(owner_id) if owner_id is not None else None
+        error_message = owner and owner.quota_error(
+            models=1, states=model.stored_states, nbytes=model.model_bytes)
+        if error_message:
+            raise QuotaError(error_message)
+
+        job.progress["stage"] = "committing"
+        model.owner = owner
+        db.session.add(model)
+        db.session.commit()
+
+        job.progress["stage"] = "exporting"
+        model.export_if_mapped()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if cleanup_path:
+            os.unlink(cleanup_path)
+
+    job.progress["stage"] = "done"
+    return {
+        "model_name": model.model_name,
+        "model_size": model.model_size,
+    }
@@ -0,0 +1,173 @@
+import functools
+import re
+
+from .corpus import CHUNK_SIZE, iter_chunks
+
+
+###############################################################
+# Tokenizer                                                   #
+###############################################################
+
+SEGMENTATIONS = ("sentences", "lines", "legacy")
+
+# followed by '.', these don't end a sentence
+ABBREVIATIONS = (
+    "Mr", "Mrs", "Ms", "Dr", "Prof", "Sr", "Jr", "St", "Mt", "vs",
+    "e.g", "i.e", "cf", "No", "Fig", "Inc", "Ltd", "Co",
+)
+
+
+def _not_after(words):
+    """
+    returns: lookbehinds failing right after any of `words` and
+    '.', one per word length (lookbehinds must be fixed width)
+    """
+    lengths = {}
+    for word in words:
+        lengths.setdefault(len(word), []).append(re.escape(word))
+    return "".join(r"(?<!\b(?:{})\.)".format("|".join(alternatives))
+                   for _, alternatives in sorted(lengths.items()))
+
+
+_END = r"[.!?]*[\"')\]]*\s+"
+
+# one group per pattern: the punctuation ending the sentence.
+# patterns start with a single character class and check the
+# context with lookarounds, which `re` scans for far faster than
+# alternations
+BOUNDARIES = {
+    # '.', '!' or '?' (plus more of them and closing quotes or
+    # brackets) before whitespace, except after an abbreviation or
+    # an initial ("J. R. R."), and blank lines
+    "sentences": (
+        r"([.!?\n])(?:(?<=\.)(?<!\b[A-Z]\.)" + _not_after(ABBREVIATIONS) + _END
+        + r"|(?<=[!?])" + _END + r"|(?<=\n)\s*\n\s*)"),
+    # every line is a sentence, with or without end punctuation
+    "lines": r"([.!?]?)[.!?]*[\"')\]]*[ \t\r\f\v]*\n\s*",
+    # the historical `corpus.split('. ')`
+    "legacy": r"(\.) ",
+}
+
+# words (with inner apostrophes/hyphens) or single punctuation marks
+WORD = re.compile(r"\w+(?:['’-]\w+)*|[^\w\s]")
+
+
+class Tokenizer:
+    """
+    Splits a corpus into sentences of words in one pass, using
+    precompiled regexes
+
+    Sentences are split with a single `re.split` over each chunk
+    of text and words with `str.split()` (or one `re.findall`
+    when keeping punctuation), so the per-word work all happens in
+    C. Sources are streamed with `corpus.iter_chunks()`: only one
+    chunk plus one unfinished sentence is held in memory.
+
+    `segmentation`: string
+        one of `SEGMENTATIONS`:
+            - "sentences": ends sentences at '.', '!' and '?'
+            (skipping abbreviations like "Mr.") and blank lines
+            - "lines": one sentence per line
+            - "legacy": only at '. ', like models built before
+            tokenizers existed
+
+    `lowercase`: bool
+        lowercase every word, so "The" and "the" share states
+
+    `punctuation`: bool
+        keep punctuation as tokens of its own ("it's", ",",
+        "fine", "!") instead of splitting on whitespace only.
+        sentence ending punctuation becomes the last word.
+    """
+    __slots__ = ('segmentation', 'lowercase', 'punctuation', '_boundary')
+
+    def __init__(self, segmentation="sentences", lowercase=False,
+                 punctuation=False):
+        if segmentation not in BOUNDARIES:
+            raise ValueError("Unknown segmentation {!r}".format(segmentation))
+        self.segmentation = segmentation
+        self.lowercase = lowercase
+        self.punctuation = punctuation
+        self._boundary = re.compile(BOUNDARIES[segmentation])
+
+    def __repr__(self):
+        return "Tokenizer({!r}, lowercase={}, punctuation={})".format(
+            self.segmentation, self.lowercase, self.punctuation)
+
+    def sentences(self, source, chunk_size=CHUNK_SIZE):
+        """
+        `source`:
+            corpus text or a streamed source, see
+            `corpus.iter_chunks()`
+
+        yields:
+            - list of words
+        """
+        split = self._boundary.split
+        pending = ''
+        for chunk in iter_chunks(source, chunk_size):
+            if not chunk:
+                continue
+            pending += chunk
+            parts = split(pending)
+            pending = parts.pop()
+            yield from self._words(parts[::2], parts[1::2])
+        yield from self._words([pending], [None])
+
+    def _words(self, sentences, ends):
+        """yields: word lists of `sentences`, mapped in C"""
+        if self.punctuation:
+            sentences = map(self.words, sentences, ends)
+        else:
+            if self.lowercase:
+                sentences = map(str.lower, sentences)
+            sentences = map(str.split, sentences)
+        # the legacy split keeps empty sentences, as before
+        if self.segmentation == "legacy":
+            return sentences
+        return filter(None, sentences)
+
+    def words(self, sentence, end=None):
+        """
+        `sentence`:
+            text of one sentence, without its ending punctuation
+
+        `end`:
+            the character ending the sentence, kept as the last
+            token when `punctuation` is set
+
+        returns:
+            - list of words
+        """
+        if self.lowercase:
+            sentence = sentence.lower()
+        if not self.punctuation:
+            return sentence.split()
+        words = WORD.findall(sentence)
+        if end and not end.isspace():
+            words.append(end)
+        return words
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(segmentation="sentences", lowercase=False, punctuation=False):
+    """returns: shared `Tokenizer` for the given options"""
+    return Tokenizer(segmentation, lowercase, punctuation)
+
+
+def from_config(config):
+    """
+    The tokenizer configured for an app
+
+    Config:
+        - CORPUS_SEGMENTATION: one of `SEGMENTATIONS`
+        - CORPUS_LOWERCASE
+        - CORPUS_PUNCTUATION
+
+    returns:
+        - Tokenizer
+    """
+    return get_tokenizer(
+        config.get("CORPUS_SEGMENTATION", "sentences"),
+        bool(config.get("CORPUS_LOWERCASE", False)),
+        bool(config.get("CORPUS_PUNCTUATION", False)))
@@ -0,0 +1,118 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+
+from .models import MarkovModel
+from .tokenizer import get_tokenizer
+
+
+###############################################################
+# Parallel Training                                           #
+###############################################################
+
+SHARD_SIZE = 10000
+
+
+def iter_shards(source, shard_size=SHARD_SIZE, tokenizer=None):
+    """
+    Groups the sentences of a corpus into lists of `shard_size`
+
+    `tokenizer`:
+        `tokenizer.Tokenizer` splitting the corpus, defaults to
+        `tokenizer.get_tokenizer()`
+
+    yields:
+        - list of sentences (each a list of words)
+    """
+    sentences = (tokenizer or get_tokenizer()).sentences(source)
+    while True:
+        shard = list(islice(sentences, shard_size))
+        if not shard:
+            return
+        yield shard
+
+
+def count_shard(shard, order):
+    """
+    Counts the transitions of one shard of sentences, using the
+    same counting as `MarkovModel.add_sentence`
+
+    returns:
+        - dict of dicts. maps state tuples to {word: count}
+    """
+    model = MarkovModel(order=order)
+    for sentence in shard:
+        model._count_sentence(sentence)
+    return model.model
+
+
+def merge_counts(into, counts):
+    """
+    Adds the transition counts of `counts` into `into`. Counts
+    are additive, so merging shards in any order gives the same
+    model as counting all sentences sequentially.
+
+    returns:
+        - `into`
+    """
+    for state, follows in counts.items():
+        merged = into.get(state)
+        if merged is None:
+            into[state] = follows
+            continue
+        for word, count in follows.items():
+            merged[word] = merged.get(word, 0) + count
+    return into
+
+
+def train(source, order=1, workers=None, shard_size=SHARD_SIZE, tokenizer=None,
+          store=None):
+    """
+    Counts a corpus across a pool of worker processes
+
+    Shards are submitted lazily and at most 2 * `workers` are in
+    flight at once, so memory stays bounded for large corpora.
+
+    `source`:
+        corpus text or any streamed source (see `corpus.py`)
+
+    `workers`:
+        number of processes. defaults to the number of CPUs.
+
+    `tokenizer`:
+        see `iter_shards()`. sentences are tokenized in this
+        process and only the word lists are sent to workers
+
+    `store`:
+        one of `MarkovModel.STORES`, the model the shard counts
+        are merged into. defaults to the app's MODEL_STORE
+
+    returns:
+        - (counts, stats dict of sentences/words/seconds). counts
+        is a dict or `ngrams.NgramStore`, mapping state tuples to
+        {word: count}
+    """
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    counts = MarkovModel(order=order, store=store)._empty_store()
+    sentences = words = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        max_pending = 2 * workers
+        pending = set()
+        for shard in iter_shards(source, shard_size, tokenizer):
+            sentences += len(shard)
+            words += sum(len(sentence) for sentence in shard)
+            pending.add(executor.submit(count_shard, shard, order))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    merge_counts(counts, future.result())
+        for future in pending:
+            merge_counts(counts, future.result())
+
+    return counts, {
+        "sentences": sentences,
+        "words": words,
+        "seconds": time.perf_counter() - started,
+    }
@@ -0,0 +1,164 @@
+import atexit
+import os
+import threading
+import time
+from contextlib import ExitStack
+
+from flask import has_app_context
+from sqlalchemy.exc import IntegrityError
+
+
+###############################################################
+# Usage Tracking                                              #
+###############################################################
+
+class UsageTracker:
+    """
+    Per-model access counters (requests, sentences generated and
+    last access), buffered in memory and written in batches
+
+    `record()` only updates a dict under a lock, so serving a
+    sentence never waits on a database write. Buffered counts are
+    added to the `model_usage` table (see `models.ModelUsage`) by
+    `flush()`: every USAGE_FLUSH_INTERVAL seconds from a
+    background thread, as soon as USAGE_MAX_PENDING models are
+    buffered, and when the process exits. The thread is started
+    by the first `record()` of each process, so it survives a
+    pre-fork master.
+
+    Counts buffered by a worker that dies before a flush are
+    lost: they drive caching and preloading, they aren't billing.
+
+    Config:
+        - USAGE_FLUSH_INTERVAL: seconds between flushes. 0 only
+        flushes when full or asked to (useful for tests)
+        - USAGE_MAX_PENDING: models buffered before a flush
+    """
+    DEFAULT_FLUSH_INTERVAL = 30
+    DEFAULT_MAX_PENDING = 1000
+
+    def __init__(self, app=None):
+        self.app = None
+        self.flush_interval = self.DEFAULT_FLUSH_INTERVAL
+        self.max_pending = self.DEFAULT_MAX_PENDING
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher_pid = None
+        atexit.register(self._flush_at_exit)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('USAGE_FLUSH_INTERVAL', self.DEFAULT_FLUSH_INTERVAL)
+        app.config.setdefault('USAGE_MAX_PENDING', self.DEFAULT_MAX_PENDING)
+        self.app = app
+        self.flush_interval = app.config['USAGE_FLUSH_INTERVAL']
+        self.max_pending = app.config['USAGE_MAX_PENDING']
+        app.extensions['usage_tracker'] = self
+        self.clear()
+
+    def record(self, model_name, sentences=1):
+        """Counts one request for `model_name`, in memory only"""
+        now = time.time()
+        with self._lock:
+            counts = self._pending.get(model_name)
+            if counts is None:
+                counts = self._pending[model_name] = [0, 0, now]
+            counts[0] += 1
+            counts[1] += sentences
+            counts[2] = now
+            full = len(self._pending) >= self.max_pending
+
+        if self.flush_interval:
+            self._start_flusher()
+            if full:
+                self._wake.set()
+        elif full:
+            self.flush()
+
+    def pending(self):
+        """returns: dict of the counts not flushed yet"""
+        with self._lock:
+            return {name: tuple(counts) for name, counts in self._pending.items()}
+
+    def flush(self):
+        """
+        Adds the buffered counts to `model_usage` in one
+        transaction. On failure the counts are kept for the next
+        flush.
+
+        returns:
+            - number of models updated
+        """
+        from . import db
+        from .models import ModelUsage
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        with ExitStack() as stack:
+            if not has_app_context():
+                stack.enter_context(self.app.app_context())
+            try:
+                try:
+                    return ModelUsage.add(pending)
+                except IntegrityError:
+                    # another worker inserted the same model's row first
+                    db.session.rollback()
+                    return ModelUsage.add(pending)
+            except Exception:
+                db.session.rollback()
+                self._restore(pending)
+                raise
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+
+    def _restore(self, pending):
+        with self._lock:
+            for name, (requests, sentences, last_access) in pending.items():
+                counts = self._pending.setdefault(name, [0, 0, last_access])
+                counts[0] += requests
+                counts[1] += sentences
+                counts[2] = max(counts[2], last_access)
+
+    def _start_flusher(self):
+        # one thread per process, started after any fork
+        pid = os.getpid()
+        if self._flusher_pid == pid:
+            return
+        with self._lock:
+            if self._flusher_pid == pid:
+                return
+            self._flusher_pid = pid
+        threading.Thread(target=self._flush_periodically,
+                         name="flaskov-usage", daemon=True).start()
+
+    def _flush_periodically(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception("Usage flush failed")
+
+    def _flush_at_exit(self):
+        if self.app is not None and self._pending:
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+
+def hottest_models(limit):
+    """
+    returns: names of the `limit` most requested models (see
+    `models.ModelUsage.top`)
+    """
+    from .models import ModelUsage
+    return [model.model_name for model, _ in ModelUsage.top(limit)]
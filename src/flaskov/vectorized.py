@@ -0,0 +1,158 @@
+import numpy as np
+
+from .chain import lower_orders, resolve, vocabulary_size
+
+
+###############################################################
+# Array Chains                                                #
+###############################################################
+
+class ArrayChain:
+    """
+    Markov model stored as CSR-style NumPy arrays
+
+    Words are interned to integer ids and states (tuples of
+    up to `order` word ids) to integer rows. The transitions of row `r`
+    live in `indptr[r]:indptr[r+1]` of the transition arrays.
+
+    `words`: list
+        vocabulary, indexed by word id
+
+    `indptr`: int64 array (n_states + 1)
+        offsets of each row's transitions
+
+    `successors`: int32 array (n_transitions)
+        word id of each transition
+
+    `cumulative`: int64 array (n_transitions)
+        running sum of counts over *all* transitions, so one
+        searchsorted call can sample from many rows at once
+
+    `next_state`: int64 array (n_transitions)
+        row reached by taking each transition, -1 when the
+        transition ends the sentence
+
+    `start`: int
+        row of the all-START state, -1 for an empty chain
+    """
+
+    def __init__(self, model, order, start="START", end="END", min_count=1,
+                 backoff=False):
+        """
+        `model`:
+            dict of dicts. maps state tuples to {word: count}
+
+        `order`:
+            number of words in full-order states
+
+        `start`, `end`:
+            sentinel words marking sentence boundaries
+
+        `min_count`:
+            states seen fewer times than this back off to lower
+            order states, where the model has them (see 
+            `chain.resolve()`)
+
+        `backoff`:
+            if True, the lower-order states of `model` are derived
+            (see `chain.lower_orders()`) and stored after its own
+        """
+        states = list(model.items())
+        if backoff:
+            states.extend(lower_orders(model, order).items())
+
+        vocab = {}
+        intern = lambda word: vocab.setdefault(word, len(vocab))
+        rows = {tuple(intern(w) for w in state): row
+                for row, (state, _) in enumerate(states)}
+        totals = {state: sum(follows.values())
+                  for state, (_, follows) in zip(rows, states)}
+        self.end = intern(end)
+
+        indptr = [0]
+        successors = []
+        counts = []
+        next_state = []
+        for state, (_, follows) in zip(rows, states):
+            for word, count in follows.items():
+                word_id = intern(word)
+                successors.append(word_id)
+                counts.append(count)
+                next_state.append(
+                    -1 if word_id == self.end else
+                    rows.get(resolve(state + (word_id,), totals, order, min_count), -1))
+            indptr.append(len(successors))
+
+        self.order = order
+        self.words = [None] * len(vocab)
+        for word, word_id in vocab.items():
+            self.words[word_id] = word
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.successors = np.array(successors, dtype=np.int32)
+        self.cumulative = np.cumsum(np.array(counts, dtype=np.int64))
+        self.next_state = np.array(next_state, dtype=np.int64)
+        self.start = rows.get((intern(start),) * order, -1)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @property
+    def nbytes(self):
+        """Approximate size of the arrays and vocabulary in bytes"""
+        return (self.indptr.nbytes + self.successors.nbytes
+                + self.cumulative.nbytes + self.next_state.nbytes
+                + vocabulary_size(self.words))
+
+    def sample(self, rows, rng):
+        """
+        Samples one transition for every row in `rows`
+
+        `rows`:
+            int array of state rows
+
+        `rng`:
+            numpy.random.Generator
+
+        returns:
+            - int array of transition indices
+        """
+        lo = self.indptr[rows]
+        hi = self.indptr[rows + 1]
+        base = np.where(lo > 0, self.cumulative[lo - 1], 0)
+        total = self.cumulative[hi - 1] - base
+        target = base + (rng.random(len(rows)) * total).astype(np.int64)
+        return np.searchsorted(self.cumulative, target, side='right')
+
+    def generate_batch(self, n, seed=None):
+        """
+        Generates `n` sentences, advancing all of them together
+
+        `n`:
+            number of sentences
+
+        `seed`:
+            optional int seed for the numpy Generator
+
+        returns:
+            - list of strings
+        """
+        rng = np.random.default_rng(seed)
+        if self.start < 0 or n <= 0:
+            return [''] * n
+
+        rows = np.full(n, self.start, dtype=np.int64)
+        active = np.arange(n)
+        steps = []
+        while len(active):
+            transitions = self.sample(rows[active], rng)
+            step = np.full(n, self.end, dtype=np.int32)
+            step[active] = self.successors[transitions]
+            steps.append(step)
+            rows[active] = self.next_state[transitions]
+            active = active[rows[active] >= 0]
+
+        words = self.words
+        columns = np.stack(steps, axis=1)
+        return [
+            ' '.join(words[i] for i in column if i != self.end)
+            for column in columns.tolist()]
@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+
+from flask import current_app
+
+from .usage import hottest_models
+
+
+###############################################################
+# Model Preloading                                            #
+###############################################################
+
+class Preloader:
+    """
+    Loads hot models into the worker's `model_cache` when the app
+    starts, so the first requests after a deploy don't pay for the
+    query, `deserialize()` and compile
+
+    Models are picked by name (PRELOAD_MODELS), plus the first
+    PRELOAD_TOP_MODELS names returned by `ranking` (a callable
+    taking a limit): by default the most requested models, as
+    recorded by `usage.UsageTracker`.
+
+    By default warm-up runs inside `create_app`. Under
+    `gunicorn --preload` (see the Procfile) that is the master
+    process before it forks, so every worker starts warm and
+    shares the loaded chains copy-on-write: compiled chains keep
+    almost all of their bytes in array buffers that reference
+    counting never writes to. The connection pool is disposed
+    afterwards, so no connection crosses the fork.
+
+    With PRELOAD_BACKGROUND, warm-up runs on a thread instead and
+    the worker serves requests meanwhile. The thread is started by
+    the first request each process serves (`/ready` probes
+    included): one started in a pre-fork master would not be
+    copied into the workers, which would never become ready. Each
+    worker then loads its own copies. Either way `ready` is only
+    set once warm-up is over (see the `/ready` route).
+
+    Config:
+        - PRELOAD_MODELS: list of model names
+        - PRELOAD_TOP_MODELS: number of ranked models to add
+        - PRELOAD_BACKGROUND
+    """
+
+    def __init__(self, app=None):
+        self.ranking = hottest_models
+        self.ready = threading.Event()
+        self.report = {}
+        self._lock = threading.Lock()
+        self._started_pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Starts warm-up; call once the app is fully set up"""
+        app.config.setdefault('PRELOAD_MODELS', [])
+        app.config.setdefault('PRELOAD_TOP_MODELS', 0)
+        app.config.setdefault('PRELOAD_BACKGROUND', False)
+        app.extensions['preloader'] = self
+        self.ready.clear()
+        self.report = {"models": [], "seconds": None}
+        self._started_pid = None
+        if not (app.config['PRELOAD_MODELS'] or app.config['PRELOAD_TOP_MODELS']):
+            self.ready.set()
+        elif app.config['PRELOAD_BACKGROUND']:
+            app.before_request(self._start_background)
+        else:
+            self.warm_up(app)
+            from . import db
+            with app.app_context():
+                db.engine.dispose()
+
+    def _start_background(self):
+        # one warm-up per process, started after any fork
+        pid = os.getpid()
+        if self._started_pid == pid:
+            return
+        with self._lock:
+            if self._started_pid == pid:
+                return
+            self._started_pid = pid
+        threading.Thread(
+            target=self.warm_up, args=(current_app._get_current_object(),),
+            name="flaskov-preload", daemon=True).start()
+
+    def select(self, config):
+        """returns: names of the models to preload, hottest first"""
+        names = list(config['PRELOAD_MODELS'])
+        if config['PRELOAD_TOP_MODELS']:
+            names += self.ranking(config['PRELOAD_TOP_MODELS'])
+        return list(dict.fromkeys(names))
+
+    def warm_up(self, app):
+        """
+        Loads the selected models, logging how long each took.
+        Failures are logged and never stop the app from starting.
+
+        returns:
+            - dict with the `models` loaded (name, states and
+            seconds) and the total `seconds`
+        """
+        from .models import MarkovModel
+
+        started = time.perf_counter()
+        loaded = []
+        try:
+            with app.app_context():
+                engine = app.config['SENTENCE_ENGINE']
+                for name in self.select(app.config):
+                    model_started = time.perf_counter()
+                    model = MarkovModel.query.filter_by(model_name=name).first()
+                    if model is None:
+                        app.logger.warning("Preload: no model named %r", name)
+                        continue
+                    model.load(engine)
+                    seconds = time.perf_counter() - model_started
+                    loaded.append({
+                        "model_name": name,
+                        "model_size": model.model_size,
+                        "seconds": seconds,
+                    })
+                    app.logger.info("Preloaded %r (%s states) in %.3fs",
+                                    name, model.model_size, seconds)
+        except Exception:
+            app.logger.exception("Model preload failed")
+        finally:
+            seconds = time.perf_counter() - started
+            self.report = {"models": loaded, "seconds": seconds}
+            app.logger.info("Warm-up done: %d models in %.3fs",
+                            len(loaded), seconds)
+            self.ready.set()
+        return self.report
+
+    def status(self):
+        """
+        returns:
+            - dict with `ready` and the warm-up report
+        """
+        return dict(self.report, ready=self.ready.is_set())
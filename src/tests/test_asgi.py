@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+from urllib.parse import urlencode
+
+import pytest
+
+from ..flaskov import TestConfig, db, model_cache
+from ..flaskov.asgi import SingleFlight, create_asgi_app
+from ..flaskov.models import MarkovModel
+
+
+
+###############################################################
+# Pytest Fixtures                                             #
+###############################################################
+
+CORPUS = "I am very scared. I hate spiders. Spiders are very creepy"
+MODEL_NAME = "spiders"
+
+
+class AsgiTestConfig(TestConfig):
+    SQLALCHEMY_DATABASE_URI = "sqlite:///test_asgi.sqlite"
+    ASYNC_IO_WORKERS = 2
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = create_asgi_app(AsgiTestConfig())
+    with server.app.app_context():
+        db.create_all()
+        db.session.add(MarkovModel(corpus=CORPUS, name=MODEL_NAME))
+        db.session.commit()
+        path = db.engine.url.database
+    yield server
+    with server.app.app_context():
+        db.drop_all()
+    os.unlink(path)
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    model_cache.clear()
+
+
+###############################################################
+# Pytest Helpers                                              #
+###############################################################
+
+async def exchange(server, path, method="GET", query=None, form=None):
+    """Sends one request through the ASGI app, returns the messages sent"""
+    body = urlencode(form).encode() if form else b""
+    scope = {
+        "type": "http", "method": method, "path": path,
+        "query_string": urlencode(query or {}).encode(),
+        "headers": [(b"content-type", b"application/x-www-form-urlencoded")],
+    }
+    messages = [{"type": "http.request", "body": body}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await server(scope, receive, send)
+    return sent
+
+async def call(server, path, **kwargs):
+    """returns: (status, body)"""
+    sent = await exchange(server, path, **kwargs)
+    return sent[0]["status"], b"".join(m.get("body", b"") for m in sent[1:])
+
+def get_json(server, path, **kwargs):
+    status, body = asyncio.run(call(server, path, **kwargs))
+    return status, json.loads(body)
+
+
+###############################################################
+# Tests                                                       #
+###############################################################
+
+def test_generate_sentence_should_be_served_async(server):
+    status, response = get_json(
+        server, "/generate_sentence", query={"model_name": MODEL_NAME})
+    assert status == 200
+    assert response["sentence"].split()[0] in ("I", "Spiders")
+
+def test_unknown_model_should_return_error_message(server):
+    _, response = get_json(
+        server, "/generate_sentence", form={"model_name": "missing"})
+    assert "error_message" in response
+
+def test_concurrent_requests_should_share_one_load(server):
+    async def burst():
+        return await asyncio.gather(*[
+            call(server, "/generate_sentence", query={"model_name": MODEL_NAME})
+            for _ in range(20)])
+
+    misses = model_cache.stats()["misses"]
+    responses = asyncio.run(burst())
+    assert all(status == 200 for status, _ in responses)
+    assert model_cache.stats()["misses"] == misses + 1
+
+def test_mapped_engine_should_serve_from_the_mapped_file(server, tmp_path, monkeypatch):
+    monkeypatch.setitem(server.app.config, "SENTENCE_ENGINE", "mapped")
+    monkeypatch.setitem(server.app.config, "MODEL_FILES_DIR", str(tmp_path))
+    status, response = get_json(
+        server, "/generate_sentence", query={"model_name": MODEL_NAME, "seed": 3})
+    assert status == 200
+    assert response["sentence"].split()[0] in ("I", "Spiders")
+    assert [key[2] for key in model_cache._entries] == ["mapped"]
+
+def test_single_flight_should_coalesce_calls():
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "model"
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(*[flight.run("key", load) for _ in range(5)])
+        assert len(flight) == 0
+        return results
+
+    assert asyncio.run(main()) == ["model"] * 5
+    assert len(calls) == 1
+
+def test_other_routes_should_fall_through_to_flask(server):
+    status, response = get_json(server, "/models")
+    assert status == 200
+    assert [m["model_name"] for m in response["models"]] == [MODEL_NAME]
+
+    status, _ = asyncio.run(call(server, "/no_such_route"))
+    assert status == 404
+
+def test_streamed_responses_should_be_sent_in_chunks(server):
+    sent = asyncio.run(exchange(server, "/stream_sentences",
+        query={"model_name": MODEL_NAME, "count": 5}))
+    assert len([m for m in sent[1:] if m.get("more_body")]) == 5
+    assert sent[-1] == {"type": "http.response.body", "body": b""}
+
+def test_seeded_sentences_should_match_flask_route(server):
+    query = {"model_name": MODEL_NAME, "seed": 9}
+    _, response = get_json(server, "/generate_sentence", query=query)
+    with server.app.test_client() as client:
+        expected = client.get("/generate_sentence", query_string=query).get_json()
+    assert response == expected
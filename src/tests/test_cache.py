@@ -0,0 +1,91 @@
+import pytest
+
+from ..flaskov.cache import ModelCache
+
+
+
+###############################################################
+# Pytest Fixtures                                             #
+###############################################################
+
+@pytest.fixture(scope='function')
+def cache():
+    cache = ModelCache()
+    cache.max_entries = 2
+    cache.max_bytes = 100
+    return cache
+
+###############################################################
+# Pytest Helpers                                              #
+###############################################################
+
+def loader(value):
+    calls = []
+    def load():
+        calls.append(value)
+        return value
+    load.calls = calls
+    return load
+
+
+###############################################################
+# Tests                                                       #
+###############################################################
+
+def test_second_get_should_hit_cache(cache):
+    load = loader({"a": 1})
+    assert cache.get(1, 1, load) == {"a": 1}
+    assert cache.get(1, 1, load) == {"a": 1}
+    assert len(load.calls) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_new_version_should_replace_stale_entry(cache):
+    cache.get(1, 1, loader("old"))
+    assert cache.get(1, 2, loader("new")) == "new"
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["misses"] == 2
+
+def test_least_recently_used_entry_should_be_evicted_by_count(cache):
+    cache.get(1, 1, loader("one"))
+    cache.get(2, 1, loader("two"))
+    cache.get(1, 1, loader("one"))
+    cache.get(3, 1, loader("three"))
+    load = loader("two")
+    cache.get(2, 1, load)
+    assert len(load.calls) == 1
+    assert cache.stats()["evictions"] == 2
+
+def test_entries_should_be_evicted_by_size(cache):
+    cache.get(1, 1, loader("one"), size=60)
+    cache.get(2, 1, loader("two"), size=60)
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["bytes"] == 60
+    assert stats["evictions"] == 1
+
+def test_oversized_entries_should_not_be_cached(cache):
+    cache.get(1, 1, loader("one"), size=10)
+    cache.get(2, 1, loader("huge"), size=1000)
+    assert cache.stats()["entries"] == 1
+
+def test_invalidate_should_drop_entry(cache):
+    cache.get(1, 1, loader("one"), size=10)
+    cache.invalidate(1)
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bytes"] == 0
+
+def test_callable_size_should_only_be_computed_on_miss(cache):
+    sizes = []
+    size = lambda value: sizes.append(value) or 10
+    cache.get(1, 1, loader("one"), size=size)
+    cache.get(1, 1, loader("one"), size=size)
+    assert sizes == ["one"]
+    assert cache.stats()["bytes"] == 10
+
+def test_peek_should_not_load_or_count(cache):
+    assert cache.peek(1, 1) is None
+    cache.get(1, 1, loader("one"))
+    assert cache.peek(1, 1) == "one"
+    assert cache.peek(1, 2) is None
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (0, 1)
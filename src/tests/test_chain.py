@@ -0,0 +1,139 @@
+import random
+
+import pytest
+
+from ..flaskov.chain import CompiledChain, lower_orders, resolve
+
+
+
+###############################################################
+# Pytest Fixtures                                             #
+###############################################################
+
+MODEL = {
+    ("START",): {"I": 3, "Spiders": 1},
+    ("I",): {"am": 1, "hate": 1},
+    ("am",): {"END": 1},
+    ("hate",): {"END": 1},
+    ("Spiders",): {"END": 1},
+}
+
+@pytest.fixture(scope='function')
+def chain():
+    return CompiledChain(MODEL)
+
+###############################################################
+# Pytest Helpers                                              #
+###############################################################
+
+class FixedRandom:
+    """Stand-in rng returning a fixed value from random()"""
+    def __init__(self, value):
+        self.value = value
+
+    def random(self):
+        return self.value
+
+
+###############################################################
+# Tests                                                       #
+###############################################################
+
+def test_compiled_chain_should_contain_every_state(chain):
+    assert len(chain) == len(MODEL)
+    for state in MODEL:
+        assert state in chain
+
+def test_choose_should_respect_cumulative_weights(chain):
+    # "I" covers [0, 3) of a total weight of 4
+    assert chain.choose(("START",), FixedRandom(0.0)) == "I"
+    assert chain.choose(("START",), FixedRandom(0.74)) == "I"
+    assert chain.choose(("START",), FixedRandom(0.75)) == "Spiders"
+    assert chain.choose(("START",), FixedRandom(0.9999)) == "Spiders"
+
+def test_choose_should_only_return_successors(chain):
+    rng = random.Random(0)
+    for _ in range(100):
+        assert chain.choose(("I",), rng) in MODEL[("I",)]
+
+def test_nbytes_should_count_the_index_once_built(chain):
+    size = chain.nbytes
+    assert size > 0
+    assert ("I",) in chain
+    assert chain.nbytes > size
+
+def test_empty_model_should_compile_to_empty_chain():
+    assert not CompiledChain({})
+
+def test_resolve_should_back_off_from_sparse_states():
+    totals = {("a", "b"): 1, ("b",): 5, ("c", "d"): 9}
+    assert resolve(("x", "a", "b"), totals, 2, min_count=2) == ("b",)
+    assert resolve(("x", "a", "b"), totals, 2, min_count=1) == ("a", "b")
+    assert resolve(("x", "c", "d"), totals, 2, min_count=2) == ("c", "d")
+    assert resolve(("x", "y", "z"), totals, 2) is None
+
+def test_lower_orders_should_sum_full_order_counts():
+    model = {
+        ("START", "a"): {"b": 2, "END": 1},
+        ("x", "a"): {"b": 1, "c": 4},
+        ("a", "b"): {"END": 3},
+    }
+    assert lower_orders(model, 2) == {
+        ("a",): {"b": 3, "END": 1, "c": 4},
+        ("b",): {"END": 3},
+    }
+    assert model[("START", "a")] == {"b": 2, "END": 1}
+    assert lower_orders(model, 1) == {}
+
+def test_backoff_chain_should_compile_derived_states():
+    model = {
+        ("START", "START"): {"a": 1},
+        ("START", "a"): {"b": 1},
+        ("a", "b"): {"END": 1},
+    }
+    chain = CompiledChain(model, order=2, backoff=True)
+    assert len(chain) == 6
+    assert ("b",) in chain and ("START",) in chain
+    assert chain.walk(("START", "START")) == ["a", "b"]
+
+def test_walk_should_follow_links_to_the_end():
+    model = {
+        ("START", "START"): {"I": 1},
+        ("START", "I"): {"am": 1},
+        ("I", "am"): {"scared": 1},
+        ("am", "scared"): {"END": 1},
+    }
+    chain = CompiledChain(model, order=2)
+    assert chain.walk(("START", "START")) == ["I", "am", "scared"]
+
+def test_walk_should_climb_back_up_after_backing_off():
+    model = {
+        ("START", "START"): {"I": 1},
+        ("START", "I"): {"am": 1},
+        # ("I", "am") is missing: back off to ("am",)
+        ("am",): {"very": 1},
+        ("am", "very"): {"END": 1},
+    }
+    chain = CompiledChain(model, order=2)
+    assert chain.walk(("START", "START")) == ["I", "am", "very"]
+
+def test_chain_should_store_each_word_once():
+    chain = CompiledChain(MODEL)
+    assert sorted(chain.vocabulary) == sorted({"START", "I", "Spiders", "am", "hate", "END"})
+    assert len(chain.successors) == sum(len(follows) for follows in MODEL.values())
+
+def test_chains_should_share_interned_words():
+    first = CompiledChain(MODEL)
+    second = CompiledChain({state: dict(follows) for state, follows in MODEL.items()})
+    for word in first.vocabulary:
+        assert second.vocabulary[second.vocabulary.index(word)] is word
+
+def test_walk_from_start_should_not_index_every_state(chain):
+    chain.walk(("START",), random.Random(0))
+    assert not chain._indexed
+    assert ("am",) in chain
+    assert chain._indexed
+
+def test_walk_from_missing_state_should_raise(chain):
+    with pytest.raises(KeyError):
+        chain.walk(("nope",))
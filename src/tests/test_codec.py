@@ -0,0 +1,81 @@
+import struct
+
+import pytest
+
+from ..flaskov import codec
+
+
+
+###############################################################
+# Pytest Fixtures                                             #
+###############################################################
+
+MODEL = {
+    ("START",): {"I": 2, "Spiders": 1},
+    ("I",): {"am": 1, "hate": 1},
+    ("am",): {"très": 1},
+    ("très",): {"END": 1},
+    ("hate",): {"END": 1},
+    ("Spiders",): {"END": 1},
+}
+
+@pytest.fixture(scope='function', params=[None, "zlib", "lzma"])
+def compression(request):
+    return request.param
+
+###############################################################
+# Tests                                                       #
+###############################################################
+
+def test_encode_decode_should_preserve_model(compression):
+    data = codec.encode(MODEL, compression)
+    assert codec.is_binary(data)
+    assert codec.decode(data) == MODEL
+
+def test_mixed_state_lengths_should_round_trip():
+    model = dict(MODEL)
+    model[("START", "START")] = {"I": 1}
+    assert codec.decode(codec.encode(model)) == model
+
+def test_empty_model_should_round_trip(compression):
+    assert codec.decode(codec.encode({}, compression)) == {}
+
+def test_payload_size_should_be_uncompressed_size():
+    assert codec.payload_size(codec.encode(MODEL, "zlib")) == \
+        len(codec.encode(MODEL, None)) - codec.HEADER.size
+
+def test_json_should_not_be_binary():
+    assert not codec.is_binary('[[["START"], {"END": 1}]]')
+    with pytest.raises(codec.FormatError):
+        codec.decode(b'[[["START"], {"END": 1}]]')
+
+def test_truncated_payload_should_raise():
+    data = codec.encode(MODEL, None)
+    with pytest.raises(codec.FormatError):
+        codec.decode(data[:-4])
+
+def test_words_with_newlines_should_round_trip(compression):
+    model = {
+        ("START",): {"a\nb": 1, "": 1},
+        ("a\nb",): {"c": 1},
+        ("c",): {"END": 1},
+        ("",): {"\n": 1},
+        ("\n",): {"END": 1},
+    }
+    assert codec.decode(codec.encode(model, compression)) == model
+
+def test_version_1_blobs_should_still_decode():
+    words = ["START", "I", "END"]
+    strings = "\n".join(words).encode('utf-8')
+    payload = b''.join([
+        codec.COUNTS.pack(3, 2, 2),
+        struct.pack('<I', len(strings)),
+        strings,
+        bytes([1, 1]),
+        struct.pack('<2I', 0, 1),
+        struct.pack('<3I', 0, 1, 2),
+        struct.pack('<2I', 1, 2),
+        struct.pack('<2I', 1, 1),
+    ])
+    data = codec.HEADER.pack(codec.MAGIC, 1, 0, len(payload)) + payload
+    assert codec.decode(data) == {("START",): {"I": 1}, ("I",): {"END": 1}}
@@ -0,0 +1,61 @@
+import io
+
+import pytest
+
+from ..flaskov.corpus import CHUNK_SIZE, iter_chunks
+from ..flaskov.models import MarkovModel
+from ..flaskov.tokenizer import get_tokenizer
+
+
+
+###############################################################
+# Pytest Fixtures                                             #
+###############################################################
+
+CORPUS = (
+    "I am very scared. I hate spiders. Spiders are very creepy. "
+    "Él está muy asustado. Spiders hate me"
+)
+
+@pytest.fixture(scope='function', params=[1, 3, 7, 1024])
+def chunk_size(request):
+    return request.param
+
+###############################################################
+# Pytest Helpers                                              #
+###############################################################
+
+def expected_sentences(corpus):
+    return [sentence.split() for sentence in corpus.split('. ')]
+
+def legacy_sentences(source, chunk_size=CHUNK_SIZE):
+    return get_tokenizer("legacy").sentences(source, chunk_size)
+
+
+###############################################################
+# Tests                                                       #
+###############################################################
+
+def test_text_stream_should_match_split(chunk_size):
+    sentences = legacy_sentences(io.StringIO(CORPUS), chunk_size)
+    assert list(sentences) == expected_sentences(CORPUS)
+
+def test_binary_stream_should_match_split(chunk_size):
+    # small chunks split multi-byte characters, which must be decoded intact
+    sentences = legacy_sentences(io.BytesIO(CORPUS.encode('utf-8')), chunk_size)
+    assert list(sentences) == expected_sentences(CORPUS)
+
+def test_iterable_of_lines_should_match_split():
+    lines = (line + ' ' for line in CORPUS.split(' '))
+    assert list(legacy_sentences(lines)) == expected_sentences(CORPUS + ' ')
+
+def test_path_should_be_read_in_chunks(tmp_path):
+    path = tmp_path / "corpus.txt"
+    path.write_text(CORPUS, encoding='utf-8')
+    assert ''.join(iter_chunks(path, chunk_size=5)) == CORPUS
+    assert list(legacy_sentences(path)) == expected_sentences(CORPUS)
+
+def test_model_from_source_should_match_model_from_corpus():
+    streamed = MarkovModel.from_source(io.StringIO(CORPUS), order=2)
+    assert streamed.model == MarkovModel(corpus=CORPUS, order=2).model
+    assert streamed.model_name == MarkovModel.DEFAULT_NAME
@@ -0,0 +1,61 @@
+import pytest
+from flask import Flask
+
+from ..flaskov.instrumentation import Histogram, Metrics
+
+
+
+###############################################################
+# Pytest Fixtures                                             #
+###############################################################
+
+@pytest.fixture(scope='function', params=[0.0, 1.0])
+def app(request):
+    app = Flask(__name__)
+    app.config['METRICS_SAMPLE_RATE'] = request.param
+    metrics = Metrics(app)
+
+    @app.route("/work")
+    def work():
+        with metrics.timer("generate", 2):
+            return "done"
+
+    return app
+
+
+###############################################################
+# Tests                                                       #
+###############################################################
+
+def test_histogram_should_render_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test", ("stage",), buckets=(0.1, 1.0))
+    histogram.observe(("a",), 0.05)
+    histogram.observe(("a",), 0.5)
+    histogram.observe(("a",), 5)
+    assert list(histogram.render()) == [
+        "# HELP test_seconds Test",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="a",le="0.1"} 1',
+        'test_seconds_bucket{stage="a",le="1.0"} 2',
+        'test_seconds_bucket{stage="a",le="+Inf"} 3',
+        'test_seconds_sum{stage="a"} 5.55',
+        'test_seconds_count{stage="a"} 3',
+    ]
+
+def test_sampled_requests_should_be_timed(app):
+    metrics = app.extensions['metrics']
+    with app.test_client() as client:
+        for _ in range(3):
+            client.get("/work")
+
+    text = metrics.render()
+    assert 'flaskov_requests_total{route="work"} 3' in text
+    timed = 'flaskov_stage_seconds_count{route="work",stage="generate",order="2"} 3'
+    assert (timed in text) == (metrics.sample_rate == 1.0)
+
+def test_timers_outside_requests_should_be_background(app):
+    metrics = app.extensions['metrics']
+    with app.app_context():
+        with metrics.timer("serialize", 1):
+            pass
+    assert ('route="background"' in metrics.render()) == (metrics.sample_rate == 1.0)
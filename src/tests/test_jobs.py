@@ -0,0 +1,89 @@
+import io
+import os
+import time
+
+import pytest
+from flask import Flask
+
+from ..flaskov.jobs import JobQueue
+
+
+
+###############################################################
+# Pytest Fixtures                                             #
+###############################################################
+
+@pytest.fixture(scope='function', params=[0, 2])
+def job_queue(request):
+    app = Flask(__name__)
+    app.config['JOB_WORKERS'] = request.param
+    app.config['JOB_HISTORY'] = 3
+    return JobQueue(app)
+
+###############################################################
+# Pytest Helpers                                              #
+###############################################################
+
+def wait_for(job, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if job.status in ("finished", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+def add(job, a, b):
+    job.progress["stage"] = "adding"
+    return {"sum": a + b}
+
+def fail(job):
+    raise RuntimeError("broken corpus")
+
+
+###############################################################
+# Tests                                                       #
+###############################################################
+
+def test_job_should_finish_with_result(job_queue):
+    job = wait_for(job_queue.submit(add, 1, 2))
+    assert job.status == "finished"
+    assert job.result == {"sum": 3}
+    assert job.progress == {"stage": "adding"}
+    assert job_queue.get(job.id) is job
+
+def test_failed_job_should_report_error(job_queue):
+    job = wait_for(job_queue.submit(fail))
+    assert job.to_dict()["status"] == "failed"
+    assert job.to_dict()["error_message"] == "broken corpus"
+
+def test_old_jobs_should_be_forgotten(job_queue):
+    jobs = [wait_for(job_queue.submit(add, i, i)) for i in range(4)]
+    assert job_queue.get(jobs[0].id) is None
+    assert job_queue.get(jobs[-1].id) is jobs[-1]
+
+def test_progress_should_be_saved_at_most_once_per_interval():
+    app = Flask(__name__)
+    app.config.update(JOB_WORKERS=0, JOB_PROGRESS_INTERVAL=60)
+    job_queue = JobQueue(app)
+    saved = []
+    job_queue.store.save = lambda job: saved.append(dict(job.progress))
+
+    def count(job):
+        for added in range(100):
+            job.progress.update(sentences=added)
+
+    job_queue.submit(count)
+    # running, then finished
+    assert saved == [{}, {"sentences": 99}]
+
+def test_recover_should_delete_abandoned_spool_files(tmp_path):
+    app = Flask(__name__)
+    app.config.update(JOB_SPOOL_DIR=str(tmp_path), JOB_STALE_AFTER=60)
+    job_queue = JobQueue(app)
+    old = job_queue.spool(io.BytesIO(b"old"))
+    new = job_queue.spool(io.BytesIO(b"new"))
+    assert os.path.dirname(old) == str(tmp_path)
+    os.utime(old, (0, 0))
+    assert job_queue.recover() == (0, 1)
+    assert not os.path.exists(old)
+    with open(new, 'rb') as spooled:
+        assert spooled.read() == b"new"
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+
+from ..flaskov import mapped
+from ..flaskov.models import MarkovModel
+from ..flaskov.vectorized import ArrayChain
+
+
+
+###############################################################
+# Pytest Fixtures                                             #
+###############################################################
+
+CORPUS = (
+    "I am very scared. I hate spiders. Spiders are very creepy. "
+    "I am not a spider. Spiders hate me. Naïve spiders sing"
+)
+
+@pytest.fixture(scope='function', params=[1, 2, 3])
+def chain(request):
+    model = MarkovModel(corpus=CORPUS, order=request.param, backoff=True)
+    return ArrayChain(model.model, model.model_order, min_count=2)
+
+@pytest.fixture(scope='function')
+def path(tmp_path):
+    return str(tmp_path / ("model" + mapped.SUFFIX))
+
+
+###############################################################
+# Tests                                                       #
+###############################################################
+
+def test_mapped_chain_should_match_array_chain(chain, path):
+    mapped.write(chain, path)
+    loaded = mapped.MappedChain(path)
+    assert len(loaded) == len(chain)
+    assert list(loaded.words) == chain.words
+    assert (loaded.start, loaded.end, loaded.order) == (
+        chain.start, chain.end, chain.order)
+    for name in ('indptr', 'successors', 'cumulative', 'next_state'):
+        assert np.array_equal(getattr(loaded, name), getattr(chain, name))
+    assert loaded.generate_batch(20, seed=4) == chain.generate_batch(20, seed=4)
+
+def test_mapped_arrays_should_be_read_only(chain, path):
+    mapped.write(chain, path)
+    loaded = mapped.MappedChain(path)
+    with pytest.raises(ValueError):
+        loaded.cumulative[0] = 0
+
+def test_empty_chain_should_round_trip(path):
+    mapped.write(ArrayChain({}, 1), path)
+    assert mapped.MappedChain(path).generate_batch(2) == ['', '']
+
+def test_mapped_chain_should_reject_other_files(path):
+    with open(path, 'wb') as output:
+        output.write(b'FKVM' + bytes(64))
+    with pytest.raises(mapped.FormatError):
+        mapped.MappedChain(path)
+
+def test_remove_files_should_keep_current_version(chain, tmp_path):
+    directory = str(tmp_path)
+    for version in (1, 2):
+        mapped.write(chain, mapped.model_path(directory, 7, version))
+    mapped.write(chain, mapped.model_path(directory, 8, 1))
+    keep = mapped.model_path(directory, 7, 2)
+    mapped.remove_files(directory, 7, keep=keep)
+    assert sorted(os.listdir(directory)) == ["7-2.fkmc", "8-1.fkmc"]
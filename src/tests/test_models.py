@@ -1,4 +1,5 @@
 import os
+import random
 import sys
 import tempfile
 from sqlite3 import IntegrityError
@@ -9,7 +10,9 @@ from flask_login import current_user
 
 from werkzeug.security import generate_password_hash
 
+from ..flaskov.chain import lower_orders
 from ..flaskov.models import *
+from ..flaskov.tokenizer import get_tokenizer
 
 
 
@@ -122,4 +125,129 @@ def test_full_model_should_generate_sentence(markovmodel):
 def test_generated_sentence_should_not_contain_START_END(markovmodel):
     sentence = markovmodel.generate()
     assert markovmodel.START not in sentence.split()
-    assert markovmodel.END not in sentence.split()
\ No newline at end of file
+    assert markovmodel.END not in sentence.split()
+
+def test_generate_many_should_generate_n_sentences(markovmodel):
+    sentences = markovmodel.generate_many(5)
+    assert len(sentences) == 5
+    for sentence in sentences:
+        assert sentence != markovmodel.EMPTY_MODEL_ERROR
+
+def test_generate_many_with_seed_should_be_reproducible(markovmodel):
+    assert markovmodel.generate_many(5, seed=42) == markovmodel.generate_many(5, seed=42)
+
+def test_deserialize_should_read_legacy_json(markovmodel):
+    previous_model = markovmodel.model.copy()
+    markovmodel.model_serialized = json.dumps(list(previous_model.items()))
+    assert markovmodel.deserialize() == previous_model
+
+def test_serialize_should_bump_model_version(markovmodel):
+    version = markovmodel.model_version
+    markovmodel.serialize()
+    assert markovmodel.model_version == version + 1
+
+def test_append_corpus_should_match_model_built_from_all_text():
+    extra = "This is a new sentence. Lorem ipsum is a new dolor"
+    model = MarkovModel(corpus=CORPUS, order=2)
+    model.model = {}
+    model.append_corpus(extra)
+    assert model.model == MarkovModel(corpus=CORPUS + '. ' + extra, order=2).model
+    assert model.model_size == MarkovModel(corpus=CORPUS + '. ' + extra, order=2).model_size
+
+@pytest.mark.parametrize("order", [2, 3])
+def test_higher_order_model_should_generate_corpus_ngrams(order):
+    model = MarkovModel(corpus=CORPUS, order=order)
+    ngrams = set()
+    for words in get_tokenizer().sentences(CORPUS):
+        ngrams |= {tuple(words[i:i+order+1]) for i in range(len(words) - order)}
+    for sentence in model.generate_many(20, seed=3):
+        words = sentence.split()
+        assert words
+        assert {tuple(words[i:i+order+1]) for i in range(len(words) - order)} <= ngrams
+
+def test_backoff_model_should_derive_lower_orders_when_compiling():
+    plain = MarkovModel(corpus=CORPUS, order=3)
+    backoff = MarkovModel(corpus=CORPUS, order=3, backoff=True)
+    assert backoff.model_size == plain.model_size
+    assert backoff.model == plain.model
+    for engine in ("compiled", "arrays"):
+        chain = backoff.compile(engine)
+        assert len(chain) > len(plain.compile(engine))
+    assert ("dolor",) in backoff.compile()
+    assert ("sit", "amet,") in backoff.compile()
+
+def test_backoff_should_survive_serialization():
+    model = MarkovModel(corpus=CORPUS, order=2, backoff=True)
+    size = model.model_size
+    model.deserialize()
+    assert model.backoff
+    model.add_sentence(["Lorem", "ipsum"])
+    assert model.model_size == size
+    assert type(model.generate()) == str
+
+def test_stored_lower_orders_should_be_dropped_on_deserialize():
+    counts = MarkovModel(corpus=CORPUS, order=2).model
+    legacy = MarkovModel(model={**counts, **lower_orders(counts, 2)}, order=2)
+    assert not legacy.backoff
+    assert legacy.deserialize() == counts
+    assert legacy.backoff
+
+@pytest.mark.parametrize("backoff", [False, True])
+def test_packed_store_should_match_dict_store(backoff):
+    plain = MarkovModel(corpus=CORPUS, order=2, backoff=backoff)
+    packed = MarkovModel(corpus=CORPUS, order=2, backoff=backoff, store="packed")
+    assert isinstance(packed.model, NgramStore)
+    assert packed.model == plain.model
+    assert packed.model_size == plain.model_size
+    packed.deserialize()
+    assert isinstance(packed.model, NgramStore)
+    assert packed.model == plain.model
+    assert packed.generate_many(5, seed=3) == plain.generate_many(5, seed=3)
+
+@pytest.mark.parametrize("engine", ["compiled", "arrays"])
+def test_stream_should_generate_lazily(markovmodel, engine, monkeypatch):
+    monkeypatch.setattr(MarkovModel, "STREAM_BATCH", 4)
+    sentences = markovmodel.stream(10, seed=2, engine=engine)
+    assert next(sentences)
+    assert len(list(sentences)) == 9
+    assert list(markovmodel.stream(10, seed=2, engine=engine)) == \
+        list(markovmodel.stream(10, seed=2, engine=engine))
+
+def test_generate_with_seed_should_be_reproducible(markovmodel):
+    assert markovmodel.generate(seed=11) == markovmodel.generate(seed="11")
+    rng = random.Random(3)
+    sentences = [markovmodel.generate(rng=rng) for _ in range(3)]
+    rng = random.Random(3)
+    assert sentences == [markovmodel.generate(rng=rng) for _ in range(3)]
+
+def test_compact_should_prune_rare_transitions_and_unreachable_states():
+    model = MarkovModel(order=1)
+    for sentence in ["a b", "a b", "a c d", "e f"] + ["a b"] * 2:
+        model.add_sentence(sentence.split())
+    model.serialize()
+    report = model.compact(min_count=2)
+    # "c" only followed "a" once, so "c" and "d" can't be reached
+    assert model.model[("a",)] == {"b": 4}
+    assert ("c",) not in model.model and ("d",) not in model.model
+    # a state's most frequent transition always survives
+    assert model.model[("START",)] == {"a": 5}
+    assert ("e",) not in model.model
+    assert report["states_before"] == 7 and report["states_after"] == 3
+    assert report["transitions_after"] == 3
+    assert report["bytes_saved"] == report["bytes_before"] - report["bytes_after"] > 0
+    assert model.model_size == len(model.model) - 1 - 2
+    assert model.generate_many(5, seed=1) == ["a b"] * 5
+
+def test_compact_should_keep_top_k_successors():
+    model = MarkovModel(corpus=CORPUS, order=2, backoff=True)
+    model.compact(top_k=1)
+    assert all(len(follows) == 1 for follows in model.model.values())
+    model.deserialize()
+    for engine in ("compiled", "arrays"):
+        assert len(model.generate_many(5, seed=2, engine=engine)) == 5
+
+def test_compact_without_limits_should_keep_reachable_model(markovmodel):
+    states = dict(markovmodel.model)
+    report = markovmodel.compact()
+    assert markovmodel.model == states
+    assert report["transitions_after"] == report["transitions_before"]
@@ -0,0 +1,80 @@
+import pytest
+
+from ..flaskov.ngrams import NgramStore
+
+
+
+###############################################################
+# Pytest Fixtures                                             #
+###############################################################
+
+MODEL = {
+    ("START", "START"): {"I": 3, "Spiders": 1},
+    ("START", "I"): {"am": 1, "hate": 1},
+    ("I", "am"): {"END": 1},
+    ("I", "hate"): {"END": 1},
+    ("START", "Spiders"): {"END": 1},
+    ("I",): {"am": 1, "hate": 1},
+}
+
+@pytest.fixture(scope='function')
+def store():
+    return NgramStore(MODEL, max_order=2)
+
+
+###############################################################
+# Tests                                                       #
+###############################################################
+
+def test_store_should_equal_source_dict(store):
+    assert len(store) == len(MODEL)
+    assert store == MODEL
+    assert dict(store.items()) == MODEL
+    assert set(store) == set(MODEL)
+
+def test_store_should_raise_key_error_for_missing_states(store):
+    with pytest.raises(KeyError):
+        store[("Spiders", "START")]
+    with pytest.raises(KeyError):
+        store[("unknown",)]
+    assert store.get(("unknown",)) is None
+    assert ("I",) in store and ("am",) not in store
+
+def test_store_should_update_and_delete_states(store):
+    store[("I", "am")] = {"here": 2}
+    assert store[("I", "am")] == {"here": 2}
+    assert len(store) == len(MODEL)
+    del store[("START", "I")]
+    assert ("START", "I") not in store
+    with pytest.raises(KeyError):
+        del store[("START", "I")]
+
+def test_store_should_merge_pending_states(monkeypatch):
+    monkeypatch.setattr(NgramStore, "MERGE_MIN", 4)
+    expected = {(str(i), str(i % 7)): i for i in range(100)}
+    store = NgramStore(max_order=2)
+    for state, value in expected.items():
+        store[state] = value
+    assert len(store._keys) > 0
+    assert store == expected
+    assert list(store._keys) == sorted(store._keys)
+
+def test_store_should_widen_keys_past_the_vocabulary_limit(monkeypatch):
+    monkeypatch.setattr(NgramStore, "MERGE_MIN", 4)
+    store = NgramStore(max_order=3)
+    store._word_bits = 2
+    expected = {}
+    for i in range(200):
+        state = tuple(str((i + j) % 37) for j in range(1 + i % 3))
+        expected[state] = store[state] = i
+    assert store._word_bits > 2
+    assert store == expected
+    assert list(store._keys) == sorted(store._keys)
+
+def test_wide_keys_should_become_python_ints():
+    store = NgramStore(max_order=3)
+    store[("a", "b", "c")] = 1
+    store._widen(40)
+    assert isinstance(store._keys, list)
+    store[("c", "b", "a")] = 2
+    assert dict(store.items()) == {("a", "b", "c"): 1, ("c", "b", "a"): 2}
@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+from ..flaskov.responses import FileBackend, MemoryBackend
+
+
+
+###############################################################
+# Pytest Fixtures                                             #
+###############################################################
+
+@pytest.fixture(scope='function', params=["memory", "file"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend(max_entries=2, max_bytes=100)
+    return FileBackend(str(tmp_path), max_entries=2, max_bytes=1000)
+
+###############################################################
+# Pytest Helpers                                              #
+###############################################################
+
+def entry(body, ttl=60):
+    return {"body": body, "etag": "etag", "expires": time.time() + ttl}
+
+def key(model_name, seed):
+    return ("/generate_sentence", model_name, seed, "1", "compiled")
+
+
+###############################################################
+# Tests                                                       #
+###############################################################
+
+def test_stored_entry_should_be_returned(backend):
+    backend.set(key("spiders", 1), entry("one"))
+    assert backend.get(key("spiders", 1))["body"] == "one"
+    assert backend.get(key("spiders", 2)) is None
+
+def test_expired_entry_should_be_a_miss(backend):
+    backend.set(key("spiders", 1), entry("one", ttl=-1))
+    assert backend.get(key("spiders", 1)) is None
+    assert len(backend) == 0
+
+def test_entries_should_be_evicted_past_max_entries(backend):
+    for seed in range(3):
+        backend.set(key("spiders", seed), entry(str(seed)))
+        time.sleep(0.01)
+    assert len(backend) == 2
+    assert backend.get(key("spiders", 0)) is None
+    assert backend.get(key("spiders", 2))["body"] == "2"
+
+def test_invalidate_model_should_only_drop_its_entries(backend):
+    backend.set(key("spiders", 1), entry("one"))
+    backend.set(key("snakes", 1), entry("two"))
+    backend.invalidate_model("spiders")
+    assert backend.get(key("spiders", 1)) is None
+    assert backend.get(key("snakes", 1))["body"] == "two"
+
+def test_file_entries_should_survive_a_new_backend(tmp_path):
+    FileBackend(str(tmp_path), 2, 1000).set(key("spiders", 1), entry("one"))
+    assert FileBackend(str(tmp_path), 2, 1000).get(key("spiders", 1))["body"] == "one"
@@ -0,0 +1,28 @@
+import threading
+
+from ..flaskov.rng import make_rng, normalize_seed, thread_rng
+
+
+
+###############################################################
+# Tests                                                       #
+###############################################################
+
+def test_same_seed_should_give_same_stream():
+    assert make_rng(42).random() == make_rng(42).random()
+    assert make_rng("42").random() == make_rng(42).random()
+    assert make_rng("spiders").random() == make_rng("spiders").random()
+    assert make_rng(1).random() != make_rng(2).random()
+
+def test_normalize_seed_should_only_convert_whole_numbers():
+    assert normalize_seed(" -7 ") == -7
+    assert normalize_seed("7.5") == "7.5"
+    assert normalize_seed(None) is None
+
+def test_unseeded_rng_should_be_per_thread():
+    rngs = []
+    thread = threading.Thread(target=lambda: rngs.append(thread_rng()))
+    thread.start()
+    thread.join()
+    assert make_rng() is thread_rng()
+    assert rngs[0] is not thread_rng()
@@ -1,17 +1,26 @@
+import io
+import json
 import os
 import sys
 import tempfile
+import threading
+import time
 from sqlite3 import IntegrityError
 
 import pytest
 from flask_login import current_user
-from flask import session
+from flask import Flask, session
 from werkzeug.security import generate_password_hash
 
 from ..flaskov import create_app, TestConfig
 from ..flaskov import db as _db
 from ..flaskov import login_manager 
-from ..flaskov.models import User, MarkovModel
+from ..flaskov import job_queue, mapped, model_cache, preloader, response_cache, usage_tracker
+from ..flaskov.jobs import Job
+from ..flaskov.models import User, MarkovModel, ModelUsage, JobRecord
+from ..flaskov.ngrams import NgramStore
+from ..flaskov.vectorized import ArrayChain
+from ..flaskov.warmup import Preloader
 
 
 
@@ -78,6 +87,9 @@ def _session(db, request): # named with underscore to prevent shadowing with fla
         transaction.rollback()
         connection.close()
         _session.remove()
+        model_cache.clear()
+        response_cache.clear()
+        usage_tracker.clear()
 
     request.addfinalizer(teardown)
     return _session
@@ -124,11 +136,27 @@ def generate_model(client, corpus, name, order):
         'order': order,
     }, follow_redirects=True)
 
+def append_corpus(client, corpus, name):
+    return client.post('/append_corpus', data={
+        'corpus': corpus,
+        'name': name,
+    }, follow_redirects=True)
+
+def exported_files(directory):
+    return sorted(name for name in os.listdir(directory)
+                  if name.endswith(mapped.SUFFIX))
+
 def generate_sentence(client, name):
     return client.get(f'/generate_sentence', data={
         'model_name': name,
     }, follow_redirects=True)
 
+def generate_sentences(client, name, count):
+    return client.get(f'/generate_sentences', data={
+        'model_name': name,
+        'count': count,
+    }, follow_redirects=True)
+
 
 ###############################################################
 # Auth Tests                                                  #
@@ -224,4 +252,434 @@ def test_creating_model_sets_model_id_on_session_and_displays_model_name(client)
 def test_generated_sentence_displayed(client):
     generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
     rv = generate_sentence(client, name=TEST_MODEL_NAME)
-    assert b'sentence' in rv.data
\ No newline at end of file
+    assert b'sentence' in rv.data
+
+def test_creating_model_from_uploaded_file(client):
+    rv = client.post('/generate_model', data={
+        'corpus_file': (io.BytesIO(TEST_CORPUS.encode('utf-8')), 'corpus.txt'),
+        'name': TEST_MODEL_NAME,
+        'order': TEST_ORDER,
+    }, content_type='multipart/form-data')
+    assert rv.get_json()["model_name"] == TEST_MODEL_NAME
+    rv = generate_sentence(client, name=TEST_MODEL_NAME)
+    assert b'sentence' in rv.data
+
+def test_creating_model_without_corpus_fails(client):
+    rv = generate_model(client, corpus='', name=TEST_MODEL_NAME, order=TEST_ORDER)
+    assert b'error_message' in rv.data
+
+def test_async_model_build_reports_job_status(client):
+    rv = client.post('/generate_model', data={
+        'corpus': TEST_CORPUS,
+        'name': TEST_MODEL_NAME,
+        'order': TEST_ORDER,
+        'async': 1,
+    })
+    assert rv.status_code == 202
+    job_id = rv.get_json()["job_id"]
+
+    rv = client.get(f'/model_jobs/{job_id}')
+    job = rv.get_json()
+    assert job["status"] == "finished"
+    assert job["result"]["model_name"] == TEST_MODEL_NAME
+    assert job["progress"]["stage"] == "done"
+    rv = generate_sentence(client, name=TEST_MODEL_NAME)
+    assert b'sentence' in rv.data
+
+def test_async_model_build_from_uploaded_file(client):
+    rv = client.post('/generate_model', data={
+        'corpus_file': (io.BytesIO(TEST_CORPUS.encode('utf-8')), 'corpus.txt'),
+        'name': TEST_MODEL_NAME,
+        'order': TEST_ORDER,
+        'async': 1,
+    }, content_type='multipart/form-data')
+    job = client.get(f'/model_jobs/{rv.get_json()["job_id"]}').get_json()
+    assert job["status"] == "finished"
+    assert job["progress"]["sentences"] == len(TEST_CORPUS.split('. '))
+
+def test_job_accepted_by_another_worker_should_be_reported(client):
+    job = Job()
+    job.status = "running"
+    job.progress.update(stage="counting", sentences=1000)
+    JobRecord.save(job)
+    assert job_queue.get(job.id) is not job
+    rv = client.get(f'/model_jobs/{job.id}')
+    assert rv.status_code == 200
+    assert rv.get_json()["status"] == "running"
+    assert rv.get_json()["progress"] == {"stage": "counting", "sentences": 1000}
+
+def test_abandoned_jobs_should_be_failed(client):
+    abandoned, recent = Job(), Job()
+    abandoned.status = "running"
+    abandoned.created -= job_queue.stale_after + 1
+    for job in (abandoned, recent):
+        JobRecord.save(job)
+    assert job_queue.recover()[0] == 1
+    job = client.get(f'/model_jobs/{abandoned.id}').get_json()
+    assert job["status"] == "failed"
+    assert job["error_message"] == "worker exited"
+    job = client.get(f'/model_jobs/{recent.id}').get_json()
+    assert job["status"] == "queued"
+
+def test_unknown_job_status(client):
+    rv = client.get('/model_jobs/nope')
+    assert rv.status_code == 404
+
+def test_appending_corpus_grows_model(client):
+    rv = generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    old_size = int(rv.get_json()["model_size"])
+    generate_sentence(client, name=TEST_MODEL_NAME)
+
+    rv = append_corpus(client, corpus="Brand new words appear here", name=TEST_MODEL_NAME)
+    assert int(rv.get_json()["model_size"]) > old_size
+    model = MarkovModel.query.filter_by(model_name=TEST_MODEL_NAME).first()
+    assert ("Brand",) in model.load()
+
+def test_appending_corpus_to_missing_model_fails(client):
+    rv = append_corpus(client, corpus=TEST_CORPUS, name="no such model")
+    assert b'error_message' in rv.data
+
+def test_generated_sentences_displayed(client, app):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    rv = generate_sentences(client, name=TEST_MODEL_NAME, count=3)
+    assert len(rv.get_json()["sentences"]) == 3
+
+    # count is capped server side
+    cap = app.config["MAX_SENTENCES_PER_REQUEST"]
+    rv = generate_sentences(client, name=TEST_MODEL_NAME, count=cap + 1)
+    assert rv.get_json()["count"] == cap
+
+def test_mapped_engine_should_export_a_file_per_version(client, app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "SENTENCE_ENGINE", "mapped")
+    monkeypatch.setitem(app.config, "MODEL_FILES_DIR", str(tmp_path))
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    model = MarkovModel.query.filter_by(model_name=TEST_MODEL_NAME).first()
+    # exported on write, before any request needs it
+    assert exported_files(tmp_path) == [
+        "{}-{}.fkmc".format(model.id, model.model_version)]
+    rv = generate_sentences(client, name=TEST_MODEL_NAME, count=3)
+    assert len(rv.get_json()["sentences"]) == 3
+
+    append_corpus(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME)
+    assert exported_files(tmp_path) == [
+        "{}-{}.fkmc".format(model.id, model.model_version)]
+    generate_sentences(client, name=TEST_MODEL_NAME, count=3)
+
+def test_mapped_engine_should_serve_single_sentences_without_compiling(
+        client, app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "SENTENCE_ENGINE", "mapped")
+    monkeypatch.setitem(app.config, "MODEL_FILES_DIR", str(tmp_path))
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    model_cache.clear()
+    rv = generate_sentence(client, name=TEST_MODEL_NAME)
+    assert rv.get_json()["sentence"]
+    assert [key[2] for key in model_cache._entries] == ["mapped"]
+
+def test_racing_exports_should_write_a_version_once(client, tmp_path, monkeypatch):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    model = MarkovModel.query.filter_by(model_name=TEST_MODEL_NAME).first()
+    model.deserialize()
+    writes = []
+    write = mapped.write
+    monkeypatch.setattr(mapped, "write", lambda chain, path: (
+        writes.append(path), time.sleep(0.05), write(chain, path)))
+    monkeypatch.setattr(model, "compile", lambda engine: ArrayChain(
+        model.model, model.model_order, model.START, model.END))
+    threads = [threading.Thread(target=model.export, args=(str(tmp_path),))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(writes) == 1
+
+def test_repeated_sentences_should_hit_model_cache(client):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    generate_sentence(client, name=TEST_MODEL_NAME)
+    hits = model_cache.stats()["hits"]
+    rv = generate_sentence(client, name=TEST_MODEL_NAME)
+    assert b'sentence' in rv.data
+    assert model_cache.stats()["hits"] == hits + 1
+
+def test_model_cache_should_charge_compiled_size(client):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    model = MarkovModel.query.filter_by(model_name=TEST_MODEL_NAME).first()
+    model_cache.clear()
+    for engine in ("compiled", "arrays"):
+        chain = model.load(engine)
+        assert chain.nbytes > 0
+    assert model_cache.stats()["bytes"] == sum(
+        value.nbytes for _, value, _ in model_cache._entries.values())
+
+def test_cache_stats_displayed(client):
+    rv = client.get('/cache_stats')
+    assert b'hits' in rv.data
+    assert b'evictions' in rv.data
+
+def test_models_listing_should_paginate_metadata(client, app):
+    for i in range(5):
+        generate_model(client, corpus=TEST_CORPUS, name="model {}".format(i), order=TEST_ORDER)
+
+    rv = client.get('/models', query_string={'page': 2, 'per_page': 2})
+    listing = rv.get_json()
+    assert [m["model_name"] for m in listing["models"]] == ["model 2", "model 3"]
+    assert (listing["page"], listing["pages"], listing["total"]) == (2, 3, 5)
+    assert set(listing["models"][0]) == {
+        "model_name", "model_size", "model_order", "model_version", "owner"}
+
+    # pages past the end are empty, per_page is capped
+    assert client.get('/models', query_string={'page': 9}).get_json()["models"] == []
+    rv = client.get('/models', query_string={'per_page': 10 ** 6})
+    assert rv.get_json()["per_page"] == app.config["MAX_MODELS_PER_PAGE"]
+
+def test_model_queries_should_not_load_serialized_model(client):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    _db.session.expunge_all()
+    assert MarkovModel.name_taken(TEST_MODEL_NAME)
+    assert not MarkovModel.name_taken("not a model")
+    model = MarkovModel.query.filter_by(model_name=TEST_MODEL_NAME).first()
+    assert "model_serialized" not in model.__dict__
+    assert model.generate()
+
+def test_models_built_when_logged_in_should_be_owned_and_counted(client, app):
+    login(client, app.config['USERNAME'], app.config['PASSWORD'])
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    append_corpus(client, corpus=TEST_CORPUS + " More words", name=TEST_MODEL_NAME)
+    model = MarkovModel.query.filter_by(model_name=TEST_MODEL_NAME).first()
+    assert model.owner.username == app.config['USERNAME']
+
+    usage = client.get('/usage').get_json()
+    assert usage["model_count"] == 1
+    assert usage["stored_states"] == int(model.model_size)
+    assert usage["stored_bytes"] == model.model_bytes == len(model.model_serialized)
+
+    rv = client.get('/models', query_string={'owner': app.config['USERNAME']})
+    assert [m["owner"] for m in rv.get_json()["models"]] == [app.config['USERNAME']]
+    rv = client.get('/models', query_string={'owner': 'nobody'})
+    assert rv.get_json()["total"] == 0
+
+    _db.session.delete(model)
+    _db.session.commit()
+    assert client.get('/usage').get_json()["stored_bytes"] == 0
+
+def test_builds_over_quota_should_fail(client, app, monkeypatch):
+    login(client, app.config['USERNAME'], app.config['PASSWORD'])
+    monkeypatch.setitem(app.config, "USER_QUOTA_MODELS", 1)
+    monkeypatch.setitem(app.config, "USER_QUOTA_STATES", 10)
+    rv = generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    assert b'quota of 10 states' in rv.data
+    assert not MarkovModel.name_taken(TEST_MODEL_NAME)
+
+    monkeypatch.setitem(app.config, "USER_QUOTA_STATES", None)
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    rv = generate_model(client, corpus=TEST_CORPUS, name="second", order=TEST_ORDER)
+    assert b'quota of 1 models' in rv.data
+
+    monkeypatch.setitem(app.config, "USER_QUOTA_BYTES", client.get('/usage').get_json()["stored_bytes"])
+    rv = append_corpus(client, corpus="Brand new words here. And more", name=TEST_MODEL_NAME)
+    assert b'quota of' in rv.data
+
+def test_appending_to_another_users_model_fails(client, app):
+    login(client, app.config['USERNAME'], app.config['PASSWORD'])
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    with app.test_client() as anonymous:
+        rv = append_corpus(anonymous, corpus=TEST_CORPUS, name=TEST_MODEL_NAME)
+    assert b'belongs to someone else' in rv.data
+
+def test_model_store_config_should_apply_to_builds_and_loads(client, app, monkeypatch):
+    monkeypatch.setitem(app.config, "MODEL_STORE", "packed")
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    append_corpus(client, corpus="Brand new words appear here", name=TEST_MODEL_NAME)
+    model = MarkovModel.query.filter_by(model_name=TEST_MODEL_NAME).first()
+    assert isinstance(model.deserialize(), NgramStore)
+    assert ("Brand",) in model.model
+
+def test_concurrent_append_should_not_drop_counts(client, _session, monkeypatch):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    append = MarkovModel.append_corpus
+
+    def append_racing_another_request(model, source):
+        append(model, source)
+        # another request commits its own append after we read the row
+        table = MarkovModel.__table__
+        _session.execute(table.update().where(table.c.id == model.id).values(
+            model_version=table.c.model_version + 1))
+
+    monkeypatch.setattr(MarkovModel, "append_corpus", append_racing_another_request)
+    rv = append_corpus(client, corpus="Brand new words appear here", name=TEST_MODEL_NAME)
+    assert "changed while appending" in rv.get_json()["error_message"]
+
+def test_streamed_sentences_should_arrive_as_ndjson(client, app):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    query = {'model_name': TEST_MODEL_NAME, 'count': 25, 'seed': 5}
+    rv = client.get('/stream_sentences', query_string=query)
+    assert rv.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in rv.data.decode().splitlines()]
+    assert len(lines) == 25
+    assert all(line["sentence"] for line in lines)
+    again = client.get('/stream_sentences', query_string=query)
+    assert again.data == rv.data
+
+def test_streamed_sentences_should_support_sse(client, app, monkeypatch):
+    monkeypatch.setitem(app.config, "MAX_STREAMED_SENTENCES", 3)
+    monkeypatch.setitem(app.config, "SENTENCE_ENGINE", "arrays")
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    rv = client.get('/stream_sentences', query_string={
+        'model_name': TEST_MODEL_NAME, 'count': 50, 'format': 'sse'})
+    assert rv.mimetype == "text/event-stream"
+    events = rv.data.decode().split("\n\n")[:-1]
+    assert len(events) == 4
+    assert events[-1] == 'event: end\ndata: {"count": 3}'
+
+def test_streaming_missing_model_fails(client):
+    rv = client.get('/stream_sentences', query_string={'model_name': 'missing'})
+    assert b'error_message' in rv.data
+
+def test_seeded_sentences_should_be_served_from_response_cache(client):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    query = {'model_name': TEST_MODEL_NAME, 'seed': 4}
+    first = client.get('/generate_sentence', query_string=query)
+    assert first.headers["X-Cache"] == "MISS"
+    assert first.headers["Cache-Control"].startswith("public, max-age=")
+
+    misses = model_cache.stats()["misses"] + model_cache.stats()["hits"]
+    second = client.get('/generate_sentence', query_string=query)
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.data == first.data
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert model_cache.stats()["misses"] + model_cache.stats()["hits"] == misses
+
+    rv = client.get('/generate_sentence', query_string=query,
+                    headers={"If-None-Match": first.headers["ETag"]})
+    assert rv.status_code == 304
+
+def test_rewritten_model_should_get_new_etag(client):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    query = {'model_name': TEST_MODEL_NAME, 'seed': 4, 'count': 3}
+    first = client.get('/generate_sentences', query_string=query)
+    append_corpus(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME)
+    second = client.get('/generate_sentences', query_string=query)
+    assert second.headers["X-Cache"] == "MISS"
+    assert second.headers["ETag"] != first.headers["ETag"]
+
+def test_model_rewritten_by_another_worker_should_miss(client, monkeypatch):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    query = {'model_name': TEST_MODEL_NAME, 'seed': 4, 'count': 3}
+    first = client.get('/generate_sentences', query_string=query)
+    # another worker's write doesn't reach this worker's response cache
+    monkeypatch.setattr(response_cache, "invalidate_model", lambda name: None)
+    append_corpus(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME)
+    second = client.get('/generate_sentences', query_string=query)
+    assert second.headers["X-Cache"] == "MISS"
+    assert second.headers["ETag"] != first.headers["ETag"]
+
+def test_unseeded_sentences_should_not_be_cached(client):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    rv = generate_sentence(client, name=TEST_MODEL_NAME)
+    assert rv.headers["Cache-Control"] == "no-store"
+    assert "X-Cache" not in rv.headers
+
+def test_metrics_should_time_model_stages(client):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    generate_sentence(client, name=TEST_MODEL_NAME)
+    rv = client.get('/metrics')
+    assert rv.mimetype == "text/plain"
+    text = rv.data.decode()
+    for stage in ("query", "add_sentences", "serialize", "commit"):
+        assert 'route="markov.generate_model",stage="{}"'.format(stage) in text
+    for stage in ("query", "deserialize", "generate"):
+        assert 'route="markov.generate_sentence",stage="{}"'.format(stage) in text
+    assert 'flaskov_request_seconds_count{route="markov.generate_model",status="200"}' in text
+
+def test_preload_should_warm_model_cache_before_ready(client, app, monkeypatch):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    model_cache.clear()
+    monkeypatch.setitem(app.config, "PRELOAD_MODELS", [TEST_MODEL_NAME, "missing"])
+    preloader.ready.clear()
+    assert client.get('/ready').status_code == 503
+
+    report = preloader.warm_up(app)
+    assert [model["model_name"] for model in report["models"]] == [TEST_MODEL_NAME]
+    assert model_cache.stats()["entries"] == 1
+    rv = client.get('/ready')
+    assert rv.status_code == 200
+    assert rv.get_json()["ready"]
+    generate_sentence(client, name=TEST_MODEL_NAME)
+    assert model_cache.stats()["hits"] >= 1
+
+def test_preload_should_add_ranked_models(app, monkeypatch):
+    monkeypatch.setitem(app.config, "PRELOAD_MODELS", ["a", "b"])
+    monkeypatch.setitem(app.config, "PRELOAD_TOP_MODELS", 2)
+    monkeypatch.setattr(preloader, "ranking", lambda limit: ["b", "c"][:limit])
+    assert preloader.select(app.config) == ["a", "b", "c"]
+
+def test_background_preload_should_start_in_each_serving_process(monkeypatch):
+    app = Flask(__name__)
+    app.config.update(PRELOAD_MODELS=["a"], PRELOAD_BACKGROUND=True)
+    background = Preloader()
+    warmed = []
+    monkeypatch.setattr(background, "warm_up",
+                        lambda app: (warmed.append(os.getpid()), background.ready.set()))
+    app.route("/ready")(lambda: ("", 200 if background.ready.is_set() else 503))
+    background.init_app(app)
+    assert not warmed
+
+    with app.test_client() as client:
+        client.get('/ready')
+        assert background.ready.wait(5)
+        # a forked worker inherits the master's state, but not its threads
+        background.ready.clear()
+        background._started_pid = -1
+        client.get('/ready')
+        assert background.ready.wait(5)
+        client.get('/ready')
+    assert warmed == [os.getpid()] * 2
+
+def test_usage_should_be_buffered_then_listed_by_top_models(client):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    generate_model(client, corpus=TEST_CORPUS, name="cold", order=TEST_ORDER)
+    for _ in range(3):
+        generate_sentence(client, name=TEST_MODEL_NAME)
+    client.get('/generate_sentences', query_string={
+        "model_name": TEST_MODEL_NAME, "count": 4})
+    assert MarkovModel.query.filter_by(model_name=TEST_MODEL_NAME).first().usage is None
+    assert usage_tracker.pending()[TEST_MODEL_NAME][:2] == (4, 7)
+
+    rv = client.get('/models/top', query_string={"limit": 2})
+    models = rv.get_json()["models"]
+    assert [model["model_name"] for model in models] == [TEST_MODEL_NAME, "cold"]
+    assert models[0]["usage"]["requests"] == 4
+    assert models[0]["usage"]["sentences"] == 7
+    assert models[1]["usage"] is None
+    assert not usage_tracker.pending()
+
+def test_usage_should_count_cached_responses(client):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    query = {"model_name": TEST_MODEL_NAME, "seed": 5, "count": 2}
+    client.get('/generate_sentences', query_string=query)
+    assert client.get('/generate_sentences', query_string=query).headers["X-Cache"] == "HIT"
+    usage_tracker.flush()
+    model = MarkovModel.query.filter_by(model_name=TEST_MODEL_NAME).first()
+    assert (model.usage.request_count, model.usage.sentence_count) == (2, 4)
+    # later flushes add to the stored counts
+    client.get('/generate_sentences', query_string=query)
+    usage_tracker.flush()
+    counters = ModelUsage.query.get(model.id)
+    assert (counters.request_count, counters.sentence_count) == (3, 6)
+
+def test_cached_single_sentence_should_count_one_sentence(client):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    query = {"model_name": TEST_MODEL_NAME, "seed": 5, "count": 50}
+    client.get('/generate_sentence', query_string=query)
+    assert client.get('/generate_sentence', query_string=query).headers["X-Cache"] == "HIT"
+    assert usage_tracker.pending()[TEST_MODEL_NAME][:2] == (2, 2)
+
+def test_top_models_should_reject_unknown_ordering(client):
+    assert "error_message" in client.get('/models/top?by=bytes').get_json()
+
+def test_preload_should_rank_models_by_usage(client):
+    generate_model(client, corpus=TEST_CORPUS, name=TEST_MODEL_NAME, order=TEST_ORDER)
+    generate_model(client, corpus=TEST_CORPUS, name="newer", order=TEST_ORDER)
+    generate_sentence(client, name=TEST_MODEL_NAME)
+    usage_tracker.flush()
+    assert preloader.ranking(2) == [TEST_MODEL_NAME, "newer"]
@@ -0,0 +1,74 @@
+import io
+
+import pytest
+
+from ..flaskov.models import MarkovModel
+from ..flaskov.tokenizer import Tokenizer, from_config, get_tokenizer
+
+
+
+###############################################################
+# Pytest Fixtures                                             #
+###############################################################
+
+CORPUS = (
+    "Mr. Smith met J. R. R. Tolkien! Did he like spiders? "
+    "No, he hates them... \"Spiders are creepy.\" (Very creepy.)\n\n"
+    "It's a new paragraph e.g. this one\n"
+    "and it continues. The End"
+)
+
+@pytest.fixture(scope='function', params=[1, 3, 7, 1024])
+def chunk_size(request):
+    return request.param
+
+###############################################################
+# Tests                                                       #
+###############################################################
+
+def test_sentences_should_split_on_end_punctuation_and_blank_lines():
+    assert list(get_tokenizer().sentences(CORPUS)) == [
+        ["Mr.", "Smith", "met", "J.", "R.", "R.", "Tolkien"],
+        ["Did", "he", "like", "spiders"],
+        ["No,", "he", "hates", "them"],
+        ["\"Spiders", "are", "creepy"],
+        ["(Very", "creepy"],
+        ["It's", "a", "new", "paragraph", "e.g.", "this", "one", "and", "it",
+         "continues"],
+        ["The", "End"],
+    ]
+
+def test_streamed_chunks_should_match_whole_text(chunk_size):
+    for tokenizer in (get_tokenizer(), get_tokenizer("lines"),
+                      get_tokenizer(lowercase=True, punctuation=True)):
+        streamed = tokenizer.sentences(io.StringIO(CORPUS), chunk_size)
+        assert list(streamed) == list(tokenizer.sentences(CORPUS))
+
+def test_legacy_segmentation_should_match_split():
+    for corpus in (CORPUS, "I am. . scared. ", ""):
+        assert list(get_tokenizer("legacy").sentences(corpus)) == \
+            [sentence.split() for sentence in corpus.split('. ')]
+
+def test_lines_segmentation_should_split_every_line():
+    text = "One line.\nTwo lines!\n\n  Three  "
+    assert list(get_tokenizer("lines").sentences(text)) == [
+        ["One", "line"], ["Two", "lines"], ["Three"]]
+
+def test_punctuation_tokens_should_be_words_of_their_own():
+    tokenizer = Tokenizer(lowercase=True, punctuation=True)
+    assert list(tokenizer.sentences("It's fine, really! Spiders are OK")) == [
+        ["it's", "fine", ",", "really", "!"], ["spiders", "are", "ok"]]
+
+def test_unknown_segmentation_should_raise():
+    with pytest.raises(ValueError):
+        Tokenizer("words")
+
+def test_config_should_pick_shared_tokenizer():
+    tokenizer = from_config({"CORPUS_SEGMENTATION": "lines", "CORPUS_LOWERCASE": 1})
+    assert tokenizer is get_tokenizer("lines", True, False)
+
+def test_model_should_count_sentences_of_its_tokenizer():
+    model = MarkovModel(corpus="Hi there! Bye now. Hi again?",
+                        tokenizer=get_tokenizer(lowercase=True))
+    assert model.model[("START",)] == {"hi": 2, "bye": 1}
+    assert model.model[("now",)] == {"END": 1}
@@ -0,0 +1,44 @@
+import pytest
+
+from ..flaskov.models import MarkovModel
+from ..flaskov.ngrams import NgramStore
+from ..flaskov.training import iter_shards, merge_counts, train
+
+
+
+###############################################################
+# Pytest Fixtures                                             #
+###############################################################
+
+CORPUS = '. '.join(
+    "sentence number {} says {} things about {}".format(i, i % 7, i % 3)
+    for i in range(500)
+)
+
+@pytest.fixture(scope='function', params=[1, 2, 3])
+def order(request):
+    return request.param
+
+###############################################################
+# Tests                                                       #
+###############################################################
+
+def test_shards_should_cover_every_sentence():
+    shards = list(iter_shards(CORPUS, shard_size=64))
+    assert [len(shard) for shard in shards] == [64] * 7 + [52]
+
+def test_merge_counts_should_add_counts():
+    into = {("a",): {"b": 1}}
+    merge_counts(into, {("a",): {"b": 2, "c": 1}, ("c",): {"END": 1}})
+    assert into == {("a",): {"b": 3, "c": 1}, ("c",): {"END": 1}}
+
+def test_parallel_train_should_equal_sequential_build(order):
+    counts, stats = train(CORPUS, order=order, workers=2, shard_size=37)
+    assert counts == MarkovModel(corpus=CORPUS, order=order).model
+    assert stats["sentences"] == 500
+    assert stats["words"] == sum(len(s.split()) for s in CORPUS.split('. '))
+
+def test_train_should_merge_into_packed_store():
+    counts, _ = train(CORPUS, order=2, workers=2, shard_size=50, store="packed")
+    assert isinstance(counts, NgramStore)
+    assert counts == MarkovModel(corpus=CORPUS, order=2).model
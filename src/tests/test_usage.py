@@ -0,0 +1,48 @@
+import pytest
+from flask import Flask
+
+from ..flaskov.usage import UsageTracker
+
+
+
+###############################################################
+# Pytest Fixtures                                             #
+###############################################################
+
+@pytest.fixture(scope='function')
+def tracker():
+    app = Flask(__name__)
+    app.config['USAGE_FLUSH_INTERVAL'] = 0
+    app.config['USAGE_MAX_PENDING'] = 3
+    return UsageTracker(app)
+
+###############################################################
+# Tests                                                       #
+###############################################################
+
+def test_record_should_buffer_counts_in_memory(tracker, monkeypatch):
+    monkeypatch.setattr(tracker, "flush", lambda: pytest.fail("flushed"))
+    tracker.record("spiders")
+    tracker.record("spiders", sentences=5)
+    tracker.record("snakes")
+    pending = tracker.pending()
+    assert pending["spiders"][:2] == (2, 6)
+    assert pending["snakes"][:2] == (1, 1)
+    assert pending["spiders"][2] >= pending["snakes"][2] - 1
+
+def test_record_should_flush_once_enough_models_are_buffered(tracker, monkeypatch):
+    flushes = []
+    monkeypatch.setattr(tracker, "flush", lambda: flushes.append(tracker.pending()))
+    for name in ("a", "b", "a"):
+        tracker.record(name)
+    assert not flushes
+    tracker.record("c")
+    assert set(flushes[0]) == {"a", "b", "c"}
+
+def test_failed_flush_should_keep_counts(tracker):
+    tracker.record("spiders", sentences=2)
+    restored = tracker.pending()
+    tracker.clear()
+    tracker.record("spiders")
+    tracker._restore(restored)
+    assert tracker.pending()["spiders"][:2] == (2, 3)
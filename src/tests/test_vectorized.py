@@ -0,0 +1,64 @@
+import pytest
+
+from ..flaskov.models import MarkovModel
+from ..flaskov.vectorized import ArrayChain
+
+
+
+###############################################################
+# Pytest Fixtures                                             #
+###############################################################
+
+CORPUS = (
+    "I am very scared. I hate spiders. Spiders are very creepy. "
+    "I am not a spider. Spiders hate me"
+)
+
+@pytest.fixture(scope='function', params=[1, 2, 3])
+def markovmodel(request):
+    return MarkovModel(corpus=CORPUS, order=request.param)
+
+###############################################################
+# Pytest Helpers                                              #
+###############################################################
+
+def ngrams(words, n):
+    return {tuple(words[i:i+n]) for i in range(len(words) - n + 1)}
+
+
+###############################################################
+# Tests                                                       #
+###############################################################
+
+def test_array_chain_should_have_a_row_per_state(markovmodel):
+    chain = ArrayChain(markovmodel.model, markovmodel.model_order)
+    assert len(chain) == len(markovmodel.model)
+    assert chain.indptr[-1] == len(chain.successors)
+    assert chain.cumulative[-1] == sum(
+        sum(follows.values()) for follows in markovmodel.model.values())
+
+def test_batch_sentences_should_only_follow_corpus_transitions(markovmodel):
+    order = markovmodel.model_order
+    allowed = set()
+    for sentence in CORPUS.split('. '):
+        allowed |= ngrams(sentence.split(), order + 1)
+
+    chain = ArrayChain(markovmodel.model, order)
+    for sentence in chain.generate_batch(50, seed=0):
+        words = sentence.split()
+        assert words
+        assert ngrams(words, order + 1) <= allowed
+
+def test_batch_with_seed_should_be_reproducible(markovmodel):
+    chain = ArrayChain(markovmodel.model, markovmodel.model_order)
+    assert chain.generate_batch(20, seed=7) == chain.generate_batch(20, seed=7)
+
+def test_generate_many_should_support_arrays_engine(markovmodel):
+    sentences = markovmodel.generate_many(10, seed=1, engine="arrays")
+    assert len(sentences) == 10
+    assert sentences == markovmodel.generate_many(10, seed=1, engine="arrays")
+
+def test_empty_model_should_compile_to_empty_array_chain():
+    chain = ArrayChain({}, 1)
+    assert len(chain) == 0
+    assert chain.generate_batch(3) == ['', '', '']
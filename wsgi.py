@@ -0,0 +1,3 @@
+from src.flaskov import create_app
+
+app = create_app()